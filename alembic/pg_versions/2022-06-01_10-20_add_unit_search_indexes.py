@@ -0,0 +1,35 @@
+"""add unit search indexes
+
+Revision ID: 8e5c2d711ffe
+Revises: e2d37aa518a4
+Create Date: 2022-06-01 10:20:41.318907
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e5c2d711ffe'
+down_revision = 'e2d37aa518a4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.create_index(op.f('ix_unit_price'), 'unit', ['price'], unique=False, postgresql_concurrently=True)
+        op.create_index(op.f('ix_unit_square'), 'unit', ['square'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_unit_bedrooms_bathrooms', 'unit', ['bedrooms', 'bathrooms'], unique=False, postgresql_concurrently=True)
+        op.create_index(op.f('ix_unit_building_id'), 'unit', ['building_id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_unit_amenities_unit_id_amenity_id', 'unit_amenities', ['unit_id', 'amenity_id'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_unit_amenities_unit_id_amenity_id', table_name='unit_amenities', postgresql_concurrently=True)
+        op.drop_index(op.f('ix_unit_building_id'), table_name='unit', postgresql_concurrently=True)
+        op.drop_index('ix_unit_bedrooms_bathrooms', table_name='unit', postgresql_concurrently=True)
+        op.drop_index(op.f('ix_unit_square'), table_name='unit', postgresql_concurrently=True)
+        op.drop_index(op.f('ix_unit_price'), table_name='unit', postgresql_concurrently=True)
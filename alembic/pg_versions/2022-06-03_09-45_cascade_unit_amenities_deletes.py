@@ -0,0 +1,30 @@
+"""cascade unit amenities deletes
+
+Revision ID: 3b7f0c9d2a61
+Revises: 8e5c2d711ffe
+Create Date: 2022-06-03 09:45:12.604318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b7f0c9d2a61'
+down_revision = '8e5c2d711ffe'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_constraint('unit_amenities_unit_id_fkey', 'unit_amenities', type_='foreignkey')
+    op.drop_constraint('unit_amenities_amenity_id_fkey', 'unit_amenities', type_='foreignkey')
+    op.create_foreign_key('unit_amenities_unit_id_fkey', 'unit_amenities', 'unit', ['unit_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('unit_amenities_amenity_id_fkey', 'unit_amenities', 'amenity', ['amenity_id'], ['id'], ondelete='CASCADE')
+
+
+def downgrade():
+    op.drop_constraint('unit_amenities_amenity_id_fkey', 'unit_amenities', type_='foreignkey')
+    op.drop_constraint('unit_amenities_unit_id_fkey', 'unit_amenities', type_='foreignkey')
+    op.create_foreign_key('unit_amenities_amenity_id_fkey', 'unit_amenities', 'amenity', ['amenity_id'], ['id'])
+    op.create_foreign_key('unit_amenities_unit_id_fkey', 'unit_amenities', 'unit', ['unit_id'], ['id'])
@@ -0,0 +1,85 @@
+"""add updated_at columns
+
+Revision ID: 5d4a9e0c7b13
+Revises: 3b7f0c9d2a61
+Create Date: 2022-06-08 11:30:27.912044
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d4a9e0c7b13'
+down_revision = '3b7f0c9d2a61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # now() is not volatile, the columns are added without a table rewrite
+    op.add_column('building', sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False))
+    op.add_column('unit', sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False))
+
+    op.execute("""
+        CREATE FUNCTION set_updated_at() RETURNS trigger AS $$
+        BEGIN
+            NEW.updated_at := now();
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER building_set_updated_at BEFORE UPDATE ON building
+        FOR EACH ROW EXECUTE PROCEDURE set_updated_at()
+    """)
+    op.execute("""
+        CREATE TRIGGER unit_set_updated_at BEFORE UPDATE ON unit
+        FOR EACH ROW EXECUTE PROCEDURE set_updated_at()
+    """)
+
+    # A change of the amenities of a unit is a change of the unit. Units
+    # already written by the transaction, e.g. just created, are left alone.
+    op.execute("""
+        CREATE FUNCTION touch_amenity_units() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                UPDATE unit SET updated_at = now()
+                WHERE id IN (SELECT unit_id FROM new_links) AND updated_at < now();
+            ELSE
+                UPDATE unit SET updated_at = now()
+                WHERE id IN (SELECT unit_id FROM old_links) AND updated_at < now();
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER unit_amenities_inserted AFTER INSERT ON unit_amenities
+        REFERENCING NEW TABLE AS new_links
+        FOR EACH STATEMENT EXECUTE PROCEDURE touch_amenity_units()
+    """)
+    op.execute("""
+        CREATE TRIGGER unit_amenities_deleted AFTER DELETE ON unit_amenities
+        REFERENCING OLD TABLE AS old_links
+        FOR EACH STATEMENT EXECUTE PROCEDURE touch_amenity_units()
+    """)
+
+    with op.get_context().autocommit_block():
+        op.create_index(op.f('ix_building_updated_at'), 'building', ['updated_at'], unique=False, postgresql_concurrently=True)
+        op.create_index(op.f('ix_unit_updated_at'), 'unit', ['updated_at'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(op.f('ix_unit_updated_at'), table_name='unit', postgresql_concurrently=True)
+        op.drop_index(op.f('ix_building_updated_at'), table_name='building', postgresql_concurrently=True)
+
+    op.execute("DROP TRIGGER unit_amenities_deleted ON unit_amenities")
+    op.execute("DROP TRIGGER unit_amenities_inserted ON unit_amenities")
+    op.execute("DROP FUNCTION touch_amenity_units()")
+    op.execute("DROP TRIGGER unit_set_updated_at ON unit")
+    op.execute("DROP TRIGGER building_set_updated_at ON building")
+    op.execute("DROP FUNCTION set_updated_at()")
+    op.drop_column('unit', 'updated_at')
+    op.drop_column('building', 'updated_at')
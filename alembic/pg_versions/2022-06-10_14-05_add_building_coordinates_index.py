@@ -0,0 +1,26 @@
+"""add building coordinates index
+
+Revision ID: a61f2c8e4b97
+Revises: 5d4a9e0c7b13
+Create Date: 2022-06-10 14:05:51.227390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a61f2c8e4b97'
+down_revision = '5d4a9e0c7b13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_building_latitude_longitude', 'building', ['latitude', 'longitude'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_building_latitude_longitude', table_name='building', postgresql_concurrently=True)
@@ -0,0 +1,36 @@
+"""add search vector columns
+
+Revision ID: c48e1d7f9a25
+Revises: a61f2c8e4b97
+Create Date: 2022-06-13 16:20:08.614302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c48e1d7f9a25'
+down_revision = 'a61f2c8e4b97'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Stored generated columns rewrite the tables while holding an exclusive lock
+    op.add_column('building', sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed("setweight(to_tsvector('english', coalesce(name, '')), 'A') || setweight(to_tsvector('english', coalesce(description, '')), 'B')", persisted=True), nullable=False))
+    op.add_column('unit', sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed("to_tsvector('english', coalesce(description, ''))", persisted=True), nullable=False))
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_building_search_vector', 'building', ['search_vector'], unique=False, postgresql_using='gin', postgresql_concurrently=True)
+        op.create_index('ix_unit_search_vector', 'unit', ['search_vector'], unique=False, postgresql_using='gin', postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_unit_search_vector', table_name='unit', postgresql_concurrently=True)
+        op.drop_index('ix_building_search_vector', table_name='building', postgresql_concurrently=True)
+
+    op.drop_column('unit', 'search_vector')
+    op.drop_column('building', 'search_vector')
@@ -0,0 +1,51 @@
+"""add trigram indexes
+
+Revision ID: e7b35a0c2d18
+Revises: c48e1d7f9a25
+Create Date: 2022-06-15 10:40:33.170254
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b35a0c2d18'
+down_revision = 'c48e1d7f9a25'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_building_name_trgm', 'building', 'name'),
+    ('ix_building_postcode_trgm', 'building', 'postcode'),
+    ('ix_amenity_name_trgm', 'amenity', 'name'),
+]
+
+
+def upgrade():
+    # Exact lookups by name, e.g. the duplicate check on creation
+    with op.get_context().autocommit_block():
+        op.create_index('ix_building_name', 'building', ['name'], unique=False, postgresql_concurrently=True)
+
+    # pg_trgm ships with the contrib modules, without it autocomplete only
+    # serves prefix matches
+    available = op.get_bind().execute(
+        sa.text("SELECT EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm')")
+    ).scalar()
+    if not available:
+        return
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    with op.get_context().autocommit_block():
+        for name, table, column in INDEXES:
+            op.create_index(name, table, [column], unique=False, postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'}, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, column in INDEXES:
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+        op.drop_index('ix_building_name', table_name='building', postgresql_concurrently=True)
+
+    # pg_trgm is left in place, it may have been installed before the upgrade
+    # and be used by others
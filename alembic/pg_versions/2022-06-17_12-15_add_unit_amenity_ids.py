@@ -0,0 +1,78 @@
+"""add unit amenity_ids
+
+Revision ID: f3a91c6d5b27
+Revises: e7b35a0c2d18
+Create Date: 2022-06-17 12:15:08.431962
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a91c6d5b27'
+down_revision = 'e7b35a0c2d18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('unit', sa.Column('amenity_ids', postgresql.ARRAY(sa.Integer()), server_default=sa.text("'{}'"), nullable=False))
+
+    # unit_amenities stays the source of truth, the array of each unit whose
+    # links change is read back from it. The units are locked first, so the
+    # array is read after any concurrent change of their links has committed.
+    # Setting the array also touches updated_at.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION touch_amenity_units() RETURNS trigger AS $$
+        DECLARE
+            unit_ids integer[];
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                SELECT array_agg(DISTINCT unit_id) INTO unit_ids FROM new_links;
+            ELSE
+                SELECT array_agg(DISTINCT unit_id) INTO unit_ids FROM old_links;
+            END IF;
+            PERFORM 1 FROM unit WHERE id = ANY(unit_ids) ORDER BY id FOR UPDATE;
+            UPDATE unit SET amenity_ids = ARRAY(
+                SELECT amenity_id FROM unit_amenities
+                WHERE unit_id = unit.id ORDER BY amenity_id
+            )
+            WHERE id = ANY(unit_ids);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        UPDATE unit SET amenity_ids = links.amenity_ids
+        FROM (
+            SELECT unit_id, array_agg(amenity_id ORDER BY amenity_id) AS amenity_ids
+            FROM unit_amenities GROUP BY unit_id
+        ) AS links
+        WHERE unit.id = links.unit_id
+    """)
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_unit_amenity_ids', 'unit', ['amenity_ids'], unique=False, postgresql_using='gin', postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_unit_amenity_ids', table_name='unit', postgresql_concurrently=True)
+
+    op.execute("""
+        CREATE OR REPLACE FUNCTION touch_amenity_units() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                UPDATE unit SET updated_at = now()
+                WHERE id IN (SELECT unit_id FROM new_links) AND updated_at < now();
+            ELSE
+                UPDATE unit SET updated_at = now()
+                WHERE id IN (SELECT unit_id FROM old_links) AND updated_at < now();
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.drop_column('unit', 'amenity_ids')
@@ -0,0 +1,37 @@
+"""add unit sort indexes
+
+Revision ID: 9b0d4e6f1c83
+Revises: f3a91c6d5b27
+Create Date: 2022-06-20 09:30:52.604718
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b0d4e6f1c83'
+down_revision = 'f3a91c6d5b27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Led by the sort key and ended by id, a sorted page is read in index
+    # order and the scan stops after the limit. They replace the single
+    # column indexes on price and square for the range filters too.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_unit_price_id', 'unit', ['price', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_unit_square_id', 'unit', ['square', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_unit_price_per_square_id', 'unit', [sa.text('(price / NULLIF(square, 0))'), 'id'], unique=False, postgresql_concurrently=True)
+        op.drop_index('ix_unit_square', table_name='unit', postgresql_concurrently=True)
+        op.drop_index('ix_unit_price', table_name='unit', postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_unit_price', 'unit', ['price'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_unit_square', 'unit', ['square'], unique=False, postgresql_concurrently=True)
+        op.drop_index('ix_unit_price_per_square_id', table_name='unit', postgresql_concurrently=True)
+        op.drop_index('ix_unit_square_id', table_name='unit', postgresql_concurrently=True)
+        op.drop_index('ix_unit_price_id', table_name='unit', postgresql_concurrently=True)
@@ -1,6 +1,8 @@
-from typing import Any, Generator, Optional
+import asyncio
+from typing import Any, AsyncGenerator
 
 from databases import Database
+from databases.core import Connection
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
@@ -9,24 +11,31 @@ from pydantic import ValidationError
 from app import crud, schemas
 from app.core import security
 from app.core.config import settings
+from app.db.session import postgres_database
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/login/access-token"
 )
 
 
-async def get_db_pg() -> Generator:
+async def get_db_pg() -> AsyncGenerator[Connection, None]:
     """
-    Connect to database. After response disconnect from database.
+    Acquire a connection from the application pool. After response release it.
     """
-    db: Optional[Database] = None
+    connection = postgres_database.connection()
     try:
-        db = Database(settings.POSTGRES_URL)
-        await db.connect()
-        yield db
+        await asyncio.wait_for(
+            connection.__aenter__(), timeout=settings.POSTGRES_POOL_ACQUIRE_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="No database connection available",
+        )
+    try:
+        yield connection
     finally:
-        if db is not None:
-            await db.disconnect()
+        await connection.__aexit__()
 
 
 async def get_request_user(
@@ -42,7 +51,7 @@ async def get_request_user(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    user = await crud.user.get(db, model_id=token_data.sub)
+    user = await crud.user.get_cached(db, model_id=token_data.sub)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
@@ -1,10 +1,20 @@
-from typing import Any, List
+from typing import Any, List, Optional
 
 from databases import Database
-from fastapi import APIRouter, Body, Depends, HTTPException, Path, Query, status
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    HTTPException,
+    Path,
+    Query,
+    Response,
+    status,
+)
 
 from app import crud, schemas
 from app.api.deps import get_db_pg, get_request_active_superuser
+from app.utils.pagination import set_next_cursor, set_total
 
 router = APIRouter()
 
@@ -19,12 +29,19 @@ async def read_agents(
     *,
     skip: int = Query(0),
     limit: int = Query(100),
+    cursor: Optional[str] = Query(None),
+    with_total: bool = Query(False),
+    response: Response,
     db: Database = Depends(get_db_pg),
 ) -> Any:
     """
     Retrieve agents.
     """
-    return await crud.agent.get_multi(db, skip=skip, limit=limit)
+    agents = await crud.agent.get_multi(db, skip=skip, limit=limit, cursor=cursor)
+    set_next_cursor(response, crud.agent.next_cursor(agents, limit=limit))
+    if with_total:
+        set_total(response, await crud.agent.get_total(db))
+    return agents
 
 
 @router.post(
@@ -88,13 +105,13 @@ async def update_agent(
     """
     Update an agent.
     """
-    agent = await crud.agent.get(db, model_id=agent_id)
+    agent = await crud.agent.update_by_id(db, model_id=agent_id, obj_in=agent_in)
     if not agent:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="The agent with this id does not exist",
         )
-    return await crud.agent.update(db, db_obj=agent, obj_in=agent_in)
+    return agent
 
 
 @router.delete(
@@ -110,10 +127,9 @@ async def delete_agent(
     """
     Delete an agent.
     """
-    agent = await crud.agent.get(db, model_id=agent_id)
+    agent = await crud.agent.remove(db, model_id=agent_id)
     if not agent:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="The agent with this id does not exist",
         )
-    return await crud.agent.remove(db, model_id=agent_id)
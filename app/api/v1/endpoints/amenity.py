@@ -1,10 +1,21 @@
-from typing import Any, List
+from typing import Any, List, Optional
 
 from databases import Database
-from fastapi import APIRouter, Body, Depends, HTTPException, Path, Query, status
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    HTTPException,
+    Path,
+    Query,
+    Response,
+    status,
+)
 
 from app import crud, schemas
 from app.api.deps import get_db_pg, get_request_active_superuser
+from app.core.config import settings
+from app.utils.pagination import set_next_cursor, set_total
 
 router = APIRouter()
 
@@ -19,12 +30,19 @@ async def read_amenities(
     *,
     skip: int = Query(0),
     limit: int = Query(100),
+    cursor: Optional[str] = Query(None),
+    with_total: bool = Query(False),
+    response: Response,
     db: Database = Depends(get_db_pg),
 ) -> Any:
     """
     Retrieve amenities.
     """
-    return await crud.amenity.get_multi(db, skip=skip, limit=limit)
+    amenities = await crud.amenity.get_multi(db, skip=skip, limit=limit, cursor=cursor)
+    set_next_cursor(response, crud.amenity.next_cursor(amenities, limit=limit))
+    if with_total:
+        set_total(response, await crud.amenity.get_total(db))
+    return amenities
 
 
 @router.post(
@@ -50,6 +68,59 @@ async def create_amenity(
     return await crud.amenity.create(db, obj_in=amenity)
 
 
+@router.post(
+    "/batch",
+    status_code=status.HTTP_200_OK,
+    response_model=List[schemas.BatchItemResult],
+    dependencies=[Depends(get_request_active_superuser)],
+)
+async def create_amenities_batch(
+    *,
+    amenities: List[schemas.AmenityIn] = Body(..., max_items=settings.BATCH_MAX_SIZE),
+    db: Database = Depends(get_db_pg),
+) -> Any:
+    """
+    Create several amenities, reporting the outcome of each one.
+    """
+    return await crud.amenity.create_many(db, objs_in=amenities)
+
+
+@router.patch(
+    "/batch",
+    status_code=status.HTTP_200_OK,
+    response_model=List[schemas.BatchItemResult],
+    dependencies=[Depends(get_request_active_superuser)],
+)
+async def update_amenities_batch(
+    *,
+    amenities: List[schemas.AmenityBatchUpdate] = Body(
+        ..., max_items=settings.BATCH_MAX_SIZE
+    ),
+    db: Database = Depends(get_db_pg),
+) -> Any:
+    """
+    Update several amenities by id, reporting the outcome of each one.
+    """
+    return await crud.amenity.update_many(db, objs_in=amenities)
+
+
+@router.delete(
+    "/batch",
+    status_code=status.HTTP_200_OK,
+    response_model=List[schemas.BatchItemResult],
+    dependencies=[Depends(get_request_active_superuser)],
+)
+async def delete_amenities_batch(
+    *,
+    ids: List[int] = Body(..., max_items=settings.BATCH_MAX_SIZE),
+    db: Database = Depends(get_db_pg),
+) -> Any:
+    """
+    Delete several amenities by id, reporting the outcome of each one.
+    """
+    return await crud.amenity.remove_many(db, model_ids=ids)
+
+
 @router.get(
     "/{amenity_id}",
     status_code=status.HTTP_200_OK,
@@ -88,13 +159,15 @@ async def update_amenity(
     """
     Update an amenity.
     """
-    amenity = await crud.amenity.get(db, model_id=amenity_id)
+    amenity = await crud.amenity.update_by_id(
+        db, model_id=amenity_id, obj_in=amenity_in
+    )
     if not amenity:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="The amenity with this id does not exist",
         )
-    return await crud.amenity.update(db, db_obj=amenity, obj_in=amenity_in)
+    return amenity
 
 
 @router.delete(
@@ -110,10 +183,9 @@ async def delete_amenity(
     """
     Delete an amenity.
     """
-    amenity = await crud.amenity.get(db, model_id=amenity_id)
+    amenity = await crud.amenity.remove(db, model_id=amenity_id)
     if not amenity:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="The amenity with this id does not exist",
         )
-    return await crud.amenity.remove(db, model_id=amenity_id)
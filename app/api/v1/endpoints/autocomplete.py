@@ -0,0 +1,36 @@
+from typing import Any, List
+
+from databases import Database
+from fastapi import APIRouter, BackgroundTasks, Depends, Query, status
+
+from app import schemas
+from app.api.deps import get_db_pg, get_request_active_superuser
+from app.services.autocomplete import autocomplete
+
+router = APIRouter()
+
+
+@router.get(
+    "/",
+    status_code=status.HTTP_200_OK,
+    response_model=List[schemas.Suggestion],
+    dependencies=[Depends(get_request_active_superuser)],
+)
+async def read_suggestions(
+    *,
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+    background_tasks: BackgroundTasks,
+    db: Database = Depends(get_db_pg),
+) -> Any:
+    """
+    Suggest building names, postcodes and amenities for a search box as the
+    user types.
+    """
+    # Requests wait until the index is first built, later ones refresh it
+    # after the response is sent
+    if not autocomplete.is_loaded:
+        await autocomplete.refresh(db)
+    else:
+        background_tasks.add_task(autocomplete.refresh, db)
+    return await autocomplete.suggest(db, q=q, limit=limit)
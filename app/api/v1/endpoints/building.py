@@ -1,10 +1,26 @@
-from typing import Any, List
+from typing import Any, List, Optional
 
 from databases import Database
-from fastapi import APIRouter, Body, Depends, HTTPException, Path, Query, status
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    HTTPException,
+    Path,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from fastapi.responses import StreamingResponse
 
 from app import crud, schemas
 from app.api.deps import get_db_pg, get_request_active_superuser
+from app.core.config import settings
+from app.crud.geo import MAX_ZOOM, box_tiles
+from app.services.exporter import MEDIA_TYPES, export_feed
+from app.services.importer import import_feed
+from app.utils.pagination import set_next_cursor, set_total
 
 router = APIRouter()
 
@@ -19,12 +35,51 @@ async def read_buildings(
     *,
     skip: int = Query(0),
     limit: int = Query(100),
+    cursor: Optional[str] = Query(None),
+    with_total: bool = Query(False),
+    response: Response,
     db: Database = Depends(get_db_pg),
 ) -> Any:
     """
     Retrieve buildings.
     """
-    return await crud.building.get_multi(db, skip=skip, limit=limit)
+    buildings = await crud.building.get_multi(db, skip=skip, limit=limit, cursor=cursor)
+    set_next_cursor(response, crud.building.next_cursor(buildings, limit=limit))
+    if with_total:
+        set_total(response, await crud.building.get_total(db))
+    return buildings
+
+
+@router.post(
+    "/search",
+    status_code=status.HTTP_200_OK,
+    response_model=List[schemas.BuildingOut],
+    dependencies=[Depends(get_request_active_superuser)],
+)
+async def search_buildings(
+    *,
+    form: schemas.BuildingForm = Body(...),
+    skip: int = Query(0),
+    limit: int = Query(100),
+    cursor: Optional[str] = Query(None),
+    response: Response,
+    db: Database = Depends(get_db_pg),
+) -> Any:
+    """
+    Retrieve buildings within a radius of a point, nearest first, or inside
+    a bounding box. With a text query only matching buildings are returned,
+    best matches first unless sorted by distance.
+    """
+    buildings = await crud.building.search(
+        db, form=form, skip=skip, limit=limit, cursor=cursor
+    )
+    set_next_cursor(
+        response,
+        crud.building.next_cursor(
+            buildings, limit=limit, keys=crud.building.search_keys(form=form)
+        ),
+    )
+    return buildings
 
 
 @router.post(
@@ -50,6 +105,147 @@ async def create_building(
     return await crud.building.create(db, obj_in=building)
 
 
+@router.post(
+    "/batch",
+    status_code=status.HTTP_200_OK,
+    response_model=List[schemas.BatchItemResult],
+    dependencies=[Depends(get_request_active_superuser)],
+)
+async def create_buildings_batch(
+    *,
+    buildings: List[schemas.BuildingIn] = Body(..., max_items=settings.BATCH_MAX_SIZE),
+    db: Database = Depends(get_db_pg),
+) -> Any:
+    """
+    Create several buildings, reporting the outcome of each one.
+    """
+    return await crud.building.create_many(db, objs_in=buildings)
+
+
+@router.patch(
+    "/batch",
+    status_code=status.HTTP_200_OK,
+    response_model=List[schemas.BatchItemResult],
+    dependencies=[Depends(get_request_active_superuser)],
+)
+async def update_buildings_batch(
+    *,
+    buildings: List[schemas.BuildingBatchUpdate] = Body(
+        ..., max_items=settings.BATCH_MAX_SIZE
+    ),
+    db: Database = Depends(get_db_pg),
+) -> Any:
+    """
+    Update several buildings by id, reporting the outcome of each one.
+    """
+    return await crud.building.update_many(db, objs_in=buildings)
+
+
+@router.delete(
+    "/batch",
+    status_code=status.HTTP_200_OK,
+    response_model=List[schemas.BatchItemResult],
+    dependencies=[Depends(get_request_active_superuser)],
+)
+async def delete_buildings_batch(
+    *,
+    ids: List[int] = Body(..., max_items=settings.BATCH_MAX_SIZE),
+    db: Database = Depends(get_db_pg),
+) -> Any:
+    """
+    Delete several buildings by id, reporting the outcome of each one.
+    """
+    return await crud.building.remove_many(db, model_ids=ids)
+
+
+@router.post(
+    "/import",
+    status_code=status.HTTP_200_OK,
+    response_model=schemas.ImportResult,
+    dependencies=[Depends(get_request_active_superuser)],
+)
+async def import_buildings(
+    *,
+    request: Request,
+    feed_format: schemas.ImportFormat = Query(schemas.ImportFormat.csv, alias="format"),
+    db: Database = Depends(get_db_pg),
+) -> Any:
+    """
+    Import buildings from a CSV or NDJSON request body, rows with an id replace
+    existing buildings.
+    """
+    return await import_feed(
+        db, kind="buildings", chunks=request.stream(), feed_format=feed_format
+    )
+
+
+@router.get(
+    "/export",
+    status_code=status.HTTP_200_OK,
+    response_class=StreamingResponse,
+    dependencies=[Depends(get_request_active_superuser)],
+)
+async def export_buildings(
+    *,
+    feed_format: schemas.ImportFormat = Query(
+        schemas.ImportFormat.ndjson, alias="format"
+    ),
+    db: Database = Depends(get_db_pg),
+) -> Any:
+    """
+    Stream all buildings as NDJSON or CSV.
+    """
+    columns = [column.name for column in crud.building.stored_columns]
+    return StreamingResponse(
+        export_feed(
+            db,
+            query=crud.building.export_query(),
+            columns=columns,
+            row=lambda record: {column: record[column] for column in columns},
+            feed_format=feed_format,
+        ),
+        media_type=MEDIA_TYPES[feed_format],
+    )
+
+
+@router.get(
+    "/clusters",
+    status_code=status.HTTP_200_OK,
+    response_model=List[schemas.Cluster],
+    dependencies=[Depends(get_request_active_superuser)],
+)
+async def read_building_clusters(
+    *,
+    min_latitude: float = Query(..., ge=-90, le=90),
+    max_latitude: float = Query(..., ge=-90, le=90),
+    min_longitude: float = Query(..., ge=-180, le=180),
+    max_longitude: float = Query(..., ge=-180, le=180),
+    zoom: int = Query(..., ge=0, le=MAX_ZOOM),
+    db: Database = Depends(get_db_pg),
+) -> Any:
+    """
+    Units inside a bounding box aggregated into map markers for a zoom level.
+    """
+    if min_latitude > max_latitude:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="min_latitude must not be greater than max_latitude",
+        )
+    tiles = box_tiles(
+        zoom,
+        min_latitude=min_latitude,
+        max_latitude=max_latitude,
+        min_longitude=min_longitude,
+        max_longitude=max_longitude,
+    )
+    if len(tiles) > settings.CLUSTER_MAX_TILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="The bounding box is too large for this zoom level",
+        )
+    return await crud.building.get_clusters(db, zoom=zoom, tiles=tiles)
+
+
 @router.get(
     "/{building_id}",
     status_code=status.HTTP_200_OK,
@@ -88,13 +284,15 @@ async def update_building(
     """
     Update a building.
     """
-    building = await crud.building.get(db, model_id=building_id)
+    building = await crud.building.update_by_id(
+        db, model_id=building_id, obj_in=building_in
+    )
     if not building:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="The building with this id does not exist",
         )
-    return await crud.building.update(db, db_obj=building, obj_in=building_in)
+    return building
 
 
 @router.delete(
@@ -110,10 +308,9 @@ async def delete_building(
     """
     Delete a building.
     """
-    building = await crud.building.get(db, model_id=building_id)
+    building = await crud.building.remove(db, model_id=building_id)
     if not building:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="The building with this id does not exist",
         )
-    return await crud.building.remove(db, model_id=building_id)
@@ -1,10 +1,20 @@
-from typing import Any, List
+from typing import Any, List, Optional
 
 from databases import Database
-from fastapi import APIRouter, Body, Depends, HTTPException, Path, Query, status
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    HTTPException,
+    Path,
+    Query,
+    Response,
+    status,
+)
 
 from app import crud, schemas
 from app.api.deps import get_db_pg, get_request_active_superuser
+from app.utils.pagination import set_next_cursor, set_total
 
 router = APIRouter()
 
@@ -19,12 +29,21 @@ async def read_developers(
     *,
     skip: int = Query(0),
     limit: int = Query(100),
+    cursor: Optional[str] = Query(None),
+    with_total: bool = Query(False),
+    response: Response,
     db: Database = Depends(get_db_pg),
 ) -> Any:
     """
     Retrieve developers.
     """
-    return await crud.developer.get_multi(db, skip=skip, limit=limit)
+    developers = await crud.developer.get_multi(
+        db, skip=skip, limit=limit, cursor=cursor
+    )
+    set_next_cursor(response, crud.developer.next_cursor(developers, limit=limit))
+    if with_total:
+        set_total(response, await crud.developer.get_total(db))
+    return developers
 
 
 @router.get(
@@ -37,15 +56,19 @@ async def read_developer_agents(
     *,
     skip: int = Query(0),
     limit: int = Query(100),
+    cursor: Optional[str] = Query(None),
+    response: Response,
     developer_id: int = Path(...),
     db: Database = Depends(get_db_pg),
 ) -> Any:
     """
     Retrieve developer agents.
     """
-    return await crud.developer.get_agents(
-        db, model_id=developer_id, skip=skip, limit=limit
+    agents = await crud.developer.get_agents(
+        db, model_id=developer_id, skip=skip, limit=limit, cursor=cursor
     )
+    set_next_cursor(response, crud.agent.next_cursor(agents, limit=limit))
+    return agents
 
 
 @router.post(
@@ -111,13 +134,15 @@ async def update_developer(
     """
     Update a developer.
     """
-    developer = await crud.developer.get(db, model_id=developer_id)
+    developer = await crud.developer.update_by_id(
+        db, model_id=developer_id, obj_in=developer_in
+    )
     if not developer:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="The developer with this id does not exist",
         )
-    return await crud.developer.update(db, db_obj=developer, obj_in=developer_in)
+    return developer
 
 
 @router.delete(
@@ -133,10 +158,9 @@ async def delete_developer(
     """
     Delete a developer.
     """
-    developer = await crud.developer.get(db, model_id=developer_id)
+    developer = await crud.developer.remove(db, model_id=developer_id)
     if not developer:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="The developer with this id does not exist",
         )
-    return await crud.developer.remove(db, model_id=developer_id)
@@ -87,6 +87,8 @@ async def reset_password(
     await crud.user.update(
         db,
         db_obj=user,
-        obj_in=dict(hashed_password=security.get_password_hash(new_password)),
+        obj_in=dict(
+            hashed_password=await security.get_password_hash_async(new_password)
+        ),
     )
     return dict(message="Password updated successfully")
@@ -1,11 +1,28 @@
-from typing import Any, List
+from datetime import datetime
+from typing import Any, List, Optional
 
 from databases import Database
-from fastapi import APIRouter, Body, Depends, HTTPException, Path, Query, status
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    HTTPException,
+    Path,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from fastapi.responses import StreamingResponse
 
 from app import crud, schemas
 from app.api.deps import get_db_pg, get_request_active_superuser
-from app.utils.unit import unit_dict
+from app.core.config import settings
+from app.services import snapshot
+from app.services.exporter import MEDIA_TYPES, export_feed
+from app.services.importer import import_feed
+from app.utils.pagination import set_next_cursor, set_total
+from app.utils.unit import folded_unit_dict, unit_dict, unit_facets_dict, units_dicts
 
 router = APIRouter()
 
@@ -20,22 +37,20 @@ async def read_units(
     *,
     skip: int = Query(0),
     limit: int = Query(100),
+    cursor: Optional[str] = Query(None),
+    with_total: bool = Query(False),
+    response: Response,
     db: Database = Depends(get_db_pg),
 ) -> Any:
     """
     Retrieve units.
     """
-    units = list()
-    db_units = await crud.unit.get_multi(db, skip=skip, limit=limit)
-    for unit in db_units:
-        units.append(
-            unit_dict(
-                unit_record=unit,
-                amenities=await crud.unit.get_unit_amenities(db, model_id=unit.id),
-            )
-        )
-
-    return units
+    db_units = await crud.unit.get_multi(db, skip=skip, limit=limit, cursor=cursor)
+    set_next_cursor(response, crud.unit.next_cursor(db_units, limit=limit))
+    amenities = await crud.unit.get_units_amenities(db, unit_records=db_units)
+    if with_total:
+        set_total(response, await crud.unit.get_total(db))
+    return units_dicts(unit_records=db_units, amenities=amenities)
 
 
 @router.post(
@@ -49,22 +64,55 @@ async def search_units(
     form: schemas.UnitForm = Body(...),
     skip: int = Query(0),
     limit: int = Query(100),
+    cursor: Optional[str] = Query(None),
+    with_total: bool = Query(False),
+    response: Response,
     db: Database = Depends(get_db_pg),
 ) -> Any:
     """
-    Retrieve units with filters.
+    Retrieve units with filters. With a point and radius the units are sorted
+    by the distance to their building, otherwise with a text query the best
+    matches come first.
     """
-    units = list()
-    db_units = await crud.unit.search(db, form=form, skip=skip, limit=limit)
-    for unit in db_units:
-        units.append(
-            unit_dict(
-                unit_record=unit,
-                amenities=await crud.unit.get_unit_amenities(db, model_id=unit.id),
-            )
-        )
+    db_units = await crud.unit.search(
+        db, form=form, skip=skip, limit=limit, cursor=cursor
+    )
+    set_next_cursor(
+        response,
+        crud.unit.next_cursor(
+            db_units, limit=limit, keys=crud.unit.search_keys(form=form)
+        ),
+    )
+    amenities = await crud.unit.get_units_amenities(db, unit_records=db_units)
+    if with_total:
+        set_total(response, await crud.unit.search_total(db, form=form))
+    return units_dicts(unit_records=db_units, amenities=amenities)
+
 
-    return units
+@router.post(
+    "/facets",
+    status_code=status.HTTP_200_OK,
+    response_model=schemas.UnitFacets,
+    dependencies=[Depends(get_request_active_superuser)],
+)
+async def read_unit_facets(
+    *,
+    form: schemas.UnitForm = Body(...),
+    price_bucket: float = Query(settings.FACET_PRICE_BUCKET, gt=0),
+    square_bucket: float = Query(settings.FACET_SQUARE_BUCKET, gt=0),
+    db: Database = Depends(get_db_pg),
+) -> Any:
+    """
+    Counts of the units matching the search form per price and square
+    bucket, bedrooms, bathrooms and amenity. Buckets are widened to a
+    multiple of the requested size when more would be needed than
+    FACET_MAX_BUCKETS.
+    """
+    return unit_facets_dict(
+        await crud.unit.get_facets(
+            db, form=form, price_bucket=price_bucket, square_bucket=square_bucket
+        )
+    )
 
 
 @router.post(
@@ -88,6 +136,159 @@ async def create_unit(
     )
 
 
+@router.post(
+    "/batch",
+    status_code=status.HTTP_200_OK,
+    response_model=List[schemas.BatchItemResult],
+    dependencies=[Depends(get_request_active_superuser)],
+)
+async def create_units_batch(
+    *,
+    units: List[schemas.UnitIn] = Body(..., max_items=settings.BATCH_MAX_SIZE),
+    db: Database = Depends(get_db_pg),
+) -> Any:
+    """
+    Create several units, reporting the outcome of each one.
+    """
+    return await crud.unit.create_many(db, objs_in=units)
+
+
+@router.patch(
+    "/batch",
+    status_code=status.HTTP_200_OK,
+    response_model=List[schemas.BatchItemResult],
+    dependencies=[Depends(get_request_active_superuser)],
+)
+async def update_units_batch(
+    *,
+    units: List[schemas.UnitBatchUpdate] = Body(..., max_items=settings.BATCH_MAX_SIZE),
+    db: Database = Depends(get_db_pg),
+) -> Any:
+    """
+    Update several units by id, reporting the outcome of each one.
+    """
+    return await crud.unit.update_many(db, objs_in=units)
+
+
+@router.delete(
+    "/batch",
+    status_code=status.HTTP_200_OK,
+    response_model=List[schemas.BatchItemResult],
+    dependencies=[Depends(get_request_active_superuser)],
+)
+async def delete_units_batch(
+    *,
+    ids: List[int] = Body(..., max_items=settings.BATCH_MAX_SIZE),
+    db: Database = Depends(get_db_pg),
+) -> Any:
+    """
+    Delete several units by id, reporting the outcome of each one.
+    """
+    return await crud.unit.remove_many(db, model_ids=ids)
+
+
+@router.post(
+    "/import",
+    status_code=status.HTTP_200_OK,
+    response_model=schemas.ImportResult,
+    dependencies=[Depends(get_request_active_superuser)],
+)
+async def import_units(
+    *,
+    request: Request,
+    feed_format: schemas.ImportFormat = Query(schemas.ImportFormat.csv, alias="format"),
+    db: Database = Depends(get_db_pg),
+) -> Any:
+    """
+    Import units from a CSV or NDJSON request body, rows with an id replace
+    existing units.
+    """
+    return await import_feed(
+        db, kind="units", chunks=request.stream(), feed_format=feed_format
+    )
+
+
+@router.get(
+    "/export",
+    status_code=status.HTTP_200_OK,
+    response_class=StreamingResponse,
+    dependencies=[Depends(get_request_active_superuser)],
+)
+async def export_units(
+    *,
+    feed_format: schemas.ImportFormat = Query(
+        schemas.ImportFormat.ndjson, alias="format"
+    ),
+    db: Database = Depends(get_db_pg),
+) -> Any:
+    """
+    Stream all units as NDJSON or CSV.
+    """
+    columns = list(schemas.UnitOut.__fields__)
+    return StreamingResponse(
+        export_feed(
+            db,
+            query=crud.unit.export_query(),
+            columns=columns,
+            row=folded_unit_dict,
+            feed_format=feed_format,
+        ),
+        media_type=MEDIA_TYPES[feed_format],
+    )
+
+
+@router.get(
+    "/snapshot",
+    status_code=status.HTTP_200_OK,
+    response_class=StreamingResponse,
+    dependencies=[Depends(get_request_active_superuser)],
+)
+async def snapshot_units(
+    *,
+    snapshot_format: schemas.SnapshotFormat = Query(
+        schemas.SnapshotFormat.arrow, alias="format"
+    ),
+    since: Optional[datetime] = Query(None),
+    db: Database = Depends(get_db_pg),
+) -> Any:
+    """
+    Columnar snapshot of units with their building and amenity ids. Pass the
+    X-Snapshot-Watermark of the previous snapshot as `since` to only get the
+    units changed after it.
+    """
+    if not snapshot.is_available():
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Snapshots need pyarrow to be installed",
+        )
+
+    watermark = await snapshot.snapshot_watermark(db, previous=since)
+    return StreamingResponse(
+        snapshot.write_snapshot(
+            db,
+            query=crud.unit.snapshot_query(since=since),
+            snapshot_format=snapshot_format,
+        ),
+        media_type=snapshot.MEDIA_TYPES[snapshot_format],
+        headers={snapshot.SNAPSHOT_WATERMARK_HEADER: watermark.isoformat()},
+    )
+
+
+@router.get(
+    "/search-engine",
+    status_code=status.HTTP_200_OK,
+    response_model=schemas.SearchEngineStats,
+    dependencies=[Depends(get_request_active_superuser)],
+)
+async def read_search_engine_stats() -> Any:
+    """
+    Size of the in-process unit search engine of the worker answering.
+    """
+    if crud.unit.engine is None:
+        return schemas.SearchEngineStats(enabled=False)
+    return schemas.SearchEngineStats(enabled=True, **crud.unit.engine.stats())
+
+
 @router.get(
     "/{unit_id}",
     status_code=status.HTTP_200_OK,
@@ -102,16 +303,13 @@ async def read_unit_by_id(
     """
     Get a specific unit by id.
     """
-    unit = await crud.unit.get(db, model_id=unit_id)
+    unit = await crud.unit.get_with_amenities(db, model_id=unit_id)
     if not unit:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="The unit with this id does not exist",
         )
-    return unit_dict(
-        unit_record=unit,
-        amenities=await crud.unit.get_unit_amenities(db, model_id=unit.id),
-    )
+    return folded_unit_dict(unit_record=unit)
 
 
 @router.patch(
@@ -129,14 +327,14 @@ async def update_unit(
     """
     Update a unit.
     """
-    unit = await crud.unit.get(db, model_id=unit_id)
+    unit = await crud.unit.update_by_id(db, model_id=unit_id, obj_in=unit_in)
     if not unit:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="The unit with this id does not exist",
         )
     return unit_dict(
-        unit_record=await crud.unit.update(db, db_obj=unit, obj_in=unit_in),
+        unit_record=unit,
         amenities=await crud.unit.get_unit_amenities(db, model_id=unit.id),
     )
 
@@ -154,10 +352,9 @@ async def delete_unit(
     """
     Delete a unit.
     """
-    unit = await crud.unit.get(db, model_id=unit_id)
+    unit = await crud.unit.remove(db, model_id=unit_id)
     if not unit:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="The unit with this id does not exist",
         )
-    return await crud.unit.remove(db, model_id=unit_id)
@@ -9,6 +9,7 @@ from fastapi import (
     HTTPException,
     Path,
     Query,
+    Response,
     status,
 )
 from pydantic import EmailStr
@@ -20,6 +21,7 @@ from app.api.deps import (
     get_request_active_user,
 )
 from app.core.config import settings
+from app.utils.pagination import set_next_cursor, set_total
 
 router = APIRouter()
 
@@ -34,12 +36,19 @@ async def read_users(
     *,
     skip: int = Query(0),
     limit: int = Query(100),
+    cursor: Optional[str] = Query(None),
+    with_total: bool = Query(False),
+    response: Response,
     db: Database = Depends(get_db_pg),
 ) -> Any:
     """
     Retrieve users.
     """
-    return await crud.user.get_multi(db, skip=skip, limit=limit)
+    users = await crud.user.get_multi(db, skip=skip, limit=limit, cursor=cursor)
+    set_next_cursor(response, crud.user.next_cursor(users, limit=limit))
+    if with_total:
+        set_total(response, await crud.user.get_total(db))
+    return users
 
 
 @router.post(
@@ -132,13 +141,13 @@ async def update_user(
     """
     Update a user.
     """
-    user = await crud.user.get(db, model_id=user_id)
+    user = await crud.user.update_by_id(db, model_id=user_id, obj_in=user_in)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="The user with this id does not exist",
         )
-    return await crud.user.update(db, db_obj=user, obj_in=user_in)
+    return user
 
 
 @router.delete(
@@ -154,13 +163,12 @@ async def delete_user(
     """
     Delete a user.
     """
-    user = await crud.user.get(db, model_id=user_id)
+    user = await crud.user.remove(db, model_id=user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="The user with this id does not exist",
         )
-    return await crud.user.remove(db, model_id=user_id)
 
 
 @router.post(
@@ -1,6 +1,15 @@
 from fastapi import APIRouter
 
-from app.api.v1.endpoints import agent, amenity, building, developer, login, unit, user
+from app.api.v1.endpoints import (
+    agent,
+    amenity,
+    autocomplete,
+    building,
+    developer,
+    login,
+    unit,
+    user,
+)
 
 api_router = APIRouter()
 
@@ -11,3 +20,6 @@ api_router.include_router(agent.router, prefix="/agents", tags=["agents"])
 api_router.include_router(amenity.router, prefix="/amenities", tags=["amenities"])
 api_router.include_router(building.router, prefix="/buildings", tags=["buildings"])
 api_router.include_router(unit.router, prefix="/units", tags=["units"])
+api_router.include_router(
+    autocomplete.router, prefix="/autocomplete", tags=["autocomplete"]
+)
@@ -43,6 +43,14 @@ class Settings(BaseSettings):
     POSTGRES_URL: Optional[PostgresDsn]
     TEST_POSTGRES_URL: Optional[PostgresDsn]
 
+    # Connection pool shared by all requests of the application
+    POSTGRES_POOL_MIN_SIZE: int = 5
+    POSTGRES_POOL_MAX_SIZE: int = 20
+    # Seconds to wait for a free connection before answering 503
+    POSTGRES_POOL_ACQUIRE_TIMEOUT: float = 10.0
+    # Idle connections are closed and reopened after this many seconds
+    POSTGRES_POOL_MAX_INACTIVE_CONNECTION_LIFETIME: float = 300.0
+
     @validator("POSTGRES_URL", pre=True)
     def assemble_postgres_db_url(
         cls, v: Optional[str], values: Mapping[str, Any]
@@ -112,6 +120,51 @@ class Settings(BaseSettings):
     FIRST_SUPERUSER_FIRST_NAME: str
     FIRST_SUPERUSER_LAST_NAME: str
     USERS_OPEN_SIGN_UP: bool = False
+    # Authenticated users are cached per process, changes made by other
+    # processes (e.g. a revoked access) are seen after at most this delay
+    USER_CACHE_TTL_SECONDS: float = 30.0
+    USER_CACHE_MAX_SIZE: int = 10_000
+    # Map clusters are cached per tile, so edits show up on the map after at
+    # most this delay. A cluster request may cover at most CLUSTER_MAX_TILES
+    CLUSTER_CACHE_TTL_SECONDS: float = 60.0
+    CLUSTER_CACHE_MAX_SIZE: int = 10_000
+    CLUSTER_MAX_TILES: int = 64
+    # Changed buildings and amenities are loaded into the autocomplete index
+    # at most this often, the index is rebuilt to drop deleted buildings
+    AUTOCOMPLETE_REFRESH_SECONDS: float = 5.0
+    AUTOCOMPLETE_REBUILD_SECONDS: float = 600.0
+    # Answer unit searches from in-process NumPy arrays, needs numpy. Units
+    # changed by other processes since the last refresh are checked in
+    # Postgres
+    UNIT_SEARCH_ENGINE: bool = False
+    UNIT_SEARCH_ENGINE_REFRESH_SECONDS: float = 5.0
+    # Select units by amenity from in-process bitmaps, loaded on startup.
+    # Searches matching more units than AMENITY_INDEX_MAX_CANDIDATES are
+    # left to the amenity filters of Postgres. Units changed by other
+    # processes since the last refresh are always searched as well
+    AMENITY_INDEX: bool = False
+    AMENITY_INDEX_REFRESH_SECONDS: float = 5.0
+    AMENITY_INDEX_MAX_CANDIDATES: int = 10_000
+    # Facet counts are cached per search form for this delay. Price and
+    # square histograms have buckets of these sizes unless the request sets
+    # others, widened to a multiple of them when more than FACET_MAX_BUCKETS
+    # buckets would be needed
+    FACETS_CACHE_TTL_SECONDS: float = 60.0
+    FACETS_CACHE_MAX_SIZE: int = 10_000
+    FACET_PRICE_BUCKET: float = 1000.0
+    FACET_SQUARE_BUCKET: float = 10.0
+    FACET_MAX_BUCKETS: int = 1000
+    # Totals of lists and searches are counted up to this many rows, larger
+    # ones are estimated by the planner and flagged as approximate
+    EXACT_COUNT_LIMIT: int = 1000
+    # Items accepted by one request to the batch endpoints
+    BATCH_MAX_SIZE: int = 10_000
+    # Rows between two progress log lines of an import
+    IMPORT_PROGRESS_EVERY: int = 100_000
+    # Threads hashing passwords and requests allowed to wait for them,
+    # further requests are answered with 503
+    PASSWORD_HASHING_WORKERS: int = 4
+    PASSWORD_HASHING_QUEUE_SIZE: int = 64
 
 
 settings = Settings()
@@ -1,5 +1,7 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Any, Optional, Union
+from typing import Any, Callable, Optional, TypeVar, Union
 
 from jose import jwt
 from passlib.context import CryptContext
@@ -8,6 +10,8 @@ from app.core.config import settings
 
 ENCODING_ALGORITHM = "HS256"
 
+T = TypeVar("T")
+
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -20,6 +24,62 @@ def get_password_hash(password) -> str:
     return pwd_context.hash(password)
 
 
+class PasswordHashingBusy(Exception):
+    """
+    Every password hashing worker is busy and the waiting queue is full.
+    """
+
+
+class PasswordHashingPool:
+    """
+    Bounded thread pool running bcrypt off the event loop (bcrypt releases
+    the GIL while hashing). Calls beyond `max_workers` running and
+    `max_queue_size` waiting fail fast with PasswordHashingBusy.
+    """
+
+    def __init__(self, *, max_workers: int, max_queue_size: int) -> None:
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        if self._pending >= self.max_workers + self.max_queue_size:
+            raise PasswordHashingBusy()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="password-hashing"
+            )
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self._pending -= 1
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+password_hashing_pool = PasswordHashingPool(
+    max_workers=settings.PASSWORD_HASHING_WORKERS,
+    max_queue_size=settings.PASSWORD_HASHING_QUEUE_SIZE,
+)
+
+
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    return await password_hashing_pool.run(
+        verify_password, plain_password, hashed_password
+    )
+
+
+async def get_password_hash_async(password) -> str:
+    return await password_hashing_pool.run(get_password_hash, password)
+
+
 def create_access_token(
     subject: Union[str, Any], expires_delta: timedelta = None
 ) -> str:
@@ -0,0 +1,323 @@
+"""
+In-process bitmap index of the units having each amenity.
+
+As in Roaring bitmaps, unit ids are split into chunks by their high bits. A
+chunk holding few ids is a sorted array of their low bits, a denser one is a
+bitmap packed into a Python int, so sparse amenities stay small and dense
+ones are combined a machine word at a time. Amenity filters are evaluated
+on the bitmaps and give Postgres a candidate id set instead of joining
+unit_amenities once per amenity.
+
+Links made by other processes are only read on the next refresh, the units
+changed since then are searched besides the candidates.
+"""
+import re
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Set, Tuple
+
+from databases import Database
+from sqlalchemy import Integer, any_, or_, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by, array_agg
+
+from app.crud.base import array_param
+from app.models import unit, unit_amenities
+from app.schemas.unit import AmenityMatch
+from app.services.snapshot import snapshot_watermark
+
+CHUNK_BITS = 16
+LOW_MASK = (1 << CHUNK_BITS) - 1
+# Above this many ids an array chunk takes more room than a bitmap
+ARRAY_MAX_SIZE = 4096
+
+CHUNK_BYTES = 1 << (CHUNK_BITS - 3)
+# Offsets of the set bits of each byte, and their count as a translation table
+BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+BYTE_COUNTS = bytes(len(bits) for bits in BYTE_BITS)
+NONZERO_BYTE = re.compile(b"[^\\x00]")
+
+Container = Any  # array of low bits or int bitmap
+
+
+def to_int(container: Container) -> int:
+    if isinstance(container, int):
+        return container
+    bitmap = bytearray(CHUNK_BYTES)
+    for low in container:
+        bitmap[low >> 3] |= 1 << (low & 7)
+    return int.from_bytes(bitmap, "little")
+
+
+def lows(container: Container) -> Iterator[int]:
+    if not isinstance(container, int):
+        yield from container
+        return
+    data = container.to_bytes(CHUNK_BYTES, "little")
+    for match in NONZERO_BYTE.finditer(data):
+        offset = match.start()
+        for bit in BYTE_BITS[data[offset]]:
+            yield offset << 3 | bit
+
+
+def popcount(bitmap: int) -> int:
+    return sum(bitmap.to_bytes(CHUNK_BYTES, "little").translate(BYTE_COUNTS))
+
+
+if hasattr(int, "bit_count"):  # Python 3.10+
+    popcount = int.bit_count  # type: ignore # noqa: F811
+
+
+def cardinality(container: Container) -> int:
+    if isinstance(container, int):
+        return popcount(container)
+    return len(container)
+
+
+def compact(container: Container) -> Optional[Container]:
+    """
+    The smallest form of the container, None when it is empty.
+    """
+    size = cardinality(container)
+    if not size:
+        return None
+    if isinstance(container, int) and size <= ARRAY_MAX_SIZE:
+        return array("H", lows(container))
+    if not isinstance(container, int) and size > ARRAY_MAX_SIZE:
+        return to_int(container)
+    return container
+
+
+class UnitBitmap:
+    def __init__(self, containers: Optional[Dict[int, Container]] = None) -> None:
+        self.containers: Dict[int, Container] = containers or dict()
+
+    @classmethod
+    def from_sorted(cls, ids: Iterable[int]) -> "UnitBitmap":
+        containers: Dict[int, List[int]] = dict()
+        for id_ in ids:
+            containers.setdefault(id_ >> CHUNK_BITS, list()).append(id_ & LOW_MASK)
+        return cls(
+            {high: compact(array("H", chunk)) for high, chunk in containers.items()}
+        )
+
+    def __len__(self) -> int:
+        return sum(cardinality(container) for container in self.containers.values())
+
+    def __iter__(self) -> Iterator[int]:
+        for high in sorted(self.containers):
+            for low in lows(self.containers[high]):
+                yield high << CHUNK_BITS | low
+
+    def __contains__(self, id_: int) -> bool:
+        container = self.containers.get(id_ >> CHUNK_BITS)
+        if container is None:
+            return False
+        low = id_ & LOW_MASK
+        if isinstance(container, int):
+            return bool(container >> low & 1)
+        position = bisect_left(container, low)
+        return position < len(container) and container[position] == low
+
+    def add(self, id_: int) -> None:
+        high, low = id_ >> CHUNK_BITS, id_ & LOW_MASK
+        container = self.containers.setdefault(high, array("H"))
+        if isinstance(container, int):
+            self.containers[high] = container | 1 << low
+            return
+        position = bisect_left(container, low)
+        if position == len(container) or container[position] != low:
+            container.insert(position, low)
+            if len(container) > ARRAY_MAX_SIZE:
+                self.containers[high] = to_int(container)
+
+    def discard(self, id_: int) -> None:
+        high, low = id_ >> CHUNK_BITS, id_ & LOW_MASK
+        container = self.containers.get(high)
+        if container is None:
+            return
+        if isinstance(container, int):
+            container = compact(container & ~(1 << low))
+        else:
+            position = bisect_left(container, low)
+            if position < len(container) and container[position] == low:
+                del container[position]
+            container = container or None
+        if container is None:
+            del self.containers[high]
+        else:
+            self.containers[high] = container
+
+    def combine(self, other: "UnitBitmap", operation: str) -> "UnitBitmap":
+        if operation == "and":
+            highs = self.containers.keys() & other.containers.keys()
+        elif operation == "or":
+            highs = self.containers.keys() | other.containers.keys()
+        else:
+            highs = set(self.containers)
+
+        containers = dict()
+        for high in highs:
+            left = self.containers.get(high, array("H"))
+            right = other.containers.get(high, array("H"))
+            if operation == "and" and isinstance(left, int):
+                left, right = right, left
+            # Small arrays are combined as sets, an array with a bitmap by
+            # testing its ids and two bitmaps a machine word at a time
+            if not isinstance(left, int) and not isinstance(right, int):
+                left_lows, right_lows = set(left), set(right)
+                if operation == "and":
+                    merged: Any = left_lows & right_lows
+                elif operation == "or":
+                    merged = left_lows | right_lows
+                else:
+                    merged = left_lows - right_lows
+                container = compact(array("H", sorted(merged)))
+            elif operation != "or" and not isinstance(left, int):
+                data = right.to_bytes(CHUNK_BYTES, "little")
+                keep = operation == "and"
+                container = compact(
+                    array(
+                        "H",
+                        (
+                            low
+                            for low in left
+                            if (data[low >> 3] >> (low & 7) & 1) == keep
+                        ),
+                    )
+                )
+            else:
+                if operation == "and":
+                    merged = to_int(left) & to_int(right)
+                elif operation == "or":
+                    merged = to_int(left) | to_int(right)
+                else:
+                    merged = to_int(left) & ~to_int(right)
+                container = compact(merged)
+            if container is not None:
+                containers[high] = container
+        return UnitBitmap(containers)
+
+    def __and__(self, other: "UnitBitmap") -> "UnitBitmap":
+        return self.combine(other, "and")
+
+    def __or__(self, other: "UnitBitmap") -> "UnitBitmap":
+        return self.combine(other, "or")
+
+    def __sub__(self, other: "UnitBitmap") -> "UnitBitmap":
+        return self.combine(other, "sub")
+
+
+class AmenityIndex:
+    def __init__(self, *, refresh_seconds: float) -> None:
+        self.refresh_seconds = refresh_seconds
+        self.bitmaps: Dict[int, UnitBitmap] = dict()
+        # Units whose links were written by this process, re-read before the
+        # next search
+        self.dirty: Set[int] = set()
+        self.watermark: Optional[datetime] = None
+        self.refreshed_at: Optional[float] = None
+        self.refreshing = False
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.refreshed_at is not None
+
+    def stats(self) -> Dict[str, int]:
+        return dict(
+            amenities=len(self.bitmaps),
+            links=sum(len(bitmap) for bitmap in self.bitmaps.values()),
+        )
+
+    def add(self, links: Iterable[Tuple[int, int]]) -> None:
+        """
+        Add committed links, those of an open transaction are touched instead.
+        """
+        for unit_id, amenity_id in links:
+            self.bitmaps.setdefault(amenity_id, UnitBitmap()).add(unit_id)
+
+    def touch(self, model_ids: Iterable[int]) -> None:
+        self.dirty.update(model_ids)
+
+    def set_unit(self, unit_id: int, amenity_ids: Iterable[int]) -> None:
+        amenity_ids = set(amenity_ids)
+        for amenity_id, bitmap in self.bitmaps.items():
+            if amenity_id not in amenity_ids:
+                bitmap.discard(unit_id)
+        self.add((unit_id, amenity_id) for amenity_id in amenity_ids)
+
+    def candidates(
+        self, *, amenities: Optional[List[int]], match: AmenityMatch
+    ) -> Optional[UnitBitmap]:
+        """
+        Units having any or all of `amenities`, None without them. Excluded
+        amenities are left to Postgres, most units lack them.
+        """
+        if not amenities:
+            return None
+        bitmaps = [self.bitmaps.get(a, UnitBitmap()) for a in set(amenities)]
+        # Smallest first, intersections only shrink
+        bitmaps.sort(key=len)
+        found = bitmaps[0]
+        for bitmap in bitmaps[1:]:
+            found = found & bitmap if match == AmenityMatch.all else found | bitmap
+        return found
+
+    async def rebuild(self, db: Database) -> None:
+        """
+        Load the links of every amenity, e.g. on startup.
+        """
+        started = time.monotonic()
+        watermark = await snapshot_watermark(db, previous=self.watermark)
+        bitmaps = dict()
+        query = select(
+            unit_amenities.c.amenity_id,
+            array_agg(
+                aggregate_order_by(unit_amenities.c.unit_id, unit_amenities.c.unit_id)
+            ).label("unit_ids"),
+        ).group_by(unit_amenities.c.amenity_id)
+        async for record in db.iterate(query):
+            bitmaps[record["amenity_id"]] = UnitBitmap.from_sorted(record["unit_ids"])
+        self.bitmaps, self.dirty = bitmaps, set()
+        self.watermark, self.refreshed_at = watermark, started
+
+    async def refresh(self, db: Database) -> None:
+        """
+        Re-read the links of the units written by this process and, every
+        `refresh_seconds`, of the units changed since the last refresh. A
+        change of the links of a unit also updates unit.updated_at.
+        """
+        if not self.is_loaded:
+            await self.rebuild(db)
+            return
+        started = time.monotonic()
+        due = started - self.refreshed_at >= self.refresh_seconds
+        if (not due and not self.dirty) or self.refreshing:
+            return
+
+        self.refreshing = True
+        dirty, self.dirty = self.dirty, set()
+        try:
+            watermark = self.watermark
+            if due:
+                watermark = await snapshot_watermark(db, previous=self.watermark)
+            conditions = [unit.c.id == any_(array_param(sorted(dirty), Integer()))]
+            if due:
+                conditions.append(unit.c.updated_at >= self.watermark)
+            records: List[Mapping] = await db.fetch_all(
+                select(unit.c.id, unit.c.amenity_ids).where(or_(*conditions))
+            )
+            for record in records:
+                self.set_unit(record["id"], record["amenity_ids"])
+            # Deleted units keep no links
+            for unit_id in dirty - {record["id"] for record in records}:
+                self.set_unit(unit_id, [])
+        except BaseException:
+            self.dirty |= dirty
+            raise
+        finally:
+            self.refreshing = False
+
+        if due:
+            self.watermark, self.refreshed_at = watermark, started
@@ -1,14 +1,180 @@
-from typing import Any, Dict, Generic, List, Mapping, Optional, Type, TypeVar, Union
+import base64
+import binascii
+from collections import defaultdict
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Generic,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 
+import orjson
+from asyncpg import PostgresError
+from asyncpg.exceptions import DataError
 from databases import Database
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
-from sqlalchemy import Table, delete, update
+from sqlalchemy import (
+    ARRAY,
+    Column,
+    Table,
+    any_,
+    cast,
+    delete,
+    func,
+    insert,
+    literal,
+    select,
+    tuple_,
+    update,
+)
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql import ClauseElement, ColumnElement, Select
+from sqlalchemy.sql.base import Executable
+from sqlalchemy.types import TypeEngine
+
+from app.core.config import settings
+from app.schemas.batch import BatchItemResult
 
 ModelTable = TypeVar("ModelTable", bound=Table)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 
+# Postgres accepts at most this many bind parameters in one statement
+MAX_QUERY_PARAMETERS = 32767
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """
+    Opaque token of the sort key values of the last row of a page.
+    """
+    return base64.urlsafe_b64encode(orjson.dumps(values, default=str)).decode()
+
+
+def decode_cursor(cursor: str, *, keys: Sequence[ColumnElement]) -> List[Any]:
+    try:
+        values = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(keys):
+        raise ValueError("Invalid cursor")
+
+    # Decimals are encoded as strings, restore the type of the sort key
+    try:
+        return [key.type.python_type(value) for key, value in zip(keys, values)]
+    except (ArithmeticError, TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+
+def paginate(
+    query: Select,
+    *,
+    keys: Sequence[ColumnElement],
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    descending: bool = False,
+) -> Select:
+    """
+    Order the query by `keys` and cut one page out of it.
+
+    With a `cursor` the page starts right after the row the cursor was built
+    from (keyset pagination), so the index on `keys` is used to seek to the
+    page instead of scanning and discarding `skip` rows with OFFSET.
+    The last key must be unique (usually `id`) for the order to be stable.
+    """
+    query = query.order_by(
+        *(key.desc() if descending else key.asc() for key in keys)
+    ).limit(limit)
+    if cursor is None:
+        return query.offset(skip)
+
+    values = decode_cursor(cursor, keys=keys)
+    row = tuple_(*keys)
+    last_row = tuple_(*(literal(value, key.type) for key, value in zip(keys, values)))
+    return query.where(row < last_row if descending else row > last_row)
+
+
+def next_cursor(
+    records: Sequence[Mapping], *, keys: Sequence[ColumnElement], limit: int
+) -> Optional[str]:
+    """
+    Cursor of the page following `records`, None on the last page.
+    """
+    if not records or len(records) < limit:
+        return None
+    return encode_cursor([records[-1][key.name] for key in keys])
+
+
+class Explain(Executable, ClauseElement):
+    """
+    EXPLAIN (FORMAT JSON) of a query, run with the parameters of the query.
+    """
+
+    inherit_cache = False
+
+    def __init__(self, query: Select) -> None:
+        self.query = query
+
+
+@compiles(Explain)
+def compile_explain(element: Explain, compiler: Any, **kwargs: Any) -> str:
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.query, **kwargs)
+
+
+async def count_rows(
+    db: Database, query: Select, *, exact_limit: int
+) -> Tuple[int, bool]:
+    """
+    Number of rows of `query` and whether it is exact. At most `exact_limit`
+    rows are counted, more are estimated by the planner, which reads no rows
+    but may be far off, e.g. for correlated filters or stale statistics.
+    """
+    query = query.order_by(None).limit(None).offset(None)
+    counted = await db.fetch_val(
+        select(func.count()).select_from(query.limit(exact_limit + 1).subquery())
+    )
+    if counted <= exact_limit:
+        return counted, True
+
+    plan = await db.fetch_val(Explain(query))
+    if isinstance(plan, str):
+        plan = orjson.loads(plan)
+    # Counting stopped past exact_limit, there are at least that many
+    return max(int(plan[0]["Plan"]["Plan Rows"]), exact_limit + 1), False
+
+
+def chunked(items: Sequence[Any], size: int) -> Iterator[Sequence[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def array_param(values: Sequence[Any], item_type: TypeEngine) -> ColumnElement:
+    """
+    A list bound as a single typed array parameter, whatever its length.
+    """
+    return cast(literal(list(values), ARRAY(item_type)), ARRAY(item_type))
+
+
+def batch_item_result(index: int, record: Any) -> BatchItemResult:
+    if isinstance(record, Exception):
+        return BatchItemResult(index=index, ok=False, detail=str(record))
+    if record is None:
+        return BatchItemResult(
+            index=index, ok=False, detail="The object with this id does not exist"
+        )
+    return BatchItemResult(index=index, ok=True, id=record["id"])
+
 
 class CRUDBase(Generic[ModelTable, CreateSchemaType, UpdateSchemaType]):
     def __init__(self, model: Type[ModelTable]):
@@ -22,42 +188,264 @@ class CRUDBase(Generic[ModelTable, CreateSchemaType, UpdateSchemaType]):
         """
         self.model = model
 
+    @property
+    def sort_keys(self) -> List[ColumnElement]:
+        return [self.model.c.id]
+
+    @property
+    def stored_columns(self) -> List[Column]:
+        """
+        Columns without the generated ones (e.g. search vectors), which are
+        derived from the others and not worth transferring in bulk.
+        """
+        return [column for column in self.model.c if column.computed is None]
+
+    def next_cursor(
+        self,
+        records: Sequence[Mapping],
+        *,
+        limit: int,
+        keys: Optional[Sequence[ColumnElement]] = None,
+    ) -> Optional[str]:
+        return next_cursor(records, keys=keys or self.sort_keys, limit=limit)
+
     async def get(self, db: Database, *, model_id: Any) -> Optional[ModelTable]:
         return await db.fetch_one(
             self.model.select().where(self.model.c.id == model_id)
         )
 
     async def get_multi(
-        self, db: Database, *, skip: int = 0, limit: int = 100
+        self,
+        db: Database,
+        *,
+        skip: int = 0,
+        limit: int = 100,
+        cursor: Optional[str] = None,
     ) -> List[Mapping]:
-        return await db.fetch_all(self.model.select().offset(skip).limit(limit))
+        return await db.fetch_all(
+            paginate(
+                self.model.select(),
+                keys=self.sort_keys,
+                skip=skip,
+                limit=limit,
+                cursor=cursor,
+            )
+        )
+
+    async def get_total(self, db: Database) -> Tuple[int, bool]:
+        """
+        Number of rows listed by get_multi and whether it is exact.
+        """
+        return await count_rows(
+            db, self.model.select(), exact_limit=settings.EXACT_COUNT_LIMIT
+        )
+
+    def export_query(self) -> Select:
+        return select(*self.stored_columns).order_by(self.model.c.id)
 
     async def create(self, db: Database, *, obj_in: CreateSchemaType) -> ModelTable:
         obj_in_data = jsonable_encoder(obj_in.dict(exclude_unset=True))
-        db_query = self.model.insert().values(**obj_in_data)
-        obj_id = await db.execute(db_query)
-        return await self.get(db=db, model_id=obj_id)
+        return await db.fetch_one(
+            self.model.insert().values(**obj_in_data).returning(*self.model.c)
+        )
 
     async def update(
         self,
         db: Database,
         *,
         db_obj: ModelTable,
-        obj_in: Union[UpdateSchemaType, Dict[str, Any]]
+        obj_in: Union[UpdateSchemaType, Dict[str, Any]],
     ) -> ModelTable:
         if isinstance(obj_in, dict):
             update_data = obj_in
         else:
             update_data = obj_in.dict(exclude_unset=True)
-        obj_id = db_obj.id
+        if not update_data:
+            return db_obj
+
+        return await self.update_by_id(db, model_id=db_obj.id, obj_in=update_data)
 
-        if update_data:
-            await db.execute(
-                update(self.model)
-                .where(self.model.c.id == obj_id)
-                .values(**update_data)
+    async def update_by_id(
+        self,
+        db: Database,
+        *,
+        model_id: Any,
+        obj_in: Union[UpdateSchemaType, Dict[str, Any]],
+    ) -> Optional[ModelTable]:
+        """
+        Update the row with one statement. Return None if it does not exist.
+        """
+        if isinstance(obj_in, dict):
+            update_data = obj_in
+        else:
+            update_data = obj_in.dict(exclude_unset=True)
+        if not update_data:
+            return await self.get(db, model_id=model_id)
+
+        return await db.fetch_one(
+            update(self.model)
+            .where(self.model.c.id == model_id)
+            .values(**update_data)
+            .returning(*self.model.c)
+        )
+
+    async def remove(self, db: Database, *, model_id: Any) -> Optional[ModelTable]:
+        """
+        Delete the row with one statement. Return None if it does not exist.
+        """
+        return await db.fetch_one(
+            delete(self.model)
+            .where(self.model.c.id == model_id)
+            .returning(*self.model.c)
+        )
+
+    async def create_many(
+        self, db: Database, *, objs_in: Sequence[CreateSchemaType]
+    ) -> List[BatchItemResult]:
+        return await self.run_batch(db, items=objs_in, write=self.create_batch)
+
+    async def update_many(
+        self,
+        db: Database,
+        *,
+        objs_in: Sequence[Union[UpdateSchemaType, Dict[str, Any]]],
+    ) -> List[BatchItemResult]:
+        """
+        Update several rows, each item carries the `id` of its row.
+        """
+        return await self.run_batch(db, items=objs_in, write=self.update_batch)
+
+    async def remove_many(
+        self, db: Database, *, model_ids: Sequence[Any]
+    ) -> List[BatchItemResult]:
+        return await self.run_batch(db, items=model_ids, write=self.remove_batch)
+
+    async def run_batch(
+        self,
+        db: Database,
+        *,
+        items: Sequence[Any],
+        write: Callable[[Database, Sequence[Any]], Awaitable[List[Any]]],
+    ) -> List[BatchItemResult]:
+        """
+        Write all items with set-based statements in one transaction. If that
+        fails, write them again one transaction per item so that only the
+        offending items are reported as failed.
+        """
+        try:
+            async with db.transaction():
+                records = await write(db, items)
+        except (PostgresError, DataError):
+            records = list()
+            for item in items:
+                try:
+                    async with db.transaction():
+                        (record,) = await write(db, [item])
+                except (PostgresError, DataError) as exc:
+                    record = exc
+                records.append(record)
+
+        return [
+            batch_item_result(index, record) for index, record in enumerate(records)
+        ]
+
+    async def create_batch(
+        self, db: Database, objs_in: Sequence[CreateSchemaType]
+    ) -> List[Mapping]:
+        rows = [jsonable_encoder(obj_in.dict(exclude_unset=True)) for obj_in in objs_in]
+        return await self.insert_rows(db, rows=rows)
+
+    async def update_batch(
+        self,
+        db: Database,
+        objs_in: Sequence[Union[UpdateSchemaType, Dict[str, Any]]],
+    ) -> List[Optional[Mapping]]:
+        rows = list()
+        for obj_in in objs_in:
+            rows.append(
+                obj_in if isinstance(obj_in, dict) else obj_in.dict(exclude_unset=True)
+            )
+        return await self.update_rows(db, rows=rows)
+
+    async def remove_batch(
+        self, db: Database, model_ids: Sequence[Any]
+    ) -> List[Optional[Mapping]]:
+        records = await db.fetch_all(
+            delete(self.model)
+            .where(
+                self.model.c.id == any_(array_param(model_ids, self.model.c.id.type))
+            )
+            .returning(*self.model.c)
+        )
+        by_id = {record["id"]: record for record in records}
+        return [by_id.get(model_id) for model_id in model_ids]
+
+    async def insert_rows(
+        self, db: Database, *, rows: Sequence[Dict[str, Any]]
+    ) -> List[Mapping]:
+        """
+        Multi-row INSERT ... RETURNING per set of columns, records are returned
+        in the order of `rows`.
+        """
+        groups = defaultdict(list)
+        for index, row in enumerate(rows):
+            groups[tuple(sorted(row))].append(index)
+
+        records = [None] * len(rows)
+        for columns, indexes in groups.items():
+            chunk_size = MAX_QUERY_PARAMETERS // max(len(columns), 1)
+            for chunk in chunked(indexes, chunk_size):
+                # Postgres returns the inserted rows in the order of VALUES
+                chunk_records = await db.fetch_all(
+                    insert(self.model)
+                    .values([rows[index] for index in chunk])
+                    .returning(*self.model.c)
+                )
+                for index, record in zip(chunk, chunk_records):
+                    records[index] = record
+        return records
+
+    async def update_rows(
+        self, db: Database, *, rows: Sequence[Dict[str, Any]]
+    ) -> List[Optional[Mapping]]:
+        """
+        One UPDATE ... FROM unnest(...) per set of updated columns. Rows that
+        do not exist come back as None.
+        """
+        groups = defaultdict(list)
+        for index, row in enumerate(rows):
+            groups[tuple(sorted(column for column in row if column != "id"))].append(
+                index
             )
-        return await self.get(db=db, model_id=obj_id)
 
-    async def remove(self, db: Database, *, model_id: int) -> None:
-        return await db.execute(delete(self.model).where(self.model.c.id == model_id))
+        records = [None] * len(rows)
+        for columns, indexes in groups.items():
+            model_ids = [rows[index]["id"] for index in indexes]
+            if columns:
+                source = select(
+                    *(
+                        func.unnest(
+                            array_param(
+                                [rows[index][column] for index in indexes],
+                                self.model.c[column].type,
+                            )
+                        ).label(column)
+                        for column in ("id", *columns)
+                    )
+                ).subquery()
+                query = (
+                    update(self.model)
+                    .where(self.model.c.id == source.c.id)
+                    .values({column: source.c[column] for column in columns})
+                    .returning(*self.model.c)
+                )
+            else:
+                query = self.model.select().where(
+                    self.model.c.id
+                    == any_(array_param(model_ids, self.model.c.id.type))
+                )
+
+            by_id = {record["id"]: record for record in await db.fetch_all(query)}
+            for index, model_id in zip(indexes, model_ids):
+                records[index] = by_id.get(model_id)
+        return records
@@ -1,15 +1,139 @@
-from typing import Any
+from typing import Any, List, Optional, Tuple
 
 from databases import Database
+from sqlalchemy import Float, Integer, and_, cast, distinct, func, or_, select
+from sqlalchemy.sql import ColumnElement, Select
 
-from app.crud.base import CRUDBase
-from app.models import building
-from app.schemas.building import BuildingIn, BuildingUpdate
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.crud.base import CRUDBase, paginate
+from app.crud.geo import (
+    CLUSTER_GRID,
+    distance_km,
+    geo_filters,
+    tile_bounds,
+    tile_filters,
+)
+from app.crud.text import text_filter, text_rank
+from app.models import building, unit
+from app.schemas.building import BuildingForm, BuildingIn, BuildingUpdate
 
 
 class CRUDBuilding(CRUDBase[type(building), BuildingIn, BuildingUpdate]):
+    def __init__(self, model: Any):
+        super().__init__(model)
+        self.cluster_cache = TTLCache(
+            maxsize=settings.CLUSTER_CACHE_MAX_SIZE,
+            ttl=settings.CLUSTER_CACHE_TTL_SECONDS,
+        )
+
     async def get_by_name(self, db: Database, *, name: str) -> Any:
         return await db.fetch_one(self.model.select().where(self.model.c.name == name))
 
+    def search_keys(self, *, form: BuildingForm) -> List[ColumnElement]:
+        if form.has_point:
+            return [distance_km(form).label("distance"), self.model.c.id]
+        if form.has_text:
+            # Paged in descending order, best matches first
+            rank = text_rank(self.model.c.search_vector, form).label("rank")
+            return [rank, self.model.c.id]
+        return self.sort_keys
+
+    async def search(
+        self,
+        db: Database,
+        *,
+        form: BuildingForm,
+        skip: int = 0,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+    ) -> List[Any]:
+        return await db.fetch_all(
+            query=self.search_query(form=form, skip=skip, limit=limit, cursor=cursor)
+        )
+
+    def search_query(
+        self,
+        *,
+        form: BuildingForm,
+        skip: int = 0,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+    ) -> Select:
+        keys = self.search_keys(form=form)
+        query = self.model.select().where(*geo_filters(form))
+        if form.has_text:
+            query = query.where(text_filter(self.model.c.search_vector, form))
+        if form.has_point or form.has_text:
+            query = query.add_columns(keys[0])
+
+        return paginate(
+            query,
+            keys=keys,
+            skip=skip,
+            limit=limit,
+            cursor=cursor,
+            descending=form.has_text and not form.has_point,
+        )
+
+    async def get_clusters(
+        self, db: Database, *, zoom: int, tiles: List[Tuple[int, int]]
+    ) -> List[Any]:
+        """
+        Unit clusters of the tiles, each tile computed once per cache period.
+        The tiles missing from the cache are computed by a single query.
+        """
+        tile_clusters = {tile: self.cluster_cache.get((zoom, *tile)) for tile in tiles}
+        missing = [tile for tile, clusters in tile_clusters.items() if clusters is None]
+        if missing:
+            computed = {tile: list() for tile in missing}
+            for record in await db.fetch_all(self.clusters_query(zoom, missing)):
+                computed[(record["x"], record["y"])].append(record)
+            for tile, clusters in computed.items():
+                self.cluster_cache.set((zoom, *tile), clusters)
+            tile_clusters.update(computed)
+        return [cluster for tile in tiles for cluster in tile_clusters[tile]]
+
+    def clusters_query(self, zoom: int, tiles: List[Tuple[int, int]]) -> Select:
+        # Cells are numbered across the world, the points on its north and east
+        # edges belong to the last cell rather than to a cell past it
+        cells = 2**zoom * CLUSTER_GRID
+        latitude = cast(self.model.c.latitude, Float)
+        longitude = cast(self.model.c.longitude, Float)
+        cell_y = func.least(func.floor((latitude + 90) / (180 / cells)), cells - 1)
+        cell_x = func.least(func.floor((longitude + 180) / (360 / cells)), cells - 1)
+        tile_y = cast(func.floor(cell_y / CLUSTER_GRID), Integer)
+        tile_x = cast(func.floor(cell_x / CLUSTER_GRID), Integer)
+
+        return (
+            select(
+                tile_x.label("x"),
+                tile_y.label("y"),
+                func.avg(latitude).label("latitude"),
+                func.avg(longitude).label("longitude"),
+                func.count(distinct(self.model.c.id)).label("buildings"),
+                func.count().label("units"),
+                func.min(unit.c.price).label("min_price"),
+                func.percentile_cont(0.5)
+                .within_group(unit.c.price)
+                .label("median_price"),
+                func.max(unit.c.price).label("max_price"),
+            )
+            .select_from(self.model.join(unit, unit.c.building_id == self.model.c.id))
+            .where(
+                or_(
+                    *(
+                        and_(
+                            *tile_filters(*tile_bounds(zoom, x, y)),
+                            tile_x == x,
+                            tile_y == y,
+                        )
+                        for x, y in tiles
+                    )
+                )
+            )
+            .group_by(cell_y, cell_x)
+        )
+
 
 building = CRUDBuilding(building)
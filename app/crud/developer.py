@@ -2,7 +2,7 @@ from typing import Any, List, Optional
 
 from databases import Database
 
-from app.crud.base import CRUDBase
+from app.crud.base import CRUDBase, paginate
 from app.models import agent, developer
 from app.schemas.developer import DeveloperIn, DeveloperUpdate
 
@@ -18,13 +18,22 @@ class CRUDDeveloper(CRUDBase[type(developer), DeveloperIn, DeveloperUpdate]):
         )
 
     async def get_agents(
-        self, db: Database, *, model_id: int, skip: int = 0, limit: int = 100
+        self,
+        db: Database,
+        *,
+        model_id: int,
+        skip: int = 0,
+        limit: int = 100,
+        cursor: Optional[str] = None,
     ) -> List[Any]:
         return await db.fetch_all(
-            agent.select()
-            .where(agent.c.developer_id == model_id)
-            .offset(skip)
-            .limit(limit)
+            paginate(
+                agent.select().where(agent.c.developer_id == model_id),
+                keys=[agent.c.id],
+                skip=skip,
+                limit=limit,
+                cursor=cursor,
+            )
         )
 
 
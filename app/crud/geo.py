@@ -0,0 +1,151 @@
+"""
+Radius and bounding box conditions on building coordinates.
+
+Both searches are bounded by latitude and longitude ranges, which are served
+by the (latitude, longitude) B-tree index. The exact distance is only
+computed for the buildings inside those ranges.
+"""
+import math
+from typing import List, Tuple
+
+from sqlalchemy import Float, and_, cast, func, or_
+from sqlalchemy.sql import ColumnElement
+
+from app.models import building
+from app.schemas.building import GeoForm
+
+# Mean Earth radius
+EARTH_RADIUS_KM = 6371.0088
+
+# Clusters of a tile are the cells of a CLUSTER_GRID x CLUSTER_GRID grid
+CLUSTER_GRID = 8
+MAX_ZOOM = 20
+
+
+def longitude_between(min_longitude: float, max_longitude: float) -> ColumnElement:
+    if min_longitude <= max_longitude:
+        return building.c.longitude.between(min_longitude, max_longitude)
+    # The range crosses the antimeridian
+    return or_(
+        building.c.longitude >= min_longitude, building.c.longitude <= max_longitude
+    )
+
+
+def point_bounding_box(form: GeoForm) -> ColumnElement:
+    """
+    Box around the circle of `form.radius` km, the part of the search that
+    can use the (latitude, longitude) index.
+    """
+    angle = form.radius / EARTH_RADIUS_KM
+    min_latitude = form.latitude - math.degrees(angle)
+    max_latitude = form.latitude + math.degrees(angle)
+    if min_latitude <= -90 or max_latitude >= 90:
+        # The circle contains a pole, all longitudes are in
+        return building.c.latitude.between(
+            max(min_latitude, -90), min(max_latitude, 90)
+        )
+
+    ratio = math.sin(angle) / math.cos(math.radians(form.latitude))
+    if ratio >= 1:
+        return building.c.latitude.between(min_latitude, max_latitude)
+
+    delta = math.degrees(math.asin(ratio))
+    min_longitude, max_longitude = form.longitude - delta, form.longitude + delta
+    if min_longitude < -180:
+        min_longitude += 360
+    if max_longitude > 180:
+        max_longitude -= 360
+    return and_(
+        building.c.latitude.between(min_latitude, max_latitude),
+        longitude_between(min_longitude, max_longitude),
+    )
+
+
+def distance_km(form: GeoForm) -> ColumnElement:
+    """
+    Haversine distance from the point of the form to the building.
+    """
+    latitude = func.radians(cast(building.c.latitude, Float))
+    longitude = func.radians(cast(building.c.longitude, Float))
+    origin_latitude = math.radians(form.latitude)
+    origin_longitude = math.radians(form.longitude)
+    haversine = func.power(func.sin((latitude - origin_latitude) / 2), 2) + (
+        math.cos(origin_latitude)
+        * func.cos(latitude)
+        * func.power(func.sin((longitude - origin_longitude) / 2), 2)
+    )
+    return 2 * EARTH_RADIUS_KM * func.asin(func.least(1.0, func.sqrt(haversine)))
+
+
+def geo_filters(form: GeoForm) -> List[ColumnElement]:
+    """
+    Conditions on building for the point and box searches of the form.
+    """
+    filters = list()
+    if form.has_point:
+        filters += [point_bounding_box(form), distance_km(form) <= form.radius]
+    if form.has_box:
+        filters += [
+            building.c.latitude.between(form.min_latitude, form.max_latitude),
+            longitude_between(form.min_longitude, form.max_longitude),
+        ]
+    return filters
+
+
+def tile_bounds(zoom: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """
+    (min_latitude, max_latitude, min_longitude, max_longitude) of a tile. At
+    `zoom` the world is split into 2 ** zoom by 2 ** zoom tiles of equal
+    angles, x growing eastward from -180 and y northward from -90.
+    """
+    width, height = 360 / 2**zoom, 180 / 2**zoom
+    return (
+        -90 + y * height,
+        -90 + (y + 1) * height,
+        -180 + x * width,
+        -180 + (x + 1) * width,
+    )
+
+
+def box_tiles(
+    zoom: int,
+    *,
+    min_latitude: float,
+    max_latitude: float,
+    min_longitude: float,
+    max_longitude: float,
+) -> List[Tuple[int, int]]:
+    """
+    (x, y) of the tiles overlapping the box, which may cross the antimeridian.
+    """
+    count = 2**zoom
+
+    def index(value: float, low: float, span: float) -> int:
+        return min(int((value - low) / span * count), count - 1)
+
+    min_x, max_x = index(min_longitude, -180, 360), index(max_longitude, -180, 360)
+    min_y, max_y = index(min_latitude, -90, 180), index(max_latitude, -90, 180)
+    if min_x <= max_x:
+        xs = list(range(min_x, max_x + 1))
+    else:
+        xs = list(range(min_x, count)) + list(range(0, max_x + 1))
+    return [(x, y) for x in xs for y in range(min_y, max_y + 1)]
+
+
+def tile_filters(
+    min_latitude: float, max_latitude: float, min_longitude: float, max_longitude: float
+) -> List[ColumnElement]:
+    """
+    Buildings of a tile, its north and east edges belong to the next tile
+    except at the edges of the world.
+    """
+    return [
+        building.c.latitude >= min_latitude,
+        building.c.latitude < max_latitude
+        if max_latitude < 90
+        else building.c.latitude <= max_latitude,
+        building.c.longitude >= min_longitude,
+        building.c.longitude < max_longitude
+        if max_longitude < 180
+        else building.c.longitude <= max_longitude,
+    ]
@@ -0,0 +1,25 @@
+"""
+Full-text conditions on the generated `search_vector` columns.
+
+The match is served by the GIN index on the column, the rank is only computed
+for the matching rows.
+"""
+from sqlalchemy import Column, Float, func, literal_column
+from sqlalchemy.sql import ColumnElement
+
+from app.schemas.building import SearchForm
+
+# Must be the configuration the search_vector columns are generated with
+TEXT_SEARCH_CONFIG = literal_column("'english'::regconfig")
+
+
+def text_query(form: SearchForm) -> ColumnElement:
+    return func.websearch_to_tsquery(TEXT_SEARCH_CONFIG, form.q)
+
+
+def text_filter(search_vector: Column, form: SearchForm) -> ColumnElement:
+    return search_vector.op("@@")(text_query(form))
+
+
+def text_rank(search_vector: Column, form: SearchForm) -> ColumnElement:
+    return func.ts_rank(search_vector, text_query(form), type_=Float)
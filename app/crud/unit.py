@@ -1,97 +1,719 @@
-from typing import Any, Dict, List, Union
+import logging
+from datetime import datetime
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 from databases import Database
-from sqlalchemy import delete
+from sqlalchemy import (
+    Integer,
+    and_,
+    any_,
+    case,
+    cast,
+    delete,
+    func,
+    literal,
+    literal_column,
+    null,
+    or_,
+    select,
+    true,
+    tuple_,
+    union_all,
+)
+from sqlalchemy.dialects.postgresql import (
+    ARRAY,
+    aggregate_order_by,
+    array,
+    array_agg,
+    insert,
+)
+from sqlalchemy.sql import ColumnElement, Select
+from sqlalchemy.sql.elements import Label
 
-from app.crud.base import CRUDBase
-from app.models import amenity, unit, unit_amenities
-from app.schemas.unit import UnitForm, UnitIn, UnitUpdate
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.crud import unit_engine
+from app.crud.amenity_index import AmenityIndex
+from app.crud.base import CRUDBase, array_param, count_rows, decode_cursor, paginate
+from app.crud.geo import distance_km, geo_filters
+from app.crud.text import text_filter, text_rank
+from app.crud.unit_engine import UnitSearchEngine
+from app.models import amenity, building, unit, unit_amenities
+from app.schemas import BatchItemResult
+from app.schemas.unit import AmenityMatch, UnitForm, UnitIn, UnitSort, UnitUpdate
+
+logger = logging.getLogger(__name__)
+
+# Columns counted by facets_query besides the amenities
+FACET_COLUMNS = ("price", "square", "bedrooms", "bathrooms")
+
+
+def facets_cache_key(
+    form: UnitForm, *, price_bucket: float, square_bucket: float
+) -> Tuple[Any, ...]:
+    """
+    Forms differing only in the order or repetition of amenities share facets.
+    """
+    data = form.dict(exclude={"sort"})
+    for name in ("amenities", "exclude_amenities"):
+        data[name] = tuple(sorted(set(data[name] or [])))
+    return (price_bucket, square_bucket, *sorted(data.items()))
+
+
+def bucket_size(column: ColumnElement, size: float) -> ColumnElement:
+    """
+    Smallest multiple of `size` splitting the range of the column into at most
+    FACET_MAX_BUCKETS buckets.
+    """
+    spread = func.floor(func.max(column) / size) - func.floor(func.min(column) / size)
+    # spread + 1 buckets of `size` make at most ceil(spread / k) + 1 buckets of
+    # k times `size`
+    return size * func.greatest(func.ceil(spread / (settings.FACET_MAX_BUCKETS - 1)), 1)
 
 
 class CRUDUnit(CRUDBase[type(unit), UnitIn, UnitUpdate]):
+    def __init__(self, model: Any):
+        super().__init__(model)
+        self.facets_cache = TTLCache(
+            maxsize=settings.FACETS_CACHE_MAX_SIZE,
+            ttl=settings.FACETS_CACHE_TTL_SECONDS,
+        )
+        self.engine: Optional[UnitSearchEngine] = None
+        if settings.UNIT_SEARCH_ENGINE:
+            if unit_engine.is_available():
+                self.engine = UnitSearchEngine(
+                    refresh_seconds=settings.UNIT_SEARCH_ENGINE_REFRESH_SECONDS
+                )
+            else:
+                logger.warning("UNIT_SEARCH_ENGINE needs numpy, searching Postgres")
+        self.amenity_index: Optional[AmenityIndex] = None
+        if settings.AMENITY_INDEX:
+            self.amenity_index = AmenityIndex(
+                refresh_seconds=settings.AMENITY_INDEX_REFRESH_SECONDS
+            )
+
+    def touch(self, model_ids: Iterable[int]) -> None:
+        """
+        Have the search engine and the amenity index re-read written units
+        before the next search.
+        """
+        model_ids = list(model_ids)
+        if self.engine is not None:
+            self.engine.touch(model_ids)
+        if self.amenity_index is not None:
+            self.amenity_index.touch(model_ids)
+
     async def search(
-        self, db: Database, *, form: UnitForm, skip: int = 0, limit: int = 100
+        self,
+        db: Database,
+        *,
+        form: UnitForm,
+        skip: int = 0,
+        limit: int = 100,
+        cursor: Optional[str] = None,
     ) -> List[Any]:
-        query = (
-            self.model.select()
-            .offset(skip)
-            .limit(limit)
-            .where(
-                form.min_price <= self.model.c.price,
-                self.model.c.price <= form.max_price,
-                form.min_square <= self.model.c.square,
-                self.model.c.square <= form.max_square,
-                form.min_bedrooms <= self.model.c.bedrooms,
-                self.model.c.bedrooms <= form.max_bedrooms,
-                form.min_bathrooms <= self.model.c.bathrooms,
-                self.model.c.bathrooms <= form.max_bathrooms,
+        if self.engine is not None and self.engine.supports(form):
+            await self.engine.refresh(db)
+            # Postgres answers while another search loads the engine
+            if self.engine.is_loaded:
+                return await self.search_engine(
+                    db, form=form, skip=skip, limit=limit, cursor=cursor
+                )
+
+        candidates = await self.amenity_candidates(db, form=form)
+        return await db.fetch_all(
+            query=self.search_query(
+                form=form, skip=skip, limit=limit, cursor=cursor, candidates=candidates
             )
         )
 
-        if form.amenities:
-            q = unit_amenities.select().where(
-                unit_amenities.c.amenity_id.in_(form.amenities)
+    async def search_total(self, db: Database, *, form: UnitForm) -> Tuple[int, bool]:
+        """
+        Number of units matching the form and whether it is exact.
+        """
+        candidates = await self.amenity_candidates(db, form=form)
+        return await count_rows(
+            db,
+            self.search_query(form=form, candidates=candidates),
+            exact_limit=settings.EXACT_COUNT_LIMIT,
+        )
+
+    async def amenity_candidates(
+        self, db: Database, *, form: UnitForm
+    ) -> Optional[ColumnElement]:
+        """
+        Filter on the units which may have the wanted amenities, None when
+        there is no index or it finds too many of them. Besides the units of
+        the index, those changed since its last refresh are kept, they may
+        have been linked by another process meanwhile.
+        """
+        if self.amenity_index is None or not form.amenities:
+            return None
+        await self.amenity_index.refresh(db)
+        found = self.amenity_index.candidates(
+            amenities=form.amenities, match=form.match
+        )
+        # A long id list costs Postgres more than the amenity filters
+        if len(found) > settings.AMENITY_INDEX_MAX_CANDIDATES:
+            return None
+        return or_(
+            self.model.c.id == any_(array_param(list(found), Integer())),
+            self.model.c.updated_at >= self.amenity_index.watermark,
+        )
+
+    async def search_engine(
+        self,
+        db: Database,
+        *,
+        form: UnitForm,
+        skip: int,
+        limit: int,
+        cursor: Optional[str],
+    ) -> List[Any]:
+        """
+        Page found by the search engine, in id order like search_query
+        returns it. The units up to the end of the page are read back from
+        Postgres with the filters of the form, together with the units in
+        that id range changed since the engine last read them.
+        """
+        after_id = None
+        if cursor is not None:
+            (after_id,) = decode_cursor(cursor, keys=self.sort_keys)
+        while True:
+            ids = self.engine.search(
+                form, skip=0, limit=skip + limit, after_id=after_id
+            )
+            changed = [self.model.c.updated_at >= self.engine.watermark]
+            if after_id is not None:
+                changed.append(self.model.c.id > after_id)
+            if len(ids) == skip + limit:
+                changed.append(self.model.c.id <= ids[-1])
+            records = await db.fetch_all(
+                self.model.select()
+                .where(
+                    *self.search_filters(form=form),
+                    or_(
+                        self.model.c.id == any_(array_param(ids, Integer())),
+                        and_(*changed),
+                    ),
+                )
+                .order_by(self.model.c.id)
             )
-            amenities = await db.fetch_all(query=q)
+            # Units changed or deleted elsewhere no longer match, they are
+            # re-read and the page is searched again
+            stale = set(ids) - {record.id for record in records}
+            if not stale:
+                return records[skip : skip + limit]
+            self.engine.touch(stale)
+            await self.engine.refresh(db)
 
-            query = query.where(
-                self.model.c.id.in_((record.unit_id for record in amenities))
+    def price_per_square(self) -> ColumnElement:
+        """
+        NULL for units without a square. Written like the expression of
+        ix_unit_price_per_square_id, with a literal 0, so the index is used.
+        """
+        return self.model.c.price / func.nullif(
+            self.model.c.square, literal_column("0")
+        )
+
+    def search_keys(self, *, form: UnitForm) -> List[ColumnElement]:
+        if form.sort == UnitSort.newest:
+            return self.sort_keys
+        if form.sort is not None:
+            # Each sort has an index led by its key and ended by id
+            name = form.sort.value.lstrip("-")
+            if name == "price_per_square":
+                key = self.price_per_square().label(name)
+            else:
+                key = self.model.c[name]
+            return [key, self.model.c.id]
+        if form.has_point:
+            return [distance_km(form).label("distance"), self.model.c.id]
+        if form.has_text:
+            # Paged in descending order, best matches first
+            rank = text_rank(self.model.c.search_vector, form).label("rank")
+            return [rank, self.model.c.id]
+        return self.sort_keys
+
+    def search_descending(self, *, form: UnitForm) -> bool:
+        if form.sort is not None:
+            return form.sort.descending
+        return form.has_text and not form.has_point
+
+    def search_query(
+        self,
+        *,
+        form: UnitForm,
+        skip: int = 0,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        candidates: Optional[ColumnElement] = None,
+    ) -> Select:
+        keys = self.search_keys(form=form)
+        query = self.model.select().where(
+            *self.search_filters(form=form, candidates=candidates)
+        )
+        # Computed sort keys come back with the units for the next cursor
+        query = query.add_columns(*(key for key in keys if isinstance(key, Label)))
+
+        if form.has_point and form.sort is None:
+            # Sorted by the distance to the building
+            query = query.select_from(
+                self.model.join(building, building.c.id == self.model.c.building_id)
+            ).where(*geo_filters(form))
+        elif form.has_point or form.has_box:
+            query = query.where(self.buildings_filter(form=form))
+
+        return paginate(
+            query,
+            keys=keys,
+            skip=skip,
+            limit=limit,
+            cursor=cursor,
+            descending=self.search_descending(form=form),
+        )
+
+    def search_filters(
+        self, *, form: UnitForm, candidates: Optional[ColumnElement] = None
+    ) -> List[ColumnElement]:
+        """
+        Conditions of the form on the unit itself. With `candidates` from
+        amenity_candidates only those units are read, the amenity filters
+        still check them against amenity_ids.
+        """
+        filters = [
+            form.min_price <= self.model.c.price,
+            self.model.c.price <= form.max_price,
+            form.min_square <= self.model.c.square,
+            self.model.c.square <= form.max_square,
+            form.min_bedrooms <= self.model.c.bedrooms,
+            self.model.c.bedrooms <= form.max_bedrooms,
+            form.min_bathrooms <= self.model.c.bathrooms,
+            self.model.c.bathrooms <= form.max_bathrooms,
+        ]
+        if candidates is not None:
+            filters.append(candidates)
+        if form.amenities:
+            filters.append(
+                self.amenities_filter(amenities=form.amenities, match=form.match)
             )
+        if form.exclude_amenities:
+            filters.append(
+                ~self.amenities_filter(
+                    amenities=form.exclude_amenities, match=AmenityMatch.any
+                )
+            )
+        if form.has_text:
+            filters.append(text_filter(self.model.c.search_vector, form))
+        if form.sort in (UnitSort.price_per_square, UnitSort.price_per_square_desc):
+            filters.append(self.price_per_square().isnot(None))
+        return filters
 
-        return await db.fetch_all(query=query)
+    def buildings_filter(self, *, form: UnitForm) -> ColumnElement:
+        """
+        Units of the buildings inside the radius or the bounding box.
+        """
+        return self.model.c.building_id.in_(
+            select(building.c.id).where(*geo_filters(form))
+        )
 
-    async def get_unit_amenities(self, db: Database, *, model_id: int) -> Any:
-        amenities = await db.fetch_all(
-            unit_amenities.select().where(unit_amenities.c.unit_id == model_id)
+    async def get_facets(
+        self,
+        db: Database,
+        *,
+        form: UnitForm,
+        price_bucket: float,
+        square_bucket: float,
+    ) -> List[Any]:
+        """
+        Facet counts of the form, computed once per cache period.
+        """
+        key = facets_cache_key(
+            form, price_bucket=price_bucket, square_bucket=square_bucket
         )
+        facets = self.facets_cache.get(key)
+        if facets is None:
+            candidates = await self.amenity_candidates(db, form=form)
+            facets = await db.fetch_all(
+                self.facets_query(
+                    form=form,
+                    price_bucket=price_bucket,
+                    square_bucket=square_bucket,
+                    candidates=candidates,
+                )
+            )
+            self.facets_cache.set(key, facets)
+        return facets
+
+    def facets_query(
+        self,
+        *,
+        form: UnitForm,
+        price_bucket: float,
+        square_bucket: float,
+        candidates: Optional[ColumnElement] = None,
+    ) -> Select:
+        """
+        (facet, value, count, size) rows: the total, the units per price and
+        square bucket of `size` starting at `value`, bedrooms and bathrooms in
+        one grouping sets pass over the matching units, then the units per
+        amenity id. The matching units are read once, the CTE being
+        referenced several times is materialized.
+        """
+        # Sorting by price per square leaves out units without a square,
+        # facets count them whatever the sort, as their cache key does
+        filters = self.search_filters(
+            form=form.copy(update=dict(sort=None)), candidates=candidates
+        )
+        if form.has_point or form.has_box:
+            filters.append(self.buildings_filter(form=form))
+        matched = (
+            select(
+                self.model.c.price,
+                self.model.c.square,
+                self.model.c.bedrooms,
+                self.model.c.bathrooms,
+                self.model.c.amenity_ids,
+            )
+            .where(*filters)
+            .cte("matched")
+        )
+        sizes = select(
+            bucket_size(matched.c.price, price_bucket).label("price"),
+            bucket_size(matched.c.square, square_bucket).label("square"),
+        ).cte("sizes")
+        bucketed = (
+            select(
+                *(
+                    (func.floor(matched.c[name] / sizes.c[name]) * sizes.c[name]).label(
+                        name
+                    )
+                    for name in ("price", "square")
+                ),
+                matched.c.bedrooms,
+                matched.c.bathrooms,
+                sizes.c.price.label("price_size"),
+                sizes.c.square.label("square_size"),
+            )
+            .select_from(matched.join(sizes, true()))
+            .subquery()
+        )
+        columns = [bucketed.c[name] for name in FACET_COLUMNS]
+        facet = case(
+            *((func.grouping(column) == 0, literal(column.name)) for column in columns),
+            else_=literal("total"),
+        )
+        size = case(
+            *(
+                (
+                    func.grouping(bucketed.c[name]) == 0,
+                    func.max(bucketed.c[f"{name}_size"]),
+                )
+                for name in ("price", "square")
+            ),
+            else_=null(),
+        )
+        grouped = select(
+            facet.label("facet"),
+            func.coalesce(*columns).label("value"),
+            func.count().label("count"),
+            size.label("size"),
+        ).group_by(func.grouping_sets(tuple_(), *columns))
+
+        amenity_ids = select(
+            func.unnest(matched.c.amenity_ids).label("amenity_id")
+        ).subquery()
+        amenities = select(
+            literal("amenities"),
+            amenity_ids.c.amenity_id,
+            func.count(),
+            null(),
+        ).group_by(amenity_ids.c.amenity_id)
+        return union_all(grouped, amenities)
+
+    def amenities_filter(self, *, amenities: List[int], match: AmenityMatch) -> Any:
+        """
+        Containment (all) or overlap (any) of the amenity_ids array, served by
+        its GIN index and combined with the indexes of the range filters.
+        """
+        # An array of separate parameters, unlike array_param it can be
+        # rendered with its values, e.g. to explain the query
+        amenity_ids = cast(array(sorted(set(amenities))), ARRAY(Integer()))
+        if match == AmenityMatch.all:
+            return self.model.c.amenity_ids.contains(amenity_ids)
+        return self.model.c.amenity_ids.overlap(amenity_ids)
+
+    async def get_unit_amenities(self, db: Database, *, model_id: int) -> List[Any]:
         return await db.fetch_all(
-            amenity.select().where(
-                amenity.c.id.in_([record.amenity_id for record in amenities])
+            select(amenity.c.id, amenity.c.name)
+            .select_from(
+                unit_amenities.join(
+                    amenity, amenity.c.id == unit_amenities.c.amenity_id
+                )
+            )
+            .where(unit_amenities.c.unit_id == model_id)
+            .order_by(amenity.c.id)
+        )
+
+    def amenity_names_column(self) -> Any:
+        """
+        Names of the amenities of the selected unit in the order of its
+        amenity_ids, so a unit and its amenities come back in one statement.
+        """
+        return (
+            select(array_agg(aggregate_order_by(amenity.c.name, amenity.c.id)))
+            .where(amenity.c.id == any_(self.model.c.amenity_ids))
+            .scalar_subquery()
+            .label("amenity_names")
+        )
+
+    def export_query(self) -> Select:
+        return select(*self.stored_columns, self.amenity_names_column()).order_by(
+            self.model.c.id
+        )
+
+    def snapshot_query(self, *, since: Optional[datetime] = None) -> Select:
+        """
+        Units with the attributes of their building as `building_*` columns and
+        their amenity ids. With `since` only units changed from then, or whose
+        building changed.
+        """
+        building_columns = [
+            column.label(f"building_{column.name}")
+            for column in building.c
+            if column.name != "id" and column.computed is None
+        ]
+        query = (
+            select(*self.stored_columns, *building_columns)
+            .select_from(
+                self.model.join(building, building.c.id == self.model.c.building_id)
             )
+            .order_by(self.model.c.id)
         )
+        if since is not None:
+            query = query.where(
+                or_(self.model.c.updated_at >= since, building.c.updated_at >= since)
+            )
+        return query
+
+    async def get_with_amenities(self, db: Database, *, model_id: int) -> Any:
+        return await db.fetch_one(
+            select(self.model, self.amenity_names_column()).where(
+                self.model.c.id == model_id
+            )
+        )
+
+    async def get_units_amenities(
+        self, db: Database, *, unit_records: Sequence[Any]
+    ) -> Dict[int, List[Any]]:
+        """
+        Amenities of a page of units by unit id. The ids come with the units,
+        only the names of the distinct amenities are read.
+        """
+        amenity_ids = {id_ for record in unit_records for id_ in record.amenity_ids}
+        if not amenity_ids:
+            return dict()
+
+        records = await db.fetch_all(
+            select(amenity.c.id, amenity.c.name).where(
+                amenity.c.id == any_(array_param(sorted(amenity_ids), Integer()))
+            )
+        )
+        names = {record["id"]: record["name"] for record in records}
+        return {
+            record.id: [
+                dict(id=id_, name=names[id_])
+                for id_ in record.amenity_ids
+                if id_ in names
+            ]
+            for record in unit_records
+        }
 
     async def delete_unit_amenities(self, db: Database, *, model_id: int) -> None:
         await db.execute(
             delete(unit_amenities).where(unit_amenities.c.unit_id == model_id)
         )
+        self.touch([model_id])
 
     async def add_amenities_to_unit(
+        self, db: Database, *, model_id: int, amenities: Iterable[int]
+    ) -> None:
+        await self.add_units_amenities(
+            db, links=[(model_id, amenity_id) for amenity_id in amenities]
+        )
+
+    async def add_units_amenities(
+        self, db: Database, *, links: Iterable[Tuple[int, int]]
+    ) -> None:
+        """
+        Link (unit_id, amenity_id) pairs with one INSERT, skipping existing links.
+        """
+        links = set(links)
+        if not links:
+            return
+
+        unit_ids, amenity_ids = zip(*links)
+        await db.execute(
+            insert(unit_amenities)
+            .from_select(
+                ["unit_id", "amenity_id"],
+                select(
+                    func.unnest(array_param(unit_ids, Integer())),
+                    func.unnest(array_param(amenity_ids, Integer())),
+                ),
+            )
+            .on_conflict_do_nothing()
+        )
+        # The links are re-read rather than added, they may still be rolled back
+        self.touch(unit_ids)
+
+    async def sync_unit_amenities(
         self, db: Database, *, model_id: int, amenities: List[int]
     ) -> None:
-        values = list()
-        for amenity_id in amenities:
-            values.append(dict(amenity_id=amenity_id, unit_id=model_id))
+        """
+        Replace the amenities of a unit, touching only the links that differ.
+        """
+        await self.sync_units_amenities(db, amenities={model_id: amenities})
 
-        await db.execute_many(unit_amenities.insert(), values=values)
+    async def sync_units_amenities(
+        self, db: Database, *, amenities: Mapping[int, List[int]]
+    ) -> None:
+        if not amenities:
+            return
+
+        links = [
+            (model_id, amenity_id)
+            for model_id, amenity_ids in amenities.items()
+            for amenity_id in amenity_ids
+        ]
+        kept = select(
+            func.unnest(array_param([link[0] for link in links], Integer())),
+            func.unnest(array_param([link[1] for link in links], Integer())),
+        )
+        await db.execute(
+            delete(unit_amenities).where(
+                unit_amenities.c.unit_id
+                == any_(array_param(list(amenities), Integer())),
+                tuple_(unit_amenities.c.unit_id, unit_amenities.c.amenity_id).not_in(
+                    kept
+                ),
+            )
+        )
+        self.touch(list(amenities))
+        await self.add_units_amenities(db, links=links)
 
     async def create(self, db: Database, *, obj_in: UnitIn) -> Any:
         obj_in_data = obj_in.dict(exclude_unset=True, exclude={"amenities"})
-        db_query = self.model.insert().values(**obj_in_data)
-        obj_id = await db.execute(db_query)
-
-        await self.add_amenities_to_unit(
-            db, amenities=obj_in.amenities, model_id=obj_id
-        )
+        async with db.transaction():
+            obj = await db.fetch_one(
+                self.model.insert().values(**obj_in_data).returning(*self.model.c)
+            )
+            if obj_in.amenities:
+                await self.add_amenities_to_unit(
+                    db, model_id=obj.id, amenities=obj_in.amenities
+                )
 
-        return await self.get(db=db, model_id=obj_id)
+        self.touch([obj.id])
+        return obj
 
-    async def update(
-        self, db: Database, *, db_obj: Any, obj_in: Union[UnitIn, Dict[str, Any]]
-    ) -> Any:
+    async def update_by_id(
+        self,
+        db: Database,
+        *,
+        model_id: Any,
+        obj_in: Union[UnitUpdate, Dict[str, Any]],
+    ) -> Optional[Any]:
         if isinstance(obj_in, dict):
-            update_data = obj_in
-            del update_data["amenities"]
+            update_data = {k: v for k, v in obj_in.items() if k != "amenities"}
+            amenities = obj_in.get("amenities")
         else:
             update_data = obj_in.dict(exclude_unset=True, exclude={"amenities"})
+            amenities = obj_in.amenities
 
-        amenities = obj_in.amenities
-        if amenities:
-            await self.delete_unit_amenities(db, model_id=db_obj.id)
-            await self.add_amenities_to_unit(
-                db, amenities=amenities, model_id=db_obj.id
-            )
+        async with db.transaction():
+            obj = await super().update_by_id(db, model_id=model_id, obj_in=update_data)
+            # Missing amenities leave the links as they are, a list replaces them
+            if obj and amenities is not None:
+                await self.sync_unit_amenities(
+                    db, model_id=model_id, amenities=amenities
+                )
+
+        if obj:
+            self.touch([obj.id])
+        return obj
+
+    async def remove(self, db: Database, *, model_id: Any) -> Optional[Any]:
+        obj = await super().remove(db, model_id=model_id)
+        if obj:
+            self.touch([obj.id])
+        return obj
+
+    async def run_batch(
+        self,
+        db: Database,
+        *,
+        items: Sequence[Any],
+        write: Callable[[Database, Sequence[Any]], Awaitable[List[Any]]],
+    ) -> List[BatchItemResult]:
+        results = await super().run_batch(db, items=items, write=write)
+        # Touched once committed, a search in between would read the old rows
+        self.touch(result.id for result in results if result.ok)
+        return results
 
-        return await super().update(db, db_obj=db_obj, obj_in=update_data)
+    async def create_batch(
+        self, db: Database, objs_in: Sequence[UnitIn]
+    ) -> List[Mapping]:
+        records = await self.insert_rows(
+            db,
+            rows=[
+                obj_in.dict(exclude_unset=True, exclude={"amenities"})
+                for obj_in in objs_in
+            ],
+        )
+        await self.add_units_amenities(
+            db,
+            links=[
+                (record.id, amenity_id)
+                for record, obj_in in zip(records, objs_in)
+                for amenity_id in obj_in.amenities or []
+            ],
+        )
+        return records
+
+    async def update_batch(
+        self,
+        db: Database,
+        objs_in: Sequence[Union[UnitUpdate, Dict[str, Any]]],
+    ) -> List[Optional[Mapping]]:
+        rows, amenities = list(), list()
+        for obj_in in objs_in:
+            if not isinstance(obj_in, dict):
+                obj_in = obj_in.dict(exclude_unset=True)
+            rows.append({k: v for k, v in obj_in.items() if k != "amenities"})
+            amenities.append(obj_in.get("amenities"))
+
+        records = await self.update_rows(db, rows=rows)
+        await self.sync_units_amenities(
+            db,
+            amenities={
+                record.id: amenity_ids
+                for record, amenity_ids in zip(records, amenities)
+                if record and amenity_ids is not None
+            },
+        )
+        return records
 
 
 unit = CRUDUnit(unit)
@@ -0,0 +1,347 @@
+"""
+In-process columnar engine answering unit searches.
+
+Unit attributes are kept as NumPy arrays ordered by id, with one bit per
+amenity in a bitmap. The filters of a search are evaluated as vectorized
+boolean masks and only the ids of the requested page are then read from
+Postgres. Units written through `crud.unit` are re-read before the next
+search, changes made elsewhere (other processes, imports) are picked up
+through `unit.updated_at` every `refresh_seconds`. Meanwhile CRUDUnit checks
+the page against Postgres, see CRUDUnit.search_engine. NumPy is an optional
+dependency, only needed here.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Set
+
+from databases import Database
+from sqlalchemy import Integer, any_, or_, select
+from sqlalchemy.sql import Select
+
+from app.crud.base import array_param
+from app.models import unit
+from app.schemas.unit import AmenityMatch, UnitForm
+from app.services.snapshot import snapshot_watermark
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+# Rows loaded per chunk and rows masked at a time, a page is usually found
+# in the first block
+LOAD_CHUNK_ROWS = 10_000
+SEARCH_BLOCK_ROWS = 65_536
+
+# (form field, column, comparison) of the range filters
+RANGE_FILTERS = [
+    ("min_price", "price", "ge"),
+    ("max_price", "price", "le"),
+    ("min_square", "square", "ge"),
+    ("max_square", "square", "le"),
+    ("min_bedrooms", "bedrooms", "ge"),
+    ("max_bedrooms", "bedrooms", "le"),
+    ("min_bathrooms", "bathrooms", "ge"),
+    ("max_bathrooms", "bathrooms", "le"),
+]
+
+
+def is_available() -> bool:
+    return numpy is not None
+
+
+def column_types() -> Dict[str, Any]:
+    return dict(
+        id=numpy.int64,
+        price=numpy.float64,
+        square=numpy.float64,
+        bedrooms=numpy.int32,
+        bathrooms=numpy.int32,
+        building_id=numpy.int64,
+        alive=numpy.bool_,
+    )
+
+
+class UnitSearchEngine:
+    def __init__(self, *, refresh_seconds: float) -> None:
+        self.refresh_seconds = refresh_seconds
+        self.size = 0
+        self.columns: Dict[str, Any] = {
+            name: numpy.zeros(0, dtype=dtype) for name, dtype in column_types().items()
+        }
+        # One bit per amenity, in the order amenities were first seen
+        self.amenity_bits: Dict[int, int] = dict()
+        self.bitmap = numpy.zeros((0, 1), dtype=numpy.uint64)
+        # Units written by this process, re-read before the next search
+        self.dirty: Set[int] = set()
+        self.watermark: Optional[datetime] = None
+        self.refreshed_at: Optional[float] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.refreshed_at is not None
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        # Created in the running loop, before Python 3.10 a lock is bound to
+        # the loop current when it is created
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    @property
+    def capacity(self) -> int:
+        return len(self.columns["id"])
+
+    @property
+    def ids(self) -> Any:
+        return self.columns["id"][: self.size]
+
+    def supports(self, form: UnitForm) -> bool:
+        """
+        Geo and text filters, unset range bounds (which match nothing in SQL)
+        and sorts other than by id are left to Postgres.
+        """
+        if form.sort is not None:
+            return False
+        return not (form.has_point or form.has_box or form.has_text) and all(
+            getattr(form, field) is not None for field, _, _ in RANGE_FILTERS
+        )
+
+    def memory_bytes(self) -> int:
+        return self.bitmap.nbytes + sum(
+            values.nbytes for values in self.columns.values()
+        )
+
+    def stats(self) -> Dict[str, int]:
+        return dict(
+            units=int(self.columns["alive"][: self.size].sum()),
+            amenities=len(self.amenity_bits),
+            memory_bytes=self.memory_bytes(),
+        )
+
+    def touch(self, model_ids: Iterable[int]) -> None:
+        self.dirty.update(model_ids)
+
+    def query(
+        self,
+        *,
+        model_ids: Optional[Sequence[int]] = None,
+        since: Optional[datetime] = None,
+    ) -> Select:
+        """
+        Units with their amenity ids, all of them unless restricted to
+        `model_ids` or to the units changed `since`.
+        """
+        conditions = list()
+        if model_ids:
+            conditions.append(unit.c.id == any_(array_param(model_ids, Integer())))
+        if since is not None:
+            conditions.append(unit.c.updated_at >= since)
+
+        query = select(
+            *(unit.c[name] for name in column_types() if name != "alive"),
+            unit.c.amenity_ids,
+        ).order_by(unit.c.id)
+        return query.where(or_(*conditions)) if conditions else query
+
+    async def refresh(self, db: Database) -> None:
+        """
+        Load all units on first use, later the units written by this process
+        and, every `refresh_seconds`, those changed since the last refresh.
+        A refresh in progress is awaited, except for the first load, during
+        which searches are left to Postgres.
+        """
+        if self.lock.locked() and not self.is_loaded:
+            return
+        async with self.lock:
+            await self.refresh_locked(db)
+
+    async def refresh_locked(self, db: Database) -> None:
+        started = time.monotonic()
+        due = (
+            self.refreshed_at is None
+            or started - self.refreshed_at >= self.refresh_seconds
+        )
+        if not due and not self.dirty:
+            return
+
+        dirty, self.dirty = self.dirty, set()
+        try:
+            watermark = self.watermark
+            if due:
+                watermark = await snapshot_watermark(db, previous=self.watermark)
+            if not self.is_loaded:
+                query = self.query()
+            elif due:
+                query = self.query(model_ids=sorted(dirty), since=self.watermark)
+            else:
+                query = self.query(model_ids=sorted(dirty))
+
+            chunk: List[Mapping] = list()
+            read: Set[int] = set()
+            async for record in db.iterate(query):
+                chunk.append(record)
+                read.add(record["id"])
+                if len(chunk) >= LOAD_CHUNK_ROWS:
+                    self.upsert(chunk)
+                    chunk = list()
+            self.upsert(chunk)
+            # Dirty units which were not read back were deleted
+            self.remove(dirty - read)
+        except BaseException:
+            self.dirty |= dirty
+            raise
+
+        if not self.is_loaded:
+            logger.info("Unit search engine loaded: %s", self.stats())
+        if due:
+            self.watermark, self.refreshed_at = watermark, started
+
+    def reserve(self, size: int) -> None:
+        if size <= self.capacity:
+            return
+        capacity = max(size, 2 * self.capacity, 1024)
+        for name, values in self.columns.items():
+            grown = numpy.zeros(capacity, dtype=values.dtype)
+            grown[: self.size] = values[: self.size]
+            self.columns[name] = grown
+        bitmap = numpy.zeros((capacity, self.bitmap.shape[1]), dtype=numpy.uint64)
+        bitmap[: self.size] = self.bitmap[: self.size]
+        self.bitmap = bitmap
+
+    def amenity_bit(self, amenity_id: int) -> int:
+        """
+        Bit of the amenity, a new amenity gets the next one.
+        """
+        bit = self.amenity_bits.get(amenity_id)
+        if bit is None:
+            bit = self.amenity_bits[amenity_id] = len(self.amenity_bits)
+            if bit >= 64 * self.bitmap.shape[1]:
+                self.bitmap = numpy.hstack(
+                    [self.bitmap, numpy.zeros((self.capacity, 1), numpy.uint64)]
+                )
+        return bit
+
+    def bitmap_rows(self, rows: Any, bits: Any, *, count: int) -> Any:
+        bitmap = numpy.zeros((count, self.bitmap.shape[1]), dtype=numpy.uint64)
+        bits = numpy.asarray(bits, dtype=numpy.uint64)
+        numpy.bitwise_or.at(
+            bitmap,
+            (numpy.asarray(rows, dtype=numpy.intp), (bits // 64).astype(numpy.intp)),
+            numpy.left_shift(numpy.uint64(1), bits % numpy.uint64(64)),
+        )
+        return bitmap
+
+    def amenity_mask(self, amenity_ids: Iterable[int]) -> Any:
+        """
+        Bitmap row of the amenities, amenities no unit has are left out.
+        """
+        bits = [self.amenity_bits[a] for a in amenity_ids if a in self.amenity_bits]
+        return self.bitmap_rows([0] * len(bits), bits, count=1)[0]
+
+    def upsert(self, records: Sequence[Mapping]) -> None:
+        if not records:
+            return
+        rows: Dict[str, Any] = {
+            name: numpy.array([record[name] for record in records], dtype=dtype)
+            for name, dtype in column_types().items()
+            if name != "alive"
+        }
+        link_rows, link_bits = list(), list()
+        for row, record in enumerate(records):
+            for amenity_id in record["amenity_ids"] or ():
+                link_rows.append(row)
+                link_bits.append(self.amenity_bit(amenity_id))
+        bitmap = self.bitmap_rows(link_rows, link_bits, count=len(records))
+
+        positions = numpy.searchsorted(self.ids, rows["id"])
+        existing = positions < self.size
+        existing[existing] = self.ids[positions[existing]] == rows["id"][existing]
+        self.assign(positions[existing], rows, bitmap, existing)
+
+        new = ~existing
+        if not new.any():
+            return
+        new_ids = rows["id"][new]
+        start = self.size
+        self.reserve(self.size + len(new_ids))
+        self.size += len(new_ids)
+        self.assign(numpy.arange(start, self.size), rows, bitmap, new)
+        # New ids are usually the largest ones, otherwise keep the id order
+        if start and new_ids.min() < self.columns["id"][start - 1]:
+            self.sort()
+
+    def assign(
+        self, positions: Any, rows: Dict[str, Any], bitmap: Any, selected: Any
+    ) -> None:
+        for name, values in rows.items():
+            self.columns[name][positions] = values[selected]
+        self.columns["alive"][positions] = True
+        self.bitmap[positions] = bitmap[selected]
+
+    def sort(self) -> None:
+        order = numpy.argsort(self.ids, kind="stable")
+        for name, values in self.columns.items():
+            values[: self.size] = values[: self.size][order]
+        self.bitmap[: self.size] = self.bitmap[: self.size][order]
+
+    def remove(self, model_ids: Iterable[int]) -> None:
+        model_ids = numpy.array(sorted(model_ids), dtype=numpy.int64)
+        if not len(model_ids):
+            return
+        positions = numpy.searchsorted(self.ids, model_ids)
+        found = positions < self.size
+        found[found] = self.ids[positions[found]] == model_ids[found]
+        self.columns["alive"][positions[found]] = False
+
+    def block_mask(self, form: UnitForm, block: slice) -> Any:
+        mask = self.columns["alive"][block].copy()
+        for field, name, comparison in RANGE_FILTERS:
+            values = self.columns[name][block]
+            bound = getattr(form, field)
+            mask &= values >= bound if comparison == "ge" else values <= bound
+
+        if form.amenities:
+            wanted = set(form.amenities)
+            required = self.amenity_mask(wanted)
+            matched = self.bitmap[block] & required
+            if form.match == AmenityMatch.all:
+                # An amenity no unit has cannot be matched by all of them
+                if len(wanted - set(self.amenity_bits)):
+                    mask[:] = False
+                else:
+                    mask &= (matched == required).all(axis=1)
+            else:
+                mask &= matched.any(axis=1)
+        if form.exclude_amenities:
+            excluded = self.amenity_mask(form.exclude_amenities)
+            mask &= ~(self.bitmap[block] & excluded).any(axis=1)
+        return mask
+
+    def search(
+        self, form: UnitForm, *, skip: int, limit: int, after_id: Optional[int]
+    ) -> List[int]:
+        """
+        Ids of one page of the units matching `form`, in id order.
+        """
+        start = 0
+        if after_id is not None:
+            start = int(numpy.searchsorted(self.ids, after_id, side="right"))
+
+        found: List[Any] = list()
+        needed = skip + limit
+        while start < self.size and needed > 0:
+            block = slice(start, min(start + SEARCH_BLOCK_ROWS, self.size))
+            positions = numpy.flatnonzero(self.block_mask(form, block))[:needed]
+            found.append(self.columns["id"][block][positions])
+            needed -= len(positions)
+            start = block.stop
+
+        ids = numpy.concatenate(found) if found else numpy.zeros(0, numpy.int64)
+        return ids[skip : skip + limit].tolist()
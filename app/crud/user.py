@@ -2,13 +2,32 @@ from typing import Any, Dict, Optional, Union
 
 from databases import Database
 
-from app.core.security import get_password_hash, verify_password
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.security import get_password_hash_async, verify_password_async
 from app.crud.base import CRUDBase
 from app.models import user
 from app.schemas.user import UserIn, UserUpdate
 
 
 class CRUDUser(CRUDBase[type(user), UserIn, UserUpdate]):
+    def __init__(self, model: Any):
+        super().__init__(model)
+        self.cache = TTLCache(
+            maxsize=settings.USER_CACHE_MAX_SIZE, ttl=settings.USER_CACHE_TTL_SECONDS
+        )
+
+    async def get_cached(self, db: Database, *, model_id: Any) -> Optional[Any]:
+        """
+        Get user from the in-process cache, on a miss load it from the database.
+        """
+        obj = self.cache.get(model_id)
+        if obj is None:
+            obj = await self.get(db, model_id=model_id)
+            if obj is not None:
+                self.cache.set(model_id, obj)
+        return obj
+
     async def get_by_email(self, db: Database, *, email: str) -> Optional[Any]:
         return await db.fetch_one(
             self.model.select().where(self.model.c.email == email)
@@ -16,22 +35,34 @@ class CRUDUser(CRUDBase[type(user), UserIn, UserUpdate]):
 
     async def create(self, db: Database, *, obj_in: UserIn) -> Any:
         db_obj = obj_in.dict(exclude={"password"})
-        db_obj["hashed_password"] = get_password_hash(obj_in.password)
-        user_id = await db.execute(self.model.insert().values(**db_obj))
-        return await self.get(db, model_id=user_id)
+        db_obj["hashed_password"] = await get_password_hash_async(obj_in.password)
+        return await db.fetch_one(
+            self.model.insert().values(**db_obj).returning(*self.model.c)
+        )
 
-    async def update(
-        self, db: Database, *, db_obj: user, obj_in: Union[UserUpdate, Dict[str, Any]]
-    ) -> Any:
+    async def update_by_id(
+        self,
+        db: Database,
+        *,
+        model_id: Any,
+        obj_in: Union[UserUpdate, Dict[str, Any]],
+    ) -> Optional[Any]:
         if isinstance(obj_in, dict):
-            update_data = obj_in
+            update_data = dict(obj_in)
         else:
             update_data = obj_in.dict(exclude_unset=True)
         if update_data.get("password"):
-            hashed_password = get_password_hash(update_data["password"])
+            hashed_password = await get_password_hash_async(update_data["password"])
             del update_data["password"]
             update_data["hashed_password"] = hashed_password
-        return await super().update(db, db_obj=db_obj, obj_in=update_data)
+        obj = await super().update_by_id(db, model_id=model_id, obj_in=update_data)
+        self.cache.invalidate(model_id)
+        return obj
+
+    async def remove(self, db: Database, *, model_id: Any) -> Optional[Any]:
+        obj = await super().remove(db, model_id=model_id)
+        self.cache.invalidate(model_id)
+        return obj
 
     async def authenticate(
         self, db: Database, *, email: str, password: str
@@ -39,7 +70,7 @@ class CRUDUser(CRUDBase[type(user), UserIn, UserUpdate]):
         obj = await self.get_by_email(db, email=email)
         if not obj:
             return None
-        if not verify_password(password, obj.hashed_password):
+        if not await verify_password_async(password, obj.hashed_password):
             return None
         return obj
 
@@ -1,6 +1,7 @@
 from contextlib import contextmanager
 from typing import Generator
 
+from databases import Database
 from sqlalchemy import create_engine
 from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
@@ -12,7 +13,20 @@ def create_postgres_engine() -> Engine:
     return create_engine(settings.POSTGRES_URL, pool_pre_ping=True)
 
 
+def create_postgres_database() -> Database:
+    """
+    Asynchronous connection pool, connected on application startup.
+    """
+    return Database(
+        settings.POSTGRES_URL,
+        min_size=settings.POSTGRES_POOL_MIN_SIZE,
+        max_size=settings.POSTGRES_POOL_MAX_SIZE,
+        max_inactive_connection_lifetime=settings.POSTGRES_POOL_MAX_INACTIVE_CONNECTION_LIFETIME,
+    )
+
+
 postgres_engine = create_postgres_engine()
+postgres_database = create_postgres_database()
 
 engines = {"postgres": postgres_engine}
 
@@ -0,0 +1,58 @@
+import argparse
+import asyncio
+import logging
+
+from databases import Database
+
+from app.core.config import settings
+from app.schemas import ImportFormat
+from app.services.importer import TARGETS, import_feed, read_file
+
+# The root handler is already set up by app.core.config
+logging.getLogger().setLevel(logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Import a feed of buildings or units")
+    parser.add_argument("kind", choices=list(TARGETS))
+    parser.add_argument("path", help="CSV or NDJSON file")
+    parser.add_argument(
+        "--format",
+        choices=[feed_format.value for feed_format in ImportFormat],
+        default=ImportFormat.csv.value,
+    )
+    return parser.parse_args()
+
+
+async def main() -> None:
+    args = parse_args()
+    postgres = Database(settings.POSTGRES_URL)
+
+    logger.info("Importing %s from %s", args.kind, args.path)
+    await postgres.connect()
+    try:
+        async with postgres.connection() as connection:
+            result = await import_feed(
+                connection,
+                kind=args.kind,
+                chunks=read_file(args.path),
+                feed_format=ImportFormat(args.format),
+            )
+    finally:
+        await postgres.disconnect()
+
+    for error in result.errors:
+        logger.warning(error)
+    logger.info(
+        "Imported %s: %d rows, %d merged, %d invalid",
+        args.kind,
+        result.rows,
+        result.merged,
+        result.invalid,
+    )
+
+
+if __name__ == "__main__":
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(main())
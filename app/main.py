@@ -3,8 +3,17 @@ from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import ORJSONResponse
 
+from app import crud
 from app.api.v1.router import api_router
 from app.core.config import settings
+from app.core.security import PasswordHashingBusy, password_hashing_pool
+from app.db.session import postgres_database
+from app.services.snapshot import SNAPSHOT_WATERMARK_HEADER
+from app.utils.pagination import (
+    NEXT_CURSOR_HEADER,
+    TOTAL_APPROXIMATE_HEADER,
+    TOTAL_COUNT_HEADER,
+)
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -20,11 +29,41 @@ if settings.BACKEND_CORS_ORIGINS:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=[
+            NEXT_CURSOR_HEADER,
+            TOTAL_COUNT_HEADER,
+            TOTAL_APPROXIMATE_HEADER,
+            SNAPSHOT_WATERMARK_HEADER,
+        ],
     )
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
 
+@app.on_event("startup")
+async def startup() -> None:
+    await postgres_database.connect()
+    if crud.unit.amenity_index is not None:
+        await crud.unit.amenity_index.rebuild(postgres_database)
+
+
+@app.on_event("shutdown")
+async def shutdown() -> None:
+    await postgres_database.disconnect()
+    password_hashing_pool.shutdown()
+
+
+@app.exception_handler(PasswordHashingBusy)
+async def password_hashing_busy_handler(
+    request: Request, exc: PasswordHashingBusy
+) -> ORJSONResponse:
+    return ORJSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Too many concurrent authentication requests"},
+        headers={"Retry-After": "1"},
+    )
+
+
 @app.middleware("http")
 async def sql_middleware(request: Request, call_next):
     """Catch all SQL exceptions"""
@@ -1,4 +1,5 @@
 import sqlalchemy
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
 
 from app.db.metadata import postgres_metadata
 
@@ -6,9 +7,17 @@ unit_amenities = sqlalchemy.Table(
     "unit_amenities",
     postgres_metadata,
     sqlalchemy.Column(
-        "amenity_id", sqlalchemy.ForeignKey("amenity.id"), primary_key=True
+        "amenity_id",
+        sqlalchemy.ForeignKey("amenity.id", ondelete="CASCADE"),
+        primary_key=True,
     ),
-    sqlalchemy.Column("unit_id", sqlalchemy.ForeignKey("unit.id"), primary_key=True),
+    sqlalchemy.Column(
+        "unit_id",
+        sqlalchemy.ForeignKey("unit.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    # The primary key is led by amenity_id, lookups by unit need the reverse
+    sqlalchemy.Index("ix_unit_amenities_unit_id_amenity_id", "unit_id", "amenity_id"),
 )
 
 # e.g. SPA, gym, pool, golf, tennis, basketball, etc.
@@ -23,7 +32,9 @@ building = sqlalchemy.Table(
     "building",
     postgres_metadata,
     sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True, index=True),
-    sqlalchemy.Column("name", sqlalchemy.String, default=""),
+    # Also indexed for similarity searches when pg_trgm is available, see the
+    # add_trigram_indexes migration
+    sqlalchemy.Column("name", sqlalchemy.String, default="", index=True),
     sqlalchemy.Column("description", sqlalchemy.String, default=""),
     sqlalchemy.Column("latitude", sqlalchemy.Numeric, nullable=False),
     sqlalchemy.Column("longitude", sqlalchemy.Numeric, nullable=False),
@@ -32,6 +43,30 @@ building = sqlalchemy.Table(
     sqlalchemy.Column("number_of_units", sqlalchemy.Integer, nullable=False),
     sqlalchemy.Column("number_of_floors", sqlalchemy.Integer, nullable=False),
     sqlalchemy.Column("year_built", sqlalchemy.String, nullable=False),
+    # Set by a trigger on every update, see the add_updated_at_columns migration
+    sqlalchemy.Column(
+        "updated_at",
+        sqlalchemy.DateTime(timezone=True),
+        server_default=sqlalchemy.func.now(),
+        nullable=False,
+        index=True,
+    ),
+    # Full-text search, names rank above descriptions
+    sqlalchemy.Column(
+        "search_vector",
+        TSVECTOR,
+        sqlalchemy.Computed(
+            "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(description, '')), 'B')",
+            persisted=True,
+        ),
+        nullable=False,
+    ),
+    # Radius and bounding box searches, see app.crud.geo
+    sqlalchemy.Index("ix_building_latitude_longitude", "latitude", "longitude"),
+    sqlalchemy.Index(
+        "ix_building_search_vector", "search_vector", postgresql_using="gin"
+    ),
 )
 
 unit = sqlalchemy.Table(
@@ -47,5 +82,42 @@ unit = sqlalchemy.Table(
         "building_id",
         sqlalchemy.Integer,
         sqlalchemy.ForeignKey("building.id", ondelete="CASCADE"),
+        index=True,
+    ),
+    # Also set when the amenities of the unit change
+    sqlalchemy.Column(
+        "updated_at",
+        sqlalchemy.DateTime(timezone=True),
+        server_default=sqlalchemy.func.now(),
+        nullable=False,
+        index=True,
+    ),
+    # Full-text search
+    sqlalchemy.Column(
+        "search_vector",
+        TSVECTOR,
+        sqlalchemy.Computed(
+            "to_tsvector('english', coalesce(description, ''))", persisted=True
+        ),
+        nullable=False,
+    ),
+    # Sorted ids of the amenities linked in unit_amenities, set by a trigger
+    # on it
+    sqlalchemy.Column(
+        "amenity_ids",
+        ARRAY(sqlalchemy.Integer),
+        server_default=sqlalchemy.text("'{}'"),
+        nullable=False,
+    ),
+    # Range filters and sorted searches, see CRUDUnit.search_keys
+    sqlalchemy.Index("ix_unit_price_id", "price", "id"),
+    sqlalchemy.Index("ix_unit_square_id", "square", "id"),
+    sqlalchemy.Index(
+        "ix_unit_price_per_square_id",
+        sqlalchemy.text("(price / NULLIF(square, 0))"),
+        "id",
     ),
+    sqlalchemy.Index("ix_unit_bedrooms_bathrooms", "bedrooms", "bathrooms"),
+    sqlalchemy.Index("ix_unit_search_vector", "search_vector", postgresql_using="gin"),
+    sqlalchemy.Index("ix_unit_amenity_ids", "amenity_ids", postgresql_using="gin"),
 )
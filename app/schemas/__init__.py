@@ -7,6 +7,8 @@ class BaseSchema(BaseModel):
         orm_mode = True
 
 
+from .autocomplete import *
+from .batch import *
 from .building import *
 from .developer import *
 from .message import *
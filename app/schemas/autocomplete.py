@@ -0,0 +1,17 @@
+from enum import Enum
+from typing import Optional
+
+from app.schemas import BaseSchema
+
+
+class SuggestionKind(str, Enum):
+    building = "building"
+    postcode = "postcode"
+    amenity = "amenity"
+
+
+class Suggestion(BaseSchema):
+    kind: SuggestionKind
+    # Id of the building or amenity, postcodes have none
+    id: Optional[int]
+    text: str
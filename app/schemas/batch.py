@@ -0,0 +1,31 @@
+from enum import Enum
+from typing import List, Optional
+
+from app.schemas import BaseSchema
+
+
+class BatchItemResult(BaseSchema):
+    # Position of the item in the request body
+    index: int
+    ok: bool
+    id: Optional[int]
+    detail: Optional[str]
+
+
+class ImportFormat(str, Enum):
+    csv = "csv"
+    ndjson = "ndjson"
+
+
+class SnapshotFormat(str, Enum):
+    arrow = "arrow"
+    parquet = "parquet"
+
+
+class ImportResult(BaseSchema):
+    # Valid rows read from the feed and rows written to the table
+    rows: int
+    merged: int
+    invalid: int
+    # First validation errors, prefixed with their line number
+    errors: List[str]
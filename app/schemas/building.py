@@ -1,4 +1,6 @@
-from typing import Optional
+from typing import Any, Dict, Optional
+
+from pydantic import Field, root_validator
 
 from app.schemas import BaseSchema
 
@@ -26,5 +28,71 @@ class BuildingUpdate(BuildingIn):
     year_built: Optional[str]
 
 
+class BuildingBatchUpdate(BuildingUpdate):
+    id: int
+
+
+class BuildingImport(BuildingIn):
+    # Rows with an id replace the existing building, others are inserted
+    id: Optional[int]
+
+
 class BuildingOut(BuildingIn):
     id: int
+
+
+class GeoForm(BaseSchema):
+    # Within `radius` kilometers of the point, nearest first
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+    radius: Optional[float] = Field(None, gt=0)
+
+    # Inside the box, a min_longitude above max_longitude crosses the antimeridian
+    min_latitude: Optional[float] = Field(None, ge=-90, le=90)
+    max_latitude: Optional[float] = Field(None, ge=-90, le=90)
+    min_longitude: Optional[float] = Field(None, ge=-180, le=180)
+    max_longitude: Optional[float] = Field(None, ge=-180, le=180)
+
+    @root_validator(skip_on_failure=True)
+    def check_complete(cls, values: Dict[str, Any]) -> Dict[str, Any]:
+        for fields in (
+            ("latitude", "longitude", "radius"),
+            ("min_latitude", "max_latitude", "min_longitude", "max_longitude"),
+        ):
+            given = [values.get(field) is not None for field in fields]
+            if any(given) and not all(given):
+                raise ValueError(f"{', '.join(fields)} must be given together")
+        return values
+
+    @property
+    def has_point(self) -> bool:
+        return self.radius is not None
+
+    @property
+    def has_box(self) -> bool:
+        return self.min_latitude is not None
+
+
+class SearchForm(GeoForm):
+    # Words of the name or description, best matches first. Web search syntax:
+    # "quoted phrase", or, -excluded
+    q: Optional[str] = Field(None, min_length=1, max_length=256)
+
+    @property
+    def has_text(self) -> bool:
+        return self.q is not None
+
+
+class BuildingForm(SearchForm):
+    ...
+
+
+class Cluster(BaseSchema):
+    # Centroid of the units of the cluster
+    latitude: float
+    longitude: float
+    buildings: int
+    units: int
+    min_price: float
+    median_price: float
+    max_price: float
@@ -1,6 +1,8 @@
+from enum import Enum
 from typing import List, Optional
 
 from app.schemas import BaseSchema
+from app.schemas.building import SearchForm
 
 
 class AmenityIn(BaseSchema):
@@ -11,6 +13,10 @@ class AmenityUpdate(AmenityIn):
     ...
 
 
+class AmenityBatchUpdate(AmenityUpdate):
+    id: int
+
+
 class AmenityOut(AmenityIn):
     id: int
     name: str
@@ -35,7 +41,36 @@ class UnitUpdate(UnitIn):
     building_id: Optional[int]
 
 
-class UnitForm(BaseSchema):
+class UnitBatchUpdate(UnitUpdate):
+    id: int
+
+
+class UnitImport(UnitIn):
+    # Rows with an id replace the existing unit, others are inserted
+    id: Optional[int]
+
+
+class AmenityMatch(str, Enum):
+    any = "any"
+    all = "all"
+
+
+class UnitSort(str, Enum):
+    price = "price"
+    price_desc = "-price"
+    square = "square"
+    square_desc = "-square"
+    price_per_square = "price_per_square"
+    price_per_square_desc = "-price_per_square"
+    # Most recently created first
+    newest = "newest"
+
+    @property
+    def descending(self) -> bool:
+        return self.value.startswith("-") or self == UnitSort.newest
+
+
+class UnitForm(SearchForm):
     min_price: Optional[float] = 0
     max_price: Optional[float] = 10_000_000_000
 
@@ -49,9 +84,48 @@ class UnitForm(BaseSchema):
     max_bathrooms: Optional[int] = 100_000
 
     amenities: Optional[List[int]]
+    # Units having any of the amenities or all of them
+    match: AmenityMatch = AmenityMatch.any
+    # Units having none of these amenities
+    exclude_amenities: Optional[List[int]]
+
+    # Without a sort, nearest units come first with a point, best matches
+    # with a text query, otherwise units are sorted by id
+    sort: Optional[UnitSort]
 
 
 class UnitOut(UnitIn):
     id: int
 
     amenities: Optional[List[AmenityOut]]
+
+
+class FacetRange(BaseSchema):
+    # Units with min <= value < max
+    min: float
+    max: float
+    count: int
+
+
+class FacetValue(BaseSchema):
+    value: int
+    count: int
+
+
+class UnitFacets(BaseSchema):
+    # Units matching the search form, each facet counts among them
+    total: int
+    price: List[FacetRange]
+    square: List[FacetRange]
+    bedrooms: List[FacetValue]
+    bathrooms: List[FacetValue]
+    # Units per amenity id
+    amenities: List[FacetValue]
+
+
+class SearchEngineStats(BaseSchema):
+    enabled: bool
+    units: int = 0
+    amenities: int = 0
+    # Size of the arrays held by the engine
+    memory_bytes: int = 0
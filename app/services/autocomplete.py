@@ -0,0 +1,307 @@
+"""
+Autocomplete of building names, postcodes and amenity names.
+
+Prefix lookups are served from an in-process index of sorted arrays, so a
+keystroke costs a binary search and no database round trip. The index is
+kept up to date by loading the buildings changed since the last refresh.
+When it has too few matches, e.g. for a typo, a pg_trgm similarity query
+fills in.
+"""
+import asyncio
+import re
+import time
+from bisect import bisect_left, insort
+from datetime import datetime
+from typing import Dict, List, Mapping, Optional, Sequence, Set, Tuple, Union
+
+from databases import Database
+from sqlalchemy import (
+    Float,
+    Integer,
+    cast,
+    func,
+    literal,
+    literal_column,
+    null,
+    select,
+    union_all,
+)
+from sqlalchemy.sql import Select
+
+from app.core.config import settings
+from app.models import amenity, building
+from app.schemas import Suggestion, SuggestionKind
+from app.services.snapshot import snapshot_watermark
+
+# Trigrams of shorter queries are too few to tell similar words apart
+MIN_SIMILAR_QUERY_LENGTH = 3
+
+# Index entries are (term, kind, ref). The ref of a building or an amenity
+# is its id, postcodes are their own ref since many buildings share one.
+Entry = Tuple[str, str, Union[int, str]]
+
+
+def normalize(text: str) -> str:
+    return " ".join(re.findall(r"\w+", text.casefold()))
+
+
+def terms(text: str) -> List[str]:
+    """
+    The normalized text from each of its words on, so that "tower" matches
+    "Riverside Tower".
+    """
+    words = normalize(text).split(" ")
+    return [" ".join(words[start:]) for start in range(len(words)) if words[start]]
+
+
+class PrefixIndex:
+    def __init__(self) -> None:
+        self.entries: List[Entry] = list()
+        # Building names and postcodes by building id, amenity names by id
+        self.buildings: Dict[int, Tuple[str, str]] = dict()
+        self.amenities: Dict[int, str] = dict()
+        # Buildings having each postcode
+        self.postcodes: Dict[str, int] = dict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @classmethod
+    def build(
+        cls, buildings: Sequence[Mapping], amenities: Sequence[Mapping]
+    ) -> "PrefixIndex":
+        """
+        Index of all rows, sorted once instead of inserting every entry.
+        """
+        index = cls()
+        for record in buildings:
+            name, postcode = record["name"] or "", record["postcode"]
+            index.buildings[record["id"]] = (name, postcode)
+            index.postcodes[postcode] = index.postcodes.get(postcode, 0) + 1
+            index.entries += [
+                (term, SuggestionKind.building.value, record["id"])
+                for term in terms(name)
+            ]
+        for postcode in index.postcodes:
+            index.entries += [
+                (term, SuggestionKind.postcode.value, postcode)
+                for term in terms(postcode)
+            ]
+        for record in amenities:
+            index.amenities[record["id"]] = record["name"]
+            index.entries += [
+                (term, SuggestionKind.amenity.value, record["id"])
+                for term in terms(record["name"])
+            ]
+        index.entries.sort()
+        return index
+
+    def add_terms(self, text: str, kind: SuggestionKind, ref: Union[int, str]) -> None:
+        for term in terms(text):
+            insort(self.entries, (term, kind.value, ref))
+
+    def remove_terms(
+        self, text: str, kind: SuggestionKind, ref: Union[int, str]
+    ) -> None:
+        for term in terms(text):
+            entry = (term, kind.value, ref)
+            position = bisect_left(self.entries, entry)
+            if position < len(self.entries) and self.entries[position] == entry:
+                del self.entries[position]
+
+    def set_building(self, building_id: int, name: str, postcode: str) -> None:
+        if self.buildings.get(building_id) == (name, postcode):
+            return
+        self.remove_building(building_id)
+        self.buildings[building_id] = (name, postcode)
+        self.add_terms(name, SuggestionKind.building, building_id)
+        self.postcodes[postcode] = self.postcodes.get(postcode, 0) + 1
+        if self.postcodes[postcode] == 1:
+            self.add_terms(postcode, SuggestionKind.postcode, postcode)
+
+    def remove_building(self, building_id: int) -> None:
+        if building_id not in self.buildings:
+            return
+        name, postcode = self.buildings.pop(building_id)
+        self.remove_terms(name, SuggestionKind.building, building_id)
+        self.postcodes[postcode] -= 1
+        if not self.postcodes[postcode]:
+            del self.postcodes[postcode]
+            self.remove_terms(postcode, SuggestionKind.postcode, postcode)
+
+    def set_amenity(self, amenity_id: int, name: str) -> None:
+        if self.amenities.get(amenity_id) == name:
+            return
+        self.remove_amenity(amenity_id)
+        self.amenities[amenity_id] = name
+        self.add_terms(name, SuggestionKind.amenity, amenity_id)
+
+    def remove_amenity(self, amenity_id: int) -> None:
+        if amenity_id in self.amenities:
+            self.remove_terms(
+                self.amenities.pop(amenity_id), SuggestionKind.amenity, amenity_id
+            )
+
+    def suggestion(self, kind: str, ref: Union[int, str]) -> Suggestion:
+        if kind == SuggestionKind.postcode:
+            return Suggestion(kind=kind, id=None, text=ref)
+        if kind == SuggestionKind.building:
+            return Suggestion(kind=kind, id=ref, text=self.buildings[ref][0])
+        return Suggestion(kind=kind, id=ref, text=self.amenities[ref])
+
+    def lookup(self, prefix: str, *, limit: int) -> List[Suggestion]:
+        """
+        Suggestions having a word starting with `prefix`, in term order.
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return list()
+        found: List[Suggestion] = list()
+        seen: Set[Tuple[str, Union[int, str]]] = set()
+        position = bisect_left(self.entries, (prefix,))
+        while len(found) < limit and position < len(self.entries):
+            term, kind, ref = self.entries[position]
+            if not term.startswith(prefix):
+                break
+            if (kind, ref) not in seen:
+                seen.add((kind, ref))
+                found.append(self.suggestion(kind, ref))
+            position += 1
+        return found
+
+
+def similar_query(q: str, *, limit: int) -> Select:
+    """
+    Buildings, postcodes and amenities with a word similar to `q`, most
+    similar first. `<%` is served by the trigram indexes.
+    """
+
+    def similar(kind: SuggestionKind, id_column, text_column) -> Select:
+        return select(
+            literal(kind.value).label("kind"),
+            id_column.label("id"),
+            text_column.label("text"),
+            func.word_similarity(q, text_column, type_=Float).label("score"),
+        ).where(literal(q).op("<%")(text_column))
+
+    return (
+        union_all(
+            similar(SuggestionKind.building, building.c.id, building.c.name),
+            similar(
+                SuggestionKind.postcode, cast(null(), Integer), building.c.postcode
+            ).distinct(),
+            similar(SuggestionKind.amenity, amenity.c.id, amenity.c.name),
+        )
+        .order_by(literal_column("score").desc())
+        .limit(limit)
+    )
+
+
+class Autocomplete:
+    def __init__(self, *, refresh_seconds: float, rebuild_seconds: float) -> None:
+        self.refresh_seconds = refresh_seconds
+        self.rebuild_seconds = rebuild_seconds
+        self.index = PrefixIndex()
+        self.has_trigrams = False
+        self.watermark: Optional[datetime] = None
+        self.built_at: Optional[float] = None
+        self.refreshed_at: Optional[float] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.built_at is not None
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        # Created in the running loop, before Python 3.10 a lock is bound to
+        # the loop current when it is created
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    @property
+    def refresh_due(self) -> bool:
+        return (
+            self.refreshed_at is None
+            or time.monotonic() - self.refreshed_at >= self.refresh_seconds
+        )
+
+    async def refresh(self, db: Database) -> None:
+        """
+        Load the buildings changed since the last refresh and all amenities,
+        or rebuild the whole index when it is due. Buildings are only dropped
+        by a rebuild, deleted rows leave no trace to load. A refresh in
+        progress is awaited, so no caller sees the index before it is built.
+        """
+        if not self.refresh_due:
+            return
+        async with self.lock:
+            # Refreshed by the caller holding the lock before
+            if not self.refresh_due:
+                return
+            started = time.monotonic()
+            rebuild = not self.is_loaded or started - self.built_at >= (
+                self.rebuild_seconds
+            )
+            watermark = await snapshot_watermark(db, previous=self.watermark)
+            query = select(building.c.id, building.c.name, building.c.postcode)
+            if not rebuild:
+                query = query.where(building.c.updated_at >= self.watermark)
+            buildings = await db.fetch_all(query)
+            amenities = await db.fetch_all(select(amenity.c.id, amenity.c.name))
+
+            if rebuild:
+                # Building takes seconds for large tables, the event loop
+                # keeps serving requests meanwhile
+                self.index = await asyncio.get_running_loop().run_in_executor(
+                    None, PrefixIndex.build, buildings, amenities
+                )
+                self.has_trigrams = await db.fetch_val(
+                    "SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')"
+                )
+                self.built_at = started
+            else:
+                for record in buildings:
+                    self.index.set_building(
+                        record["id"], record["name"] or "", record["postcode"]
+                    )
+                # Amenities are few, all of them are compared
+                for record in amenities:
+                    self.index.set_amenity(record["id"], record["name"])
+                removed = set(self.index.amenities) - {r["id"] for r in amenities}
+                for amenity_id in removed:
+                    self.index.remove_amenity(amenity_id)
+            self.watermark, self.refreshed_at = watermark, started
+
+    async def suggest(self, db: Database, *, q: str, limit: int) -> List[Suggestion]:
+        """
+        Prefix matches completed with similar words when there are too few.
+        """
+        found = self.index.lookup(q, limit=limit)
+        if (
+            len(found) >= limit
+            or not self.has_trigrams
+            or len(q.strip()) < MIN_SIMILAR_QUERY_LENGTH
+        ):
+            return found
+
+        seen = {
+            (suggestion.kind, suggestion.id, suggestion.text) for suggestion in found
+        }
+        for record in await db.fetch_all(similar_query(q, limit=limit)):
+            suggestion = Suggestion(
+                kind=record["kind"], id=record["id"], text=record["text"]
+            )
+            if (suggestion.kind, suggestion.id, suggestion.text) not in seen:
+                seen.add((suggestion.kind, suggestion.id, suggestion.text))
+                found.append(suggestion)
+            if len(found) >= limit:
+                break
+        return found
+
+
+autocomplete = Autocomplete(
+    refresh_seconds=settings.AUTOCOMPLETE_REFRESH_SECONDS,
+    rebuild_seconds=settings.AUTOCOMPLETE_REBUILD_SECONDS,
+)
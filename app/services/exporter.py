@@ -0,0 +1,78 @@
+"""
+Streaming export of whole tables as NDJSON or CSV.
+
+Rows are read through a server-side cursor and encoded in chunks, so worker
+memory does not depend on the number of exported rows.
+"""
+import csv
+import io
+from decimal import Decimal
+from typing import Any, AsyncIterator, Callable, Dict, List, Mapping
+
+import orjson
+from databases import Database
+from sqlalchemy.sql import Select
+
+from app.schemas import ImportFormat
+
+EXPORT_CHUNK_ROWS = 1000
+
+MEDIA_TYPES = {
+    ImportFormat.csv: "text/csv",
+    ImportFormat.ndjson: "application/x-ndjson",
+}
+
+
+def json_default(obj: Any) -> Any:
+    # Numeric columns are exported as numbers, like the JSON API does
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError
+
+
+def encode_ndjson(rows: List[Dict[str, Any]], columns: List[str]) -> bytes:
+    return b"".join(
+        orjson.dumps(row, default=json_default, option=orjson.OPT_APPEND_NEWLINE)
+        for row in rows
+    )
+
+
+def encode_csv(rows: List[Dict[str, Any]], columns: List[str]) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        values = list()
+        for column in columns:
+            value = row[column]
+            # Lists of objects are written as ";" separated ids, as imported
+            if isinstance(value, list):
+                value = ";".join(str(item["id"]) for item in value)
+            values.append(value)
+        writer.writerow(values)
+    return buffer.getvalue().encode()
+
+
+async def export_feed(
+    db: Database,
+    *,
+    query: Select,
+    columns: List[str],
+    row: Callable[[Mapping], Dict[str, Any]],
+    feed_format: ImportFormat,
+) -> AsyncIterator[bytes]:
+    """
+    Encoded chunks of the rows of `query`, each row turned into a dict with
+    the keys `columns` by `row`.
+    """
+    encode = encode_csv if feed_format == ImportFormat.csv else encode_ndjson
+    if feed_format == ImportFormat.csv:
+        yield encode_csv([dict(zip(columns, columns))], columns)
+
+    chunk = list()
+    async for record in db.iterate(query):
+        chunk.append(row(record))
+        if len(chunk) >= EXPORT_CHUNK_ROWS:
+            yield encode(chunk, columns)
+            chunk = list()
+    if chunk:
+        yield encode(chunk, columns)
@@ -0,0 +1,323 @@
+"""
+Bulk import of buildings and units from CSV or NDJSON feeds.
+
+Rows are parsed and validated one at a time and streamed with binary COPY
+into a temporary staging table, then merged into the target tables with one
+set-based statement, so memory does not depend on the size of the feed.
+"""
+import codecs
+import csv
+import logging
+import time
+from decimal import Decimal
+from typing import Any, AsyncIterable, AsyncIterator, Dict, List, Tuple, Type
+
+import orjson
+from databases.core import Connection
+from pydantic import ValidationError
+from pydantic.fields import SHAPE_SINGLETON
+from sqlalchemy import Numeric, Table
+
+from app.core.config import settings
+from app.models import building, unit
+from app.schemas import (
+    BaseSchema,
+    BuildingImport,
+    ImportFormat,
+    ImportResult,
+    UnitImport,
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_REPORTED_ERRORS = 10
+CHUNK_SIZE = 64 * 1024
+
+# The last row of the feed with a given id wins, an upsert cannot change the
+# same row twice. Rows without an id are all kept.
+LATEST_ROWS = """
+SELECT DISTINCT ON (id, CASE WHEN id IS NULL THEN line END) *
+FROM {staging}
+ORDER BY id, CASE WHEN id IS NULL THEN line END, line DESC
+"""
+
+BUILDINGS_MERGE = """
+WITH merged AS (
+    INSERT INTO building (id, {columns})
+    SELECT coalesce(id, nextval(pg_get_serial_sequence('building', 'id'))), {columns}
+    FROM ({latest}) AS latest
+    ON CONFLICT (id) DO UPDATE SET {updates}
+    RETURNING id
+)
+SELECT count(*) FROM merged
+"""
+
+# Units of unknown buildings are skipped and links to unknown amenities are
+# ignored. A CTE used several times is evaluated once, so the ids drawn from
+# the sequence are the same for the unit and its links.
+UNITS_MERGE = """
+WITH rows AS (
+    SELECT coalesce(id, nextval(pg_get_serial_sequence('unit', 'id'))) AS id,
+        {columns}, amenities
+    FROM ({latest}) AS latest
+    WHERE building_id IN (SELECT id FROM building)
+),
+merged AS (
+    INSERT INTO unit (id, {columns})
+    SELECT id, {columns} FROM rows
+    ON CONFLICT (id) DO UPDATE SET {updates}
+    RETURNING id
+),
+removed_links AS (
+    DELETE FROM unit_amenities
+    USING rows
+    WHERE unit_amenities.unit_id = rows.id
+        AND rows.amenities IS NOT NULL
+        AND NOT unit_amenities.amenity_id = ANY(rows.amenities)
+),
+added_links AS (
+    INSERT INTO unit_amenities (unit_id, amenity_id)
+    SELECT rows.id, amenity.id
+    FROM rows
+    CROSS JOIN LATERAL unnest(rows.amenities) AS link(amenity_id)
+    JOIN amenity ON amenity.id = link.amenity_id
+    ON CONFLICT DO NOTHING
+)
+SELECT count(*) FROM merged
+"""
+
+
+class ImportTarget:
+    def __init__(
+        self,
+        *,
+        table: Table,
+        schema: Type[BaseSchema],
+        merge: str,
+        extra_columns: Dict[str, str],
+    ) -> None:
+        """
+        **Parameters**
+
+        * `table`: Table the rows are merged into
+        * `schema`: Pydantic schema validating one row, with an optional `id`
+        * `merge`: Statement merging the staging table into `table`
+        * `extra_columns`: Staging columns which are not `table` columns
+        """
+        self.table = table
+        self.schema = schema
+        self.merge = merge
+        self.extra_columns = extra_columns
+        self.columns = [
+            name for name in schema.__fields__ if name in table.c and name != "id"
+        ]
+        self.staging = f"{table.name}_import"
+
+    @property
+    def staging_columns(self) -> List[str]:
+        # With the line number of each row
+        return ["id", *self.columns, *self.extra_columns, "line"]
+
+    def create_staging_query(self) -> str:
+        columns = ", ".join(["id", *self.columns])
+        for name, type_ in {**self.extra_columns, "line": "integer"}.items():
+            columns += f", NULL::{type_} AS {name}"
+        # Built from the table to get the column types but not the constraints
+        return (
+            f"CREATE TEMP TABLE {self.staging} ON COMMIT DROP AS "
+            f"SELECT {columns} FROM {self.table.name} WITH NO DATA"
+        )
+
+    def merge_query(self) -> str:
+        return self.merge.format(
+            latest=LATEST_ROWS.format(staging=self.staging),
+            columns=", ".join(self.columns),
+            updates=", ".join(f"{name} = excluded.{name}" for name in self.columns),
+        )
+
+    def record(self, obj: BaseSchema, line_number: int) -> Tuple[Any, ...]:
+        values = list()
+        for name in self.staging_columns[:-1]:
+            value = getattr(obj, name)
+            # Binary COPY would store the exact binary value of a float
+            if isinstance(value, float) and isinstance(
+                self.table.c[name].type, Numeric
+            ):
+                value = Decimal(str(value))
+            values.append(value)
+        return (*values, line_number)
+
+
+TARGETS = dict(
+    buildings=ImportTarget(
+        table=building, schema=BuildingImport, merge=BUILDINGS_MERGE, extra_columns={}
+    ),
+    units=ImportTarget(
+        table=unit,
+        schema=UnitImport,
+        merge=UNITS_MERGE,
+        extra_columns=dict(amenities="integer[]"),
+    ),
+)
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    """
+    Split a stream of UTF-8 encoded bytes into lines.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line + "\n"
+
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer
+
+
+async def read_file(path: str) -> AsyncIterator[bytes]:
+    with open(path, "rb") as file:
+        while chunk := file.read(CHUNK_SIZE):
+            yield chunk
+
+
+async def csv_rows(
+    lines: AsyncIterable[str],
+) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Rows keyed by the header line with their line number. Quoted values may
+    span several lines, empty values are read as missing.
+    """
+    header, record, line_number = None, "", 0
+    async for line in lines:
+        line_number += 1
+        record += line
+        if record.count('"') % 2:
+            continue
+        if record.strip():
+            (values,) = csv.reader([record])
+            if header is None:
+                header = values
+            else:
+                yield line_number, {k: v for k, v in zip(header, values) if v != ""}
+        record = ""
+
+
+async def ndjson_rows(
+    lines: AsyncIterable[str],
+) -> AsyncIterator[Tuple[int, Any]]:
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if line.strip():
+            try:
+                yield line_number, orjson.loads(line)
+            except orjson.JSONDecodeError as exc:
+                yield line_number, exc
+
+
+class FeedImport:
+    def __init__(self, target: ImportTarget) -> None:
+        self.target = target
+        self.rows = 0
+        self.invalid = 0
+        self.errors: List[str] = list()
+        self.has_ids = False
+        self.started = time.monotonic()
+
+    def add_error(self, line_number: int, error: Any) -> None:
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"line {line_number}: {error}")
+
+    def log_progress(self) -> None:
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        logger.info(
+            "%s: %d rows read, %d invalid, %.0f rows/s",
+            self.target.table.name,
+            self.rows,
+            self.invalid,
+            self.rows / elapsed,
+        )
+
+    async def records(
+        self, rows: AsyncIterable[Tuple[int, Any]]
+    ) -> AsyncIterator[Tuple[Any, ...]]:
+        """
+        Staging records of the valid rows, invalid rows are counted and skipped.
+        """
+        fields = self.target.schema.__fields__
+        async for line_number, row in rows:
+            if not isinstance(row, dict):
+                self.add_error(line_number, row)
+                continue
+            # CSV lists are semicolon separated, e.g. amenities "1;4;7"
+            for name, value in row.items():
+                if (
+                    isinstance(value, str)
+                    and name in fields
+                    and fields[name].shape != SHAPE_SINGLETON
+                ):
+                    row[name] = value.split(";")
+            try:
+                obj = self.target.schema(**row)
+            except ValidationError as exc:
+                self.add_error(line_number, exc)
+                continue
+
+            self.rows += 1
+            self.has_ids = self.has_ids or obj.id is not None
+            if self.rows % settings.IMPORT_PROGRESS_EVERY == 0:
+                self.log_progress()
+            yield self.target.record(obj, line_number)
+
+    async def sync_sequence(self, connection: Connection) -> None:
+        """
+        Move the id sequence past the ids given in the feed before merging it,
+        so the ids drawn for the rows without one are free.
+        """
+        table = self.target.table.name
+        sequence = await connection.fetch_val(
+            "SELECT pg_get_serial_sequence(:table, 'id')", values=dict(table=table)
+        )
+        await connection.execute(
+            f"SELECT setval('{sequence}', greatest("
+            f"(SELECT max(id) FROM {self.target.staging}), "
+            f"(SELECT max(id) FROM {table}), (SELECT last_value FROM {sequence})))"
+        )
+
+
+async def import_feed(
+    connection: Connection,
+    *,
+    kind: str,
+    chunks: AsyncIterable[bytes],
+    feed_format: ImportFormat,
+) -> ImportResult:
+    """
+    Load a feed of `kind` ("buildings" or "units") from a stream of bytes.
+    Everything is written in one transaction, an invalid row is skipped and
+    of several rows with the same id the last one is kept.
+    """
+    feed = FeedImport(TARGETS[kind])
+    lines = iter_lines(chunks)
+    rows = csv_rows(lines) if feed_format == ImportFormat.csv else ndjson_rows(lines)
+
+    async with connection.transaction():
+        await connection.execute(feed.target.create_staging_query())
+        await connection.raw_connection.copy_records_to_table(
+            feed.target.staging,
+            records=feed.records(rows),
+            columns=feed.target.staging_columns,
+        )
+        if feed.has_ids:
+            await feed.sync_sequence(connection)
+        merged = await connection.fetch_val(feed.target.merge_query())
+
+    feed.log_progress()
+    return ImportResult(
+        rows=feed.rows, merged=merged, invalid=feed.invalid, errors=feed.errors
+    )
@@ -0,0 +1,155 @@
+"""
+Columnar snapshots of the unit inventory for analytics.
+
+Units joined with their building and amenity ids are read through a
+server-side cursor and written as Arrow record batches into an Arrow IPC
+stream or a Parquet file. pyarrow is an optional dependency, only needed here.
+"""
+import io
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from databases import Database
+from sqlalchemy import ARRAY, Boolean, DateTime, Integer, Numeric
+from sqlalchemy.sql import Select
+from sqlalchemy.types import TypeEngine
+
+from app.schemas import SnapshotFormat
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+SNAPSHOT_WATERMARK_HEADER = "X-Snapshot-Watermark"
+SNAPSHOT_BATCH_ROWS = 50_000
+
+# NULL when a session of the database hides its transaction start
+WATERMARK_QUERY = """
+SELECT CASE WHEN EXISTS (
+    SELECT FROM pg_stat_activity
+    WHERE datname = current_database()
+        AND NOT pg_has_role(usesysid, 'USAGE')
+        AND NOT pg_has_role('pg_read_all_stats', 'USAGE')
+) THEN NULL ELSE (
+    SELECT coalesce(min(xact_start), now()) FROM pg_stat_activity
+    WHERE datname = current_database() AND xact_start IS NOT NULL
+) END
+"""
+
+MEDIA_TYPES = {
+    SnapshotFormat.arrow: "application/vnd.apache.arrow.stream",
+    SnapshotFormat.parquet: "application/vnd.apache.parquet",
+}
+
+
+class ChunkSink(io.RawIOBase):
+    """
+    Write-only file collecting what pyarrow writes until it is taken.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.chunks: List[bytes] = list()
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: Any) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def take(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), list()
+        return data
+
+
+def is_available() -> bool:
+    return pyarrow is not None
+
+
+def arrow_type(sql_type: TypeEngine) -> Any:
+    if isinstance(sql_type, ARRAY):
+        return pyarrow.list_(arrow_type(sql_type.item_type))
+    if isinstance(sql_type, Boolean):
+        return pyarrow.bool_()
+    if isinstance(sql_type, Integer):
+        return pyarrow.int64()
+    # Unconstrained numerics have no fixed scale to map to an Arrow decimal
+    if isinstance(sql_type, Numeric):
+        return pyarrow.float64()
+    if isinstance(sql_type, DateTime):
+        return pyarrow.timestamp("us", tz="UTC" if sql_type.timezone else None)
+    return pyarrow.string()
+
+
+def arrow_schema(query: Select) -> Any:
+    return pyarrow.schema(
+        [(column.name, arrow_type(column.type)) for column in query.selected_columns]
+    )
+
+
+def record_batch(schema: Any, columns: Dict[str, List[Any]]) -> Any:
+    arrays = list()
+    for field in schema:
+        values = columns[field.name]
+        if pyarrow.types.is_floating(field.type):
+            values = [float(v) if isinstance(v, Decimal) else v for v in values]
+        arrays.append(pyarrow.array(values, type=field.type))
+    return pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+async def snapshot_watermark(
+    db: Database, *, previous: Optional[datetime] = None
+) -> datetime:
+    """
+    Start of the oldest running transaction in the database. Rows it writes
+    are stamped no earlier than that, so a snapshot since the watermark
+    misses none of them. xact_start is hidden for sessions of roles whose
+    privileges we lack, while one is connected the watermark stays at
+    `previous`, without it at the start of the server.
+    """
+    watermark = await db.fetch_val(WATERMARK_QUERY)
+    if watermark is not None:
+        return watermark
+    if previous is not None:
+        return previous
+    return await db.fetch_val("SELECT pg_postmaster_start_time()")
+
+
+async def write_snapshot(
+    db: Database, *, query: Select, snapshot_format: SnapshotFormat
+) -> AsyncIterator[bytes]:
+    """
+    Encoded chunks of the rows of `query`, one record batch at a time.
+    """
+    schema = arrow_schema(query)
+    sink = ChunkSink()
+    if snapshot_format == SnapshotFormat.parquet:
+        writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    else:
+        writer = pyarrow.ipc.new_stream(sink, schema)
+
+    columns: Dict[str, List[Any]] = {field.name: list() for field in schema}
+    rows = 0
+    async for record in db.iterate(query):
+        for name, values in columns.items():
+            values.append(record[name])
+        rows += 1
+        if rows % SNAPSHOT_BATCH_ROWS == 0:
+            writer.write_batch(record_batch(schema, columns))
+            columns = {field.name: list() for field in schema}
+            yield sink.take()
+
+    if rows % SNAPSHOT_BATCH_ROWS or not rows:
+        writer.write_batch(record_batch(schema, columns))
+    writer.close()
+    yield sink.take()
@@ -0,0 +1,25 @@
+from typing import Optional, Tuple
+
+from fastapi import Response
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+TOTAL_COUNT_HEADER = "X-Total-Count"
+TOTAL_APPROXIMATE_HEADER = "X-Total-Count-Approximate"
+
+
+def set_next_cursor(response: Response, cursor: Optional[str]) -> None:
+    """
+    Pass the cursor of the next page in the response headers, if there is one.
+    """
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
+
+
+def set_total(response: Response, total: Tuple[int, bool]) -> None:
+    """
+    Pass the number of items in the response headers, flagged when it is an
+    estimate.
+    """
+    count, exact = total
+    response.headers[TOTAL_COUNT_HEADER] = str(count)
+    response.headers[TOTAL_APPROXIMATE_HEADER] = "false" if exact else "true"
@@ -1,4 +1,4 @@
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Mapping, Sequence
 
 
 def unit_dict(unit_record: Any, amenities: List[Any]) -> Dict[str, Any]:
@@ -10,5 +10,47 @@ def unit_dict(unit_record: Any, amenities: List[Any]) -> Dict[str, Any]:
         bedrooms=unit_record.bedrooms,
         bathrooms=unit_record.bathrooms,
         building_id=unit_record.building_id,
-        amenities=[dict(id=amenity.id, name=amenity.name) for amenity in amenities],
+        amenities=[
+            dict(id=amenity["id"], name=amenity["name"]) for amenity in amenities
+        ],
     )
+
+
+def folded_unit_dict(unit_record: Any) -> Dict[str, Any]:
+    """
+    Unit fetched together with its amenity_ids and amenity_names arrays.
+    """
+    amenities = zip(unit_record.amenity_ids or [], unit_record.amenity_names or [])
+    return unit_dict(
+        unit_record=unit_record,
+        amenities=[dict(id=id_, name=name) for id_, name in amenities],
+    )
+
+
+def unit_facets_dict(records: Sequence[Any]) -> Dict[str, Any]:
+    """
+    UnitFacets from the rows of CRUDUnit.facets_query, buckets in ascending
+    order.
+    """
+    facets: Dict[str, Any] = dict(
+        total=0, price=[], square=[], bedrooms=[], bathrooms=[], amenities=[]
+    )
+    for record in sorted(records, key=lambda record: record["value"] or 0):
+        facet, value, count = record["facet"], record["value"], record["count"]
+        if facet == "total":
+            facets["total"] = count
+        elif record["size"] is not None:
+            bucket, size = float(value), float(record["size"])
+            facets[facet].append(dict(min=bucket, max=bucket + size, count=count))
+        else:
+            facets[facet].append(dict(value=int(value), count=count))
+    return facets
+
+
+def units_dicts(
+    unit_records: Sequence[Any], amenities: Mapping[int, List[Any]]
+) -> List[Dict[str, Any]]:
+    return [
+        unit_dict(unit_record=record, amenities=amenities.get(record.id, []))
+        for record in unit_records
+    ]
@@ -1,7 +1,10 @@
+import pytest
 from httpx import AsyncClient
 
 from app.core.config import settings
 
+pytestmark = [pytest.mark.asyncio, pytest.mark.usefixtures("use_postgres")]
+
 
 async def test_get_access_token(api_client: AsyncClient) -> None:
     login_data = {
@@ -9,7 +9,7 @@ from app.core.config import settings
 from app.schemas import UserIn
 from tests.utils.utils import random_email, random_lower_string
 
-pytestmark = pytest.mark.usefixtures("use_postgres")
+pytestmark = [pytest.mark.asyncio, pytest.mark.usefixtures("use_postgres")]
 
 
 async def test_get_users_superuser_me(
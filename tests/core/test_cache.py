@@ -0,0 +1,54 @@
+import pytest
+
+from app.core import cache
+from app.core.cache import TTLCache
+
+
+def test_cache_hits_and_misses() -> None:
+    users = TTLCache(maxsize=10, ttl=60)
+
+    assert users.get(1) is None
+    users.set(1, "user")
+
+    assert users.get(1) == "user"
+    assert users.stats() == dict(hits=1, misses=1, size=1)
+
+
+def test_cache_expires_entries(monkeypatch: pytest.MonkeyPatch) -> None:
+    now = 1000.0
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now)
+    users = TTLCache(maxsize=10, ttl=30)
+    users.set(1, "user")
+
+    now += 29
+    assert users.get(1) == "user"
+    now += 2
+    assert users.get(1) is None
+    assert len(users) == 0
+
+
+def test_cache_evicts_least_recently_used() -> None:
+    users = TTLCache(maxsize=2, ttl=60)
+    users.set(1, "first")
+    users.set(2, "second")
+    users.get(1)
+    users.set(3, "third")
+
+    assert users.get(2) is None
+    assert users.get(1) == "first"
+    assert users.get(3) == "third"
+
+
+def test_cache_invalidate() -> None:
+    users = TTLCache(maxsize=10, ttl=60)
+    users.set(1, "user")
+    users.invalidate(1)
+
+    assert users.get(1) is None
+
+
+def test_disabled_cache() -> None:
+    users = TTLCache(maxsize=10, ttl=0)
+    users.set(1, "user")
+
+    assert users.get(1) is None
@@ -0,0 +1,34 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.core.security import (
+    PasswordHashingBusy,
+    PasswordHashingPool,
+    get_password_hash_async,
+    verify_password_async,
+)
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_password_hash_roundtrip() -> None:
+    hashed_password = await get_password_hash_async("secret")
+
+    assert await verify_password_async("secret", hashed_password)
+    assert not await verify_password_async("wrong", hashed_password)
+
+
+async def test_password_hashing_pool_rejects_when_full() -> None:
+    pool = PasswordHashingPool(max_workers=1, max_queue_size=1)
+    release = threading.Event()
+    running = [asyncio.create_task(pool.run(release.wait)) for _ in range(2)]
+    await asyncio.sleep(0)
+
+    with pytest.raises(PasswordHashingBusy):
+        await pool.run(release.wait)
+
+    release.set()
+    assert await asyncio.gather(*running) == [True, True]
+    pool.shutdown()
@@ -0,0 +1,165 @@
+import pytest
+from databases import Database
+
+from app import crud
+from app.crud.amenity_index import ARRAY_MAX_SIZE, AmenityIndex, UnitBitmap
+from app.schemas import AmenityMatch, UnitForm, UnitIn
+from tests.utils.unit import create_random_amenity, create_random_building, seed_units
+
+
+def test_bitmap_operations() -> None:
+    # Chunk 0 holds a dense bitmap, chunk 1 sparse arrays
+    evens = set(range(0, 2 * (ARRAY_MAX_SIZE + 100), 2)) | {65_536 + 7, 65_536 + 9}
+    threes = set(range(0, 3 * (ARRAY_MAX_SIZE + 100), 3)) | {65_536 + 9, 131_072}
+    left, right = UnitBitmap.from_sorted(sorted(evens)), UnitBitmap.from_sorted(
+        sorted(threes)
+    )
+
+    assert isinstance(left.containers[0], int)
+    assert not isinstance(left.containers[1], int)
+    assert list(left & right) == sorted(evens & threes)
+    assert list(left | right) == sorted(evens | threes)
+    assert list(left - right) == sorted(evens - threes)
+    assert len(left) == len(evens)
+
+
+def test_bitmap_add_and_discard() -> None:
+    bitmap = UnitBitmap()
+    for id_ in range(ARRAY_MAX_SIZE + 1):
+        bitmap.add(id_ * 2)
+    bitmap.add(70_000)
+
+    assert isinstance(bitmap.containers[0], int)
+    assert 70_000 in bitmap and 3 not in bitmap
+
+    for id_ in range(ARRAY_MAX_SIZE + 1):
+        bitmap.discard(id_ * 2)
+    bitmap.discard(70_000)
+
+    assert bitmap.containers == {}
+
+
+def test_index_candidates() -> None:
+    index = AmenityIndex(refresh_seconds=60)
+    index.add([(1, 10), (2, 10), (2, 20), (3, 20), (3, 30), (4, 30)])
+
+    def candidates(**kwargs) -> list:
+        return list(index.candidates(**kwargs))
+
+    assert candidates(amenities=[10, 20], match=AmenityMatch.all) == [2]
+    assert candidates(amenities=[10, 20], match=AmenityMatch.any) == [1, 2, 3]
+    assert candidates(amenities=[40], match=AmenityMatch.any) == []
+    assert index.candidates(amenities=None, match=AmenityMatch.any) is None
+
+
+@pytest.mark.asyncio
+async def test_index_rereads_touched_units(pg_db: Database) -> None:
+    amenities = [(await create_random_amenity(pg_db)).id for _ in range(2)]
+    await seed_units(pg_db, count=3, amenities=amenities)
+    index = AmenityIndex(refresh_seconds=60)
+    await index.rebuild(pg_db)
+    unit_ids = list(index.candidates(amenities=amenities, match=AmenityMatch.all))
+
+    await crud.unit.sync_unit_amenities(
+        pg_db, model_id=unit_ids[0], amenities=amenities[:1]
+    )
+    await crud.unit.remove(pg_db, model_id=unit_ids[1])
+    index.touch(unit_ids[:2])
+    await index.refresh(pg_db)
+
+    assert list(index.candidates(amenities=amenities, match=AmenityMatch.all)) == [
+        unit_ids[2]
+    ]
+    assert list(index.candidates(amenities=amenities[:1], match=AmenityMatch.any)) == [
+        unit_ids[0],
+        unit_ids[2],
+    ]
+
+
+@pytest.mark.asyncio
+async def test_crud_search_with_index(pg_db: Database) -> None:
+    amenities = [(await create_random_amenity(pg_db)).id for _ in range(3)]
+    await seed_units(pg_db, count=20, amenities=amenities[:2])
+    await seed_units(pg_db, count=20, amenities=amenities[1:])
+    forms = [
+        UnitForm(amenities=amenities[:2], match=AmenityMatch.all),
+        UnitForm(amenities=amenities, match=AmenityMatch.any, max_price=100),
+        UnitForm(amenities=amenities[1:2], exclude_amenities=amenities[2:]),
+        UnitForm(exclude_amenities=amenities[:1], min_price=190, max_price=200),
+    ]
+    expected = [await crud.unit.search(pg_db, form=form) for form in forms]
+    index = crud.unit.amenity_index = AmenityIndex(refresh_seconds=60)
+    try:
+        found = [await crud.unit.search(pg_db, form=form) for form in forms]
+        unit_id = found[0][0].id
+        await crud.unit.delete_unit_amenities(pg_db, model_id=unit_id)
+        after_delete = await crud.unit.search(pg_db, form=forms[0])
+    finally:
+        crud.unit.amenity_index = None
+
+    assert found == expected
+    assert found[2] and found[3]
+    assert unit_id not in {unit.id for unit in after_delete}
+    assert unit_id not in index.bitmaps[amenities[0]]
+    assert len(after_delete) == len(found[0]) - 1
+
+
+@pytest.mark.asyncio
+async def test_index_ignores_rolled_back_links(pg_db: Database) -> None:
+    amenities = [(await create_random_amenity(pg_db)).id for _ in range(2)]
+    building = await create_random_building(pg_db)
+    obj = await crud.unit.create(
+        pg_db,
+        obj_in=UnitIn(
+            price=100,
+            square=50,
+            bedrooms=1,
+            bathrooms=1,
+            building_id=building.id,
+            amenities=amenities[:1],
+        ),
+    )
+    form = UnitForm(amenities=amenities[:1], exclude_amenities=amenities[1:])
+    index = crud.unit.amenity_index = AmenityIndex(refresh_seconds=60)
+    try:
+        await index.rebuild(pg_db)
+        async with pg_db.connection() as connection:
+            with pytest.raises(RuntimeError):
+                async with connection.transaction():
+                    await crud.unit.add_amenities_to_unit(
+                        connection, model_id=obj.id, amenities=amenities[1:]
+                    )
+                    raise RuntimeError
+        found = await crud.unit.search(pg_db, form=form)
+    finally:
+        crud.unit.amenity_index = None
+
+    assert obj.id in {unit.id for unit in found}
+    assert obj.id not in index.bitmaps.get(amenities[1], [])
+
+
+@pytest.mark.asyncio
+async def test_search_finds_units_linked_since_refresh(pg_db: Database) -> None:
+    amenities = [(await create_random_amenity(pg_db)).id for _ in range(2)]
+    await seed_units(pg_db, count=5, amenities=amenities[:1])
+    form = UnitForm(amenities=amenities[1:])
+    index = crud.unit.amenity_index = AmenityIndex(refresh_seconds=60)
+    try:
+        await index.rebuild(pg_db)
+        unit_id = await pg_db.fetch_val(
+            "SELECT unit_id FROM unit_amenities WHERE amenity_id = :amenity_id",
+            values=dict(amenity_id=amenities[0]),
+        )
+        # Linked as another process would, without touching the index
+        await pg_db.execute(
+            "INSERT INTO unit_amenities (unit_id, amenity_id) VALUES (:unit, :amenity)",
+            values=dict(unit=unit_id, amenity=amenities[1]),
+        )
+        found = await crud.unit.search(pg_db, form=form)
+        total = await crud.unit.search_total(pg_db, form=form)
+    finally:
+        crud.unit.amenity_index = None
+
+    assert unit_id not in index.bitmaps.get(amenities[1], [])
+    assert [unit.id for unit in found] == [unit_id]
+    assert total == (1, True)
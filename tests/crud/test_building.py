@@ -0,0 +1,231 @@
+import pytest
+from databases import Database
+from pydantic import ValidationError
+
+from app import crud
+from app.core.cache import TTLCache
+from app.crud.geo import box_tiles, tile_bounds
+from app.schemas import BuildingForm, UnitForm, UnitIn
+from tests.utils.unit import create_random_building
+from tests.utils.utils import explain_query, seq_scanned_relations
+
+# A point, one about 5 km north of it and one far away. Tests shift them by
+# whole degrees of longitude to stay apart from each other's buildings.
+COORDINATES = [(10.0, 0.0), (10.045, 0.0), (14.0, 3.0)]
+
+
+def coordinates(longitude_shift: float):
+    return [
+        (latitude, longitude + longitude_shift) for latitude, longitude in COORDINATES
+    ]
+
+
+@pytest.mark.asyncio
+async def test_search_buildings_by_radius_nearest_first(pg_db: Database) -> None:
+    buildings = [
+        await create_random_building(pg_db, latitude=latitude, longitude=longitude)
+        for latitude, longitude in reversed(coordinates(10))
+    ]
+    form = BuildingForm(latitude=10, longitude=10, radius=10)
+
+    found = await crud.building.search(pg_db, form=form)
+
+    assert [building.id for building in found] == [buildings[2].id, buildings[1].id]
+    assert found[0].distance < 0.01
+    assert found[1].distance == pytest.approx(5.0, abs=0.1)
+
+
+@pytest.mark.asyncio
+async def test_search_buildings_by_radius_pages_by_distance(pg_db: Database) -> None:
+    for latitude, longitude in coordinates(-100):
+        await create_random_building(pg_db, latitude=latitude, longitude=longitude)
+    form = BuildingForm(latitude=10, longitude=-100, radius=1000)
+
+    first_page = await crud.building.search(pg_db, form=form, limit=2)
+    cursor = crud.building.next_cursor(
+        first_page, limit=2, keys=crud.building.search_keys(form=form)
+    )
+    second_page = await crud.building.search(pg_db, form=form, limit=2, cursor=cursor)
+
+    distances = [building.distance for building in first_page + second_page]
+    assert len(distances) == 3
+    assert distances == sorted(distances)
+
+
+@pytest.mark.asyncio
+async def test_search_buildings_in_box_across_antimeridian(pg_db: Database) -> None:
+    inside = await create_random_building(pg_db, latitude=64.7, longitude=177.5)
+    await create_random_building(pg_db, latitude=64.7, longitude=170)
+    form = BuildingForm(
+        min_latitude=60, max_latitude=70, min_longitude=175, max_longitude=-170
+    )
+
+    found = await crud.building.search(pg_db, form=form)
+
+    assert [building.id for building in found] == [inside.id]
+
+
+@pytest.mark.asyncio
+async def test_search_units_near_point(pg_db: Database) -> None:
+    buildings = [
+        await create_random_building(pg_db, latitude=latitude, longitude=longitude)
+        for latitude, longitude in coordinates(-30)
+    ]
+    for building in buildings:
+        await crud.unit.create(
+            pg_db,
+            obj_in=UnitIn(
+                price=100, square=50, bedrooms=1, bathrooms=1, building_id=building.id
+            ),
+        )
+    form = UnitForm(latitude=10.04, longitude=-30, radius=10, max_price=1000)
+
+    found = await crud.unit.search(pg_db, form=form)
+
+    assert [unit.building_id for unit in found] == [buildings[1].id, buildings[0].id]
+
+
+@pytest.mark.asyncio
+async def test_geo_search_uses_coordinates_index(pg_db: Database) -> None:
+    await pg_db.execute(
+        """
+        INSERT INTO building (name, description, latitude, longitude, building_class,
+            postcode, number_of_units, number_of_floors, year_built)
+        SELECT '', '', 40 + (i % 200) * 0.1, 20 + (i / 200) * 0.1, 'A', '', 1, 1, ''
+        FROM generate_series(1, 20000) AS i
+        """
+    )
+    await pg_db.execute("ANALYZE building")
+
+    for form in [
+        BuildingForm(latitude=45, longitude=25, radius=5),
+        BuildingForm(
+            min_latitude=45, max_latitude=45.2, min_longitude=25, max_longitude=26
+        ),
+    ]:
+        plan = await explain_query(pg_db, crud.building.search_query(form=form))
+        assert not seq_scanned_relations(plan), plan
+
+
+def test_geo_form_needs_complete_filters() -> None:
+    with pytest.raises(ValidationError):
+        BuildingForm(latitude=55.75, longitude=37.61)
+
+
+@pytest.mark.asyncio
+async def test_building_clusters_aggregate_units_per_cell(pg_db: Database) -> None:
+    near = [
+        await create_random_building(pg_db, latitude=-30.1, longitude=-60.1),
+        await create_random_building(pg_db, latitude=-30.2, longitude=-60.2),
+    ]
+    far = await create_random_building(pg_db, latitude=-34.9, longitude=-64.9)
+    for building, prices in [(near[0], [100, 300]), (near[1], [200]), (far, [50])]:
+        for price in prices:
+            await crud.unit.create(
+                pg_db,
+                obj_in=UnitIn(
+                    price=price,
+                    square=50,
+                    bedrooms=1,
+                    bathrooms=1,
+                    building_id=building.id,
+                ),
+            )
+    tiles = box_tiles(
+        4, min_latitude=-35, max_latitude=-30, min_longitude=-65, max_longitude=-60
+    )
+
+    clusters = await crud.building.get_clusters(pg_db, zoom=4, tiles=tiles)
+    clusters = sorted(
+        (c for c in clusters if -35 <= c.latitude <= -30 and -65 <= c.longitude <= -60),
+        key=lambda c: c.units,
+    )
+
+    assert [(c.buildings, c.units) for c in clusters] == [(1, 1), (2, 3)]
+    assert clusters[1].latitude == pytest.approx(-30.133, abs=0.001)
+    assert (
+        clusters[1].min_price,
+        clusters[1].median_price,
+        clusters[1].max_price,
+    ) == (100, 200, 300)
+    key = (4, *tiles[0])
+    assert crud.building.cluster_cache.get(key) is not None
+
+
+@pytest.mark.asyncio
+async def test_building_clusters_batch_tiles_and_clamp_world_edges(
+    pg_db: Database, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    buildings = [
+        await create_random_building(pg_db, latitude=90, longitude=180),
+        await create_random_building(pg_db, latitude=88, longitude=178),
+        await create_random_building(pg_db, latitude=-89, longitude=-179),
+    ]
+    for building in buildings:
+        await crud.unit.create(
+            pg_db,
+            obj_in=UnitIn(
+                price=100, square=50, bedrooms=1, bathrooms=1, building_id=building.id
+            ),
+        )
+    monkeypatch.setattr(crud.building, "cluster_cache", TTLCache(maxsize=10, ttl=60))
+    queries = list()
+    fetch_all = pg_db.fetch_all
+
+    async def counted_fetch_all(query, *args, **kwargs):
+        queries.append(query)
+        return await fetch_all(query, *args, **kwargs)
+
+    monkeypatch.setattr(pg_db, "fetch_all", counted_fetch_all)
+    tiles = [(3, 3), (0, 0), (1, 1)]
+
+    clusters = await crud.building.get_clusters(pg_db, zoom=2, tiles=tiles)
+
+    assert len(queries) == 1
+    for tile in tiles:
+        assert crud.building.cluster_cache.get((2, *tile)) is not None
+    # The north east corner of the world falls in the last cell of its tile
+    corner = [c for c in clusters if c.latitude >= 84.375 and c.longitude >= 174.375]
+    assert [(c.buildings, c.units) for c in corner] == [(2, 2)]
+    assert all(c.latitude <= 90 and c.longitude <= 180 for c in clusters)
+    assert any(
+        c.latitude == pytest.approx(-89) and c.longitude == pytest.approx(-179)
+        for c in crud.building.cluster_cache.get((2, 0, 0))
+    )
+
+
+def test_box_tiles_across_antimeridian() -> None:
+    tiles = box_tiles(
+        2, min_latitude=0, max_latitude=90, min_longitude=170, max_longitude=-170
+    )
+
+    assert tiles == [(3, 2), (3, 3), (0, 2), (0, 3)]
+    assert tile_bounds(2, 3, 3) == (45, 90, 90, 180)
+
+
+@pytest.mark.asyncio
+async def test_search_buildings_by_text_in_box(pg_db: Database) -> None:
+    named = await create_random_building(pg_db, latitude=-20.5, longitude=120.5)
+    await pg_db.execute(
+        crud.building.model.update()
+        .where(crud.building.model.c.id == named.id)
+        .values(name="Riverside Tower", description="Offices")
+    )
+    described = await create_random_building(pg_db, latitude=-20.6, longitude=120.6)
+    await pg_db.execute(
+        crud.building.model.update()
+        .where(crud.building.model.c.id == described.id)
+        .values(name="Block 7", description="Apartments by the riverside")
+    )
+    form = BuildingForm(
+        q="riverside",
+        min_latitude=-21,
+        max_latitude=-20,
+        min_longitude=120,
+        max_longitude=121,
+    )
+
+    found = await crud.building.search(pg_db, form=form)
+
+    # Matches in the name rank above matches in the description
+    assert [building.id for building in found] == [named.id, described.id]
@@ -0,0 +1,82 @@
+from decimal import Decimal
+
+import pytest
+from databases import Database
+from sqlalchemy.dialects import postgresql
+
+from app import crud
+from app.crud.base import count_rows, encode_cursor, next_cursor, paginate
+from app.models import unit
+from app.schemas import UnitForm
+from tests.utils.unit import create_random_amenity, seed_units
+
+
+def compile_query(query) -> str:
+    return str(
+        query.compile(
+            dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+        )
+    )
+
+
+def test_paginate_without_cursor_uses_offset() -> None:
+    query = compile_query(paginate(unit.select(), keys=[unit.c.id], skip=20, limit=10))
+
+    assert "ORDER BY unit.id ASC" in query
+    assert "OFFSET 20" in query
+
+
+def test_paginate_with_cursor_seeks_after_last_row() -> None:
+    cursor = encode_cursor([Decimal("1250.50"), 42])
+    query = compile_query(
+        paginate(
+            unit.select(),
+            keys=[unit.c.price, unit.c.id],
+            skip=20,
+            limit=10,
+            cursor=cursor,
+        )
+    )
+
+    assert "(unit.price, unit.id) > (1250.50, 42)" in query
+    assert "OFFSET" not in query
+
+
+def test_paginate_descending() -> None:
+    cursor = encode_cursor([42])
+    query = compile_query(
+        paginate(unit.select(), keys=[unit.c.id], cursor=cursor, descending=True)
+    )
+
+    assert "(unit.id) < (42)" in query
+    assert "ORDER BY unit.id DESC" in query
+
+
+@pytest.mark.parametrize("cursor", ["not a cursor", encode_cursor([1, 2])])
+def test_paginate_invalid_cursor(cursor: str) -> None:
+    with pytest.raises(ValueError):
+        paginate(unit.select(), keys=[unit.c.id], cursor=cursor)
+
+
+def test_next_cursor() -> None:
+    records = [dict(id=1), dict(id=2)]
+
+    assert crud.unit.next_cursor(records, limit=3) is None
+    assert next_cursor(records, keys=[unit.c.id], limit=2) == encode_cursor([2])
+
+
+@pytest.mark.asyncio
+async def test_count_rows_estimates_beyond_exact_limit(pg_db: Database) -> None:
+    amenity_id = (await create_random_amenity(pg_db)).id
+    await seed_units(pg_db, count=50, amenities=[amenity_id])
+    query = crud.unit.search_query(form=UnitForm(amenities=[amenity_id]), limit=10)
+
+    exact = await count_rows(pg_db, query, exact_limit=50)
+    estimated = await count_rows(pg_db, query, exact_limit=10)
+    total = await crud.unit.search_total(
+        pg_db, form=UnitForm(amenities=[amenity_id], max_price=100)
+    )
+
+    assert exact == (50, True)
+    assert estimated[0] > 10 and not estimated[1]
+    assert total == (10, True)
@@ -0,0 +1,349 @@
+from typing import Any, Dict
+
+import pytest
+from asyncpg import ForeignKeyViolationError
+from databases import Database
+
+from app import crud
+from app.core.config import settings
+from app.models import unit
+from app.schemas import AmenityMatch, UnitForm, UnitIn, UnitSort, UnitUpdate
+from app.utils.unit import unit_facets_dict
+from tests.utils.unit import create_random_amenity, create_random_building, seed_units
+from tests.utils.utils import (
+    explain_query,
+    plan_node_types,
+    random_lower_string,
+    seq_scanned_relations,
+)
+
+pytestmark = pytest.mark.asyncio
+
+UNITS_COUNT = 20_000
+
+
+@pytest.mark.parametrize(
+    "form_data",
+    [
+        dict(min_price=100_000, max_price=100_200),
+        dict(min_price=100_000, max_price=100_200, min_square=50, max_square=150),
+        dict(min_price=100_000, max_price=100_200, match=AmenityMatch.any),
+        dict(min_price=100_000, max_price=100_200, match=AmenityMatch.all),
+        dict(q="penthouse"),
+    ],
+)
+async def test_search_does_not_scan_units_sequentially(
+    pg_db: Database, form_data: Dict[str, Any]
+) -> None:
+    amenities = [(await create_random_amenity(pg_db)).id for _ in range(3)]
+    await seed_units(pg_db, count=UNITS_COUNT, amenities=amenities)
+    if "match" in form_data:
+        form_data["amenities"] = amenities[:2]
+
+    plan = await explain_query(
+        pg_db, crud.unit.search_query(form=UnitForm(**form_data), limit=100)
+    )
+
+    assert not seq_scanned_relations(plan), plan
+
+
+@pytest.mark.parametrize("sort", list(UnitSort))
+async def test_sorted_search_reads_index_in_order(
+    pg_db: Database, sort: UnitSort
+) -> None:
+    await seed_units(pg_db, count=UNITS_COUNT, amenities=[])
+
+    plan = await explain_query(
+        pg_db, crud.unit.search_query(form=UnitForm(sort=sort), limit=100)
+    )
+
+    assert "Sort" not in plan_node_types(plan), plan
+    assert not seq_scanned_relations(plan), plan
+
+
+@pytest.mark.parametrize(
+    "sort", [UnitSort.price_desc, UnitSort.price_per_square, UnitSort.newest]
+)
+async def test_sorted_search_pages_are_stable(pg_db: Database, sort: UnitSort) -> None:
+    amenity_id = (await create_random_amenity(pg_db)).id
+    await seed_units(pg_db, count=15, amenities=[amenity_id])
+    # Ties on the sort key are broken by id
+    await pg_db.execute(
+        "UPDATE unit SET price = id % 3 * 100, square = 10 "
+        "WHERE amenity_ids @> ARRAY[:amenity_id]::integer[]",
+        values=dict(amenity_id=amenity_id),
+    )
+    form = UnitForm(amenities=[amenity_id], sort=sort)
+    units = await crud.unit.search(pg_db, form=form, limit=100)
+
+    pages, cursor = list(), None
+    while True:
+        page = await crud.unit.search(pg_db, form=form, limit=4, cursor=cursor)
+        pages += page
+        cursor = crud.unit.next_cursor(
+            page, limit=4, keys=crud.unit.search_keys(form=form)
+        )
+        if cursor is None:
+            break
+
+    if sort == UnitSort.price_per_square:
+        expected = sorted(units, key=lambda unit: (unit.price / unit.square, unit.id))
+    elif sort == UnitSort.price_desc:
+        expected = sorted(units, key=lambda unit: (unit.price, unit.id), reverse=True)
+    else:
+        expected = sorted(units, key=lambda unit: unit.id, reverse=True)
+    assert len(units) == 15
+    assert [unit.id for unit in units] == [unit.id for unit in expected]
+    assert [unit.id for unit in pages] == [unit.id for unit in expected]
+
+
+async def test_search_by_amenities(pg_db: Database) -> None:
+    amenities = [(await create_random_amenity(pg_db)).id for _ in range(2)]
+    missing_amenity = await create_random_amenity(pg_db)
+    await seed_units(pg_db, count=10, amenities=amenities)
+
+    found_any = await crud.unit.search(
+        pg_db,
+        form=UnitForm(amenities=[amenities[0], missing_amenity.id]),
+        limit=1000,
+    )
+    found_all = await crud.unit.search(
+        pg_db,
+        form=UnitForm(
+            amenities=[amenities[0], missing_amenity.id], match=AmenityMatch.all
+        ),
+        limit=1000,
+    )
+
+    assert len(found_any) == 10
+    assert not found_all
+
+
+async def test_search_by_text_with_filters_best_match_first(pg_db: Database) -> None:
+    building = await create_random_building(pg_db)
+    word = random_lower_string()
+    units = [
+        await crud.unit.create(
+            pg_db,
+            obj_in=UnitIn(
+                description=description,
+                price=price,
+                square=50,
+                bedrooms=1,
+                bathrooms=1,
+                building_id=building.id,
+            ),
+        )
+        for description, price in [
+            (f"{word} penthouse with a terrace, the best penthouses in town", 100),
+            (f"Penthouse near {word}", 100),
+            (f"{word} flat", 100),
+            (f"{word} penthouse", 1_000_000),
+        ]
+    ]
+    form = UnitForm(q=f"{word} penthouse", max_price=1000)
+
+    first_page = await crud.unit.search(pg_db, form=form, limit=1)
+    cursor = crud.unit.next_cursor(
+        first_page, limit=1, keys=crud.unit.search_keys(form=form)
+    )
+    second_page = await crud.unit.search(pg_db, form=form, limit=1, cursor=cursor)
+    cursor = crud.unit.next_cursor(
+        second_page, limit=1, keys=crud.unit.search_keys(form=form)
+    )
+    last_page = await crud.unit.search(pg_db, form=form, limit=1, cursor=cursor)
+
+    assert [unit.id for unit in first_page + second_page] == [units[0].id, units[1].id]
+    assert first_page[0].rank > second_page[0].rank
+    assert not last_page
+
+
+async def test_unit_facets(pg_db: Database) -> None:
+    amenities = [(await create_random_amenity(pg_db)).id for _ in range(2)]
+    await seed_units(pg_db, count=12, amenities=amenities)
+    form = UnitForm(amenities=amenities, match=AmenityMatch.all, max_price=110)
+
+    records = await crud.unit.get_facets(
+        pg_db, form=form, price_bucket=50, square_bucket=10
+    )
+    facets = unit_facets_dict(records)
+    hits = crud.unit.facets_cache.hits
+    await crud.unit.get_facets(
+        pg_db,
+        form=UnitForm(amenities=amenities[::-1], match=AmenityMatch.all, max_price=110),
+        price_bucket=50,
+        square_bucket=10,
+    )
+
+    assert facets["total"] == 11
+    assert [(b["min"], b["max"], b["count"]) for b in facets["price"]] == [
+        (0, 50, 4),
+        (50, 100, 5),
+        (100, 150, 2),
+    ]
+    assert [(b["min"], b["count"]) for b in facets["square"]] == [(20, 9), (30, 2)]
+    assert [b["count"] for b in facets["bedrooms"]] == [1, 2, 2, 2, 2, 2]
+    assert [(b["value"], b["count"]) for b in facets["bathrooms"]] == [
+        (0, 2),
+        (1, 3),
+        (2, 3),
+        (3, 3),
+    ]
+    assert [(b["value"], b["count"]) for b in facets["amenities"]] == [
+        (amenities[0], 11),
+        (amenities[1], 11),
+    ]
+    assert crud.unit.facets_cache.hits == hits + 1
+
+
+async def test_unit_facets_widen_buckets(
+    pg_db: Database, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "FACET_MAX_BUCKETS", 10)
+    await seed_units(pg_db, count=50, amenities=[])
+    form = UnitForm(min_price=10, max_price=500)
+
+    facets = unit_facets_dict(
+        await crud.unit.get_facets(
+            pg_db, form=form, price_bucket=0.0001, square_bucket=1
+        )
+    )
+
+    assert 1 < len(facets["price"]) <= 10
+    assert sum(bucket["count"] for bucket in facets["price"]) == facets["total"]
+    assert facets["price"][0]["min"] <= 10 and facets["price"][-1]["max"] > 500
+    for facet in ("price", "square"):
+        sizes = {round(bucket["max"] - bucket["min"], 6) for bucket in facets[facet]}
+        assert len(sizes) == 1
+
+
+async def test_unit_facets_ignore_sort(pg_db: Database) -> None:
+    await seed_units(pg_db, count=3, amenities=[])
+    await pg_db.execute("UPDATE unit SET square = 0 WHERE price = 10")
+    form = UnitForm(max_price=30, sort=UnitSort.price_per_square)
+
+    sorted_facets = unit_facets_dict(
+        await crud.unit.get_facets(pg_db, form=form, price_bucket=7, square_bucket=1)
+    )
+    crud.unit.facets_cache.clear()
+    facets = unit_facets_dict(
+        await crud.unit.get_facets(
+            pg_db,
+            form=form.copy(update=dict(sort=None)),
+            price_bucket=7,
+            square_bucket=1,
+        )
+    )
+
+    assert sorted_facets == facets
+    assert facets["total"] == await pg_db.fetch_val(
+        "SELECT count(*) FROM unit WHERE price <= 30"
+    )
+
+
+async def test_get_with_amenities(pg_db: Database) -> None:
+    amenities = [(await create_random_amenity(pg_db)).id for _ in range(3)]
+    await seed_units(pg_db, count=1, amenities=amenities)
+    (obj,) = await crud.unit.search(pg_db, form=UnitForm(amenities=amenities))
+
+    folded = await crud.unit.get_with_amenities(pg_db, model_id=obj.id)
+    joined = await crud.unit.get_unit_amenities(pg_db, model_id=obj.id)
+
+    assert folded.id == obj.id
+    assert folded.amenity_ids == sorted(amenities)
+    assert folded.amenity_names == [record.name for record in joined]
+
+
+async def test_create_unit_rolls_back_on_invalid_amenity(pg_db: Database) -> None:
+    building = await create_random_building(pg_db)
+    description = random_lower_string()
+    unit_in = UnitIn(
+        description=description,
+        price=100,
+        square=50,
+        bedrooms=1,
+        bathrooms=1,
+        building_id=building.id,
+        amenities=[-1],
+    )
+
+    # Requests run on a single pooled connection, see get_db_pg
+    async with pg_db.connection() as connection:
+        with pytest.raises(ForeignKeyViolationError):
+            await crud.unit.create(connection, obj_in=unit_in)
+
+    assert not await pg_db.fetch_all(
+        unit.select().where(unit.c.description == description)
+    )
+
+
+async def test_update_unit_syncs_changed_amenities_only(pg_db: Database) -> None:
+    amenities = [(await create_random_amenity(pg_db)).id for _ in range(3)]
+    await seed_units(pg_db, count=1, amenities=amenities[:2])
+    (obj,) = await crud.unit.search(pg_db, form=UnitForm(amenities=amenities))
+    links_query = """
+        SELECT amenity_id, xmin::text AS version FROM unit_amenities
+        WHERE unit_id = :unit_id ORDER BY amenity_id
+    """
+    (_, kept_link) = await pg_db.fetch_all(links_query, values=dict(unit_id=obj.id))
+
+    await crud.unit.update_by_id(
+        pg_db, model_id=obj.id, obj_in=UnitUpdate(amenities=amenities[1:])
+    )
+    links = await pg_db.fetch_all(links_query, values=dict(unit_id=obj.id))
+
+    assert [link.amenity_id for link in links] == amenities[1:]
+    assert links[0].version == kept_link.version
+
+
+async def test_unit_amenity_ids_follow_links(pg_db: Database) -> None:
+    amenities = [(await create_random_amenity(pg_db)).id for _ in range(3)]
+    await seed_units(pg_db, count=1, amenities=amenities[:2])
+    (obj,) = await crud.unit.search(pg_db, form=UnitForm(amenities=amenities))
+
+    await crud.unit.update_by_id(
+        pg_db, model_id=obj.id, obj_in=UnitUpdate(amenities=amenities[::-1])
+    )
+    await crud.amenity.remove(pg_db, model_id=amenities[1])
+    updated = await crud.unit.get(pg_db, model_id=obj.id)
+    rendered = await crud.unit.get_units_amenities(pg_db, unit_records=[updated])
+
+    assert obj.amenity_ids == amenities[:2]
+    assert updated.amenity_ids == [amenities[0], amenities[2]]
+    assert [amenity["id"] for amenity in rendered[obj.id]] == updated.amenity_ids
+
+
+async def test_unit_batch_reports_each_item(pg_db: Database) -> None:
+    building = await create_random_building(pg_db)
+    amenities = [(await create_random_amenity(pg_db)).id for _ in range(2)]
+    units_in = [
+        UnitIn(
+            price=price,
+            square=50,
+            bedrooms=1,
+            bathrooms=1,
+            building_id=building_id,
+            amenities=amenities,
+        )
+        for price, building_id in [(100, building.id), (200, -1), (300, building.id)]
+    ]
+
+    async with pg_db.connection() as connection:
+        created = await crud.unit.create_many(connection, objs_in=units_in)
+        unit_ids = [result.id for result in created if result.ok]
+        updated = await crud.unit.update_many(
+            connection,
+            objs_in=[
+                dict(id=unit_ids[0], price=150, amenities=amenities[1:]),
+                dict(id=unit_ids[1], amenities=[]),
+                dict(id=-1, price=1),
+            ],
+        )
+        removed = await crud.unit.remove_many(connection, model_ids=[unit_ids[0], -1])
+
+    assert [result.ok for result in created] == [True, False, True]
+    assert [result.ok for result in updated] == [True, True, False]
+    assert [result.ok for result in removed] == [True, False]
+    assert not await crud.unit.get(pg_db, model_id=unit_ids[0])
+    assert (await crud.unit.get(pg_db, model_id=unit_ids[1])).price == 300
+    assert not await crud.unit.get_unit_amenities(pg_db, model_id=unit_ids[1])
@@ -0,0 +1,127 @@
+import asyncio
+
+import pytest
+from databases import Database
+
+from app import crud
+from app.crud.unit_engine import UnitSearchEngine
+from app.schemas import AmenityMatch, UnitForm, UnitUpdate
+from tests.utils.unit import create_random_amenity, seed_units
+
+numpy = pytest.importorskip("numpy")
+pytestmark = pytest.mark.asyncio
+
+
+async def test_engine_matches_postgres(pg_db: Database) -> None:
+    amenities = [(await create_random_amenity(pg_db)).id for _ in range(3)]
+    await seed_units(pg_db, count=200, amenities=amenities[:2])
+    engine = UnitSearchEngine(refresh_seconds=60)
+    await engine.refresh(pg_db)
+
+    for form in [
+        UnitForm(),
+        UnitForm(min_price=500, max_price=1500, min_bedrooms=2, max_bathrooms=2),
+        UnitForm(amenities=amenities[1:], match=AmenityMatch.any),
+        UnitForm(amenities=amenities[1:], match=AmenityMatch.all),
+        UnitForm(amenities=amenities[:2], match=AmenityMatch.all, max_price=100),
+    ]:
+        expected = await crud.unit.search(pg_db, form=form, limit=10_000)
+
+        found = engine.search(form, skip=0, limit=10_000, after_id=None)
+
+        assert found == [unit.id for unit in expected], form
+        after_id = found[4] if len(found) > 4 else None
+        assert (
+            engine.search(form, skip=1, limit=3, after_id=after_id)
+            == [unit.id for unit in expected if after_id is None or unit.id > after_id][
+                1:4
+            ]
+        )
+
+
+async def test_engine_rereads_touched_units(pg_db: Database) -> None:
+    await seed_units(pg_db, count=3, amenities=[])
+    engine = UnitSearchEngine(refresh_seconds=60)
+    await engine.refresh(pg_db)
+    form = UnitForm(min_price=12_345, max_price=12_345)
+    first, second = engine.search(UnitForm(), skip=0, limit=10**6, after_id=None)[-2:]
+
+    await crud.unit.update_by_id(pg_db, model_id=first, obj_in=UnitUpdate(price=12_345))
+    await crud.unit.remove(pg_db, model_id=second)
+    before = engine.search(form, skip=0, limit=10, after_id=None)
+    engine.touch([first, second])
+    await engine.refresh(pg_db)
+
+    assert first not in before
+    assert engine.search(form, skip=0, limit=10, after_id=None)[-1] == first
+    assert second not in engine.search(UnitForm(), skip=0, limit=10**6, after_id=None)
+    assert engine.stats()["memory_bytes"] > 0
+
+
+async def test_crud_search_pages_through_engine(pg_db: Database) -> None:
+    await seed_units(pg_db, count=25, amenities=[])
+    form = UnitForm(min_price=100, max_price=200)
+    expected = await crud.unit.search(pg_db, form=form, limit=10_000)
+    crud.unit.engine = UnitSearchEngine(refresh_seconds=60)
+    try:
+        pages, cursor = list(), None
+        while True:
+            page = await crud.unit.search(pg_db, form=form, limit=4, cursor=cursor)
+            pages += page
+            cursor = crud.unit.next_cursor(page, limit=4)
+            if cursor is None:
+                break
+        await pg_db.execute(
+            crud.unit.model.delete().where(crud.unit.model.c.id == expected[0].id)
+        )
+        after_delete = await crud.unit.search(pg_db, form=form, limit=1)
+    finally:
+        crud.unit.engine = None
+
+    assert [unit.id for unit in pages] == [unit.id for unit in expected]
+    assert after_delete[0].id == expected[1].id
+
+
+async def test_crud_search_checks_units_changed_elsewhere(pg_db: Database) -> None:
+    await seed_units(pg_db, count=10, amenities=[])
+    form = UnitForm(min_price=20, max_price=50)
+    expected = await crud.unit.search(pg_db, form=form, limit=10_000)
+    crud.unit.engine = UnitSearchEngine(refresh_seconds=60)
+    try:
+        await crud.unit.engine.refresh(pg_db)
+        # Written as another process would, without touching the engine
+        moved_out, moved_in = expected[0].id, expected[-1].id + 1
+        await pg_db.execute(
+            "UPDATE unit SET price = CASE WHEN id = :moved_out THEN 1000 ELSE 25 END "
+            "WHERE id IN (:moved_out, :moved_in)",
+            values=dict(moved_out=moved_out, moved_in=moved_in),
+        )
+        found = await crud.unit.search(pg_db, form=form, limit=10_000)
+        page = await crud.unit.search(pg_db, form=form, skip=1, limit=2)
+    finally:
+        crud.unit.engine = None
+
+    ids = [unit.id for unit in expected[1:]] + [moved_in]
+    assert [unit.id for unit in found] == ids
+    assert [unit.id for unit in page] == ids[1:3]
+    assert all(form.min_price <= unit.price <= form.max_price for unit in found)
+
+
+async def test_refresh_awaits_refresh_in_progress(pg_db: Database) -> None:
+    await seed_units(pg_db, count=3, amenities=[])
+    engine = UnitSearchEngine(refresh_seconds=60)
+    await engine.refresh(pg_db)
+    unit_id = engine.search(UnitForm(), skip=0, limit=10**6, after_id=None)[-1]
+    await crud.unit.update_by_id(
+        pg_db, model_id=unit_id, obj_in=UnitUpdate(price=54_321)
+    )
+    engine.touch([unit_id])
+
+    async with engine.lock:
+        refresh = asyncio.ensure_future(engine.refresh(pg_db))
+        await asyncio.sleep(0.01)
+        assert not refresh.done()
+    await refresh
+
+    form = UnitForm(min_price=54_321, max_price=54_321)
+    assert engine.search(form, skip=0, limit=10, after_id=None) == [unit_id]
@@ -155,3 +155,47 @@ async def test_update_user(pg_db: Database) -> None:
     assert user_2
     assert user.email == user_2.email
     assert verify_password(new_password, user_2.hashed_password)
+
+
+async def test_update_missing_user(pg_db: Database) -> None:
+    user_in_update = UserUpdate(first_name=random_lower_string())
+
+    user = await crud.user.update_by_id(pg_db, model_id=-1, obj_in=user_in_update)
+
+    assert user is None
+
+
+async def test_remove_user(pg_db: Database) -> None:
+    email = random_email()
+    password = random_lower_string()
+    first_name = random_lower_string()
+    last_name = random_lower_string()
+    user_in = UserIn(
+        email=email, password=password, first_name=first_name, last_name=last_name
+    )
+    user = await crud.user.create(pg_db, obj_in=user_in)
+
+    removed_user = await crud.user.remove(pg_db, model_id=user.id)
+
+    assert removed_user
+    assert removed_user.id == user.id
+    assert await crud.user.get(pg_db, model_id=user.id) is None
+    assert await crud.user.remove(pg_db, model_id=user.id) is None
+
+
+async def test_update_user_invalidates_cache(pg_db: Database) -> None:
+    email = random_email()
+    password = random_lower_string()
+    first_name = random_lower_string()
+    last_name = random_lower_string()
+    user_in = UserIn(
+        email=email, password=password, first_name=first_name, last_name=last_name
+    )
+    user = await crud.user.create(pg_db, obj_in=user_in)
+    await crud.user.get_cached(pg_db, model_id=user.id)
+
+    await crud.user.update(pg_db, db_obj=user, obj_in=UserUpdate(is_active=False))
+    user_2 = await crud.user.get_cached(pg_db, model_id=user.id)
+
+    assert user_2
+    assert user_2.is_active is False
@@ -13,8 +13,13 @@ from tests.utils.utils import get_superuser_token_headers, random_email
 
 @pytest_asyncio.fixture
 async def api_client() -> AsyncClient:
-    async with AsyncClient(app=app, base_url=settings.SERVER_HOST) as client:
-        yield client
+    # AsyncClient does not send lifespan events, the pool is opened by hand
+    await app.router.startup()
+    try:
+        async with AsyncClient(app=app, base_url=settings.SERVER_HOST) as client:
+            yield client
+    finally:
+        await app.router.shutdown()
 
 
 @pytest.fixture(autouse=True)
@@ -23,6 +28,11 @@ def reset_dependency_overrides() -> Generator:
     app.dependency_overrides = {}
 
 
+@pytest.fixture(autouse=True)
+def disable_emails(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "SEND_EMAILS_TO_USERS", False)
+
+
 @pytest_asyncio.fixture
 async def superuser_token_headers(api_client: AsyncClient) -> Dict[str, str]:
     return await get_superuser_token_headers(api_client)
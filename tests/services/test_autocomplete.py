@@ -0,0 +1,139 @@
+import asyncio
+from typing import List
+
+import pytest
+from databases import Database
+
+from app import crud
+from app.schemas import BuildingUpdate, Suggestion, SuggestionKind
+from app.services.autocomplete import Autocomplete, PrefixIndex, similar_query
+from tests.utils.unit import create_random_building
+from tests.utils.utils import random_lower_string
+
+
+def test_prefix_index_matches_word_starts() -> None:
+    index = PrefixIndex.build(
+        [
+            dict(id=1, name="Riverside Tower", postcode="101000"),
+            dict(id=2, name="Tower Bridge", postcode="101000"),
+        ],
+        [dict(id=1, name="Rooftop terrace")],
+    )
+
+    # In the order of the matched terms, "tower" before "tower bridge"
+    assert index.lookup("TOW", limit=10) == [
+        Suggestion(kind=SuggestionKind.building, id=1, text="Riverside Tower"),
+        Suggestion(kind=SuggestionKind.building, id=2, text="Tower Bridge"),
+    ]
+    assert index.lookup("riverside  to", limit=10)[0].id == 1
+    assert index.lookup("ter", limit=10)[0].kind == SuggestionKind.amenity
+    assert index.lookup("1010", limit=10) == [
+        Suggestion(kind=SuggestionKind.postcode, id=None, text="101000")
+    ]
+
+    index.set_building(2, "Tower Bridge", "102000")
+    index.remove_building(1)
+
+    assert [s.text for s in index.lookup("10", limit=10)] == ["102000"]
+    assert not index.lookup("riv", limit=10)
+    assert index.entries == sorted(index.entries)
+
+
+@pytest.mark.asyncio
+async def test_autocomplete_loads_changed_buildings(pg_db: Database) -> None:
+    autocomplete = Autocomplete(refresh_seconds=0, rebuild_seconds=3600)
+    building = await create_random_building(pg_db)
+    name = random_lower_string()
+
+    await autocomplete.refresh(pg_db)
+    before = await autocomplete.suggest(pg_db, q=name, limit=5)
+    await crud.building.update_by_id(
+        pg_db, model_id=building.id, obj_in=BuildingUpdate(name=name)
+    )
+    await autocomplete.refresh(pg_db)
+    after = await autocomplete.suggest(pg_db, q=name[:5], limit=5)
+
+    assert not any(suggestion.id == building.id for suggestion in before)
+    assert Suggestion(kind=SuggestionKind.building, id=building.id, text=name) in after
+
+
+@pytest.mark.asyncio
+async def test_autocomplete_suggests_similar_words(pg_db: Database) -> None:
+    autocomplete = Autocomplete(refresh_seconds=0, rebuild_seconds=3600)
+    await autocomplete.refresh(pg_db)
+    if not autocomplete.has_trigrams:
+        pytest.skip("pg_trgm is not available")
+    building = await create_random_building(pg_db)
+    await crud.building.update_by_id(
+        pg_db, model_id=building.id, obj_in=BuildingUpdate(name="Lakeshore Plaza")
+    )
+
+    found = await autocomplete.suggest(pg_db, q="lakshore", limit=5)
+
+    assert any(suggestion.id == building.id for suggestion in found)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_wait_for_first_build(pg_db: Database) -> None:
+    autocomplete = Autocomplete(refresh_seconds=60, rebuild_seconds=3600)
+    name = random_lower_string()
+    building = await create_random_building(pg_db)
+    await crud.building.update_by_id(
+        pg_db, model_id=building.id, obj_in=BuildingUpdate(name=name)
+    )
+
+    async def request() -> List[Suggestion]:
+        await autocomplete.refresh(pg_db)
+        return await autocomplete.suggest(pg_db, q=name, limit=5)
+
+    found = await asyncio.gather(request(), request())
+
+    assert all(
+        [suggestion.id for suggestion in suggestions] == [building.id]
+        for suggestions in found
+    )
+
+
+# Crude stand-ins for the pg_trgm functions, to run similar_query without it
+TRIGRAM_STAND_INS = [
+    """
+    CREATE FUNCTION word_similarity(text, text) RETURNS real AS $$
+        SELECT CASE WHEN strpos(lower($2), lower($1)) > 0 THEN 1 ELSE 0 END::real
+    $$ LANGUAGE sql IMMUTABLE
+    """,
+    """
+    CREATE FUNCTION word_similarity_op(text, text) RETURNS boolean AS $$
+        SELECT word_similarity($1, $2) > 0.5
+    $$ LANGUAGE sql IMMUTABLE
+    """,
+    "CREATE OPERATOR <% (LEFTARG = text, RIGHTARG = text, FUNCTION = word_similarity_op)",
+]
+
+
+@pytest.mark.asyncio
+async def test_similar_query(pg_db: Database) -> None:
+    has_trigrams = await pg_db.fetch_val(
+        "SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')"
+    )
+    word = random_lower_string()
+    building = await create_random_building(pg_db)
+    await crud.building.update_by_id(
+        pg_db, model_id=building.id, obj_in=BuildingUpdate(name=f"{word} Plaza")
+    )
+
+    async with pg_db.connection() as connection:
+        transaction = await connection.transaction()
+        try:
+            if not has_trigrams:
+                for statement in TRIGRAM_STAND_INS:
+                    await connection.execute(statement)
+            found = await connection.fetch_all(similar_query(word, limit=5))
+        finally:
+            await transaction.rollback()
+
+    assert (SuggestionKind.building, building.id) in {
+        (record["kind"], record["id"]) for record in found
+    }
+    assert [record["score"] for record in found] == sorted(
+        (record["score"] for record in found), reverse=True
+    )
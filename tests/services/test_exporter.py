@@ -0,0 +1,57 @@
+import csv
+import io
+
+import orjson
+import pytest
+from databases import Database
+
+from app import crud
+from app.schemas import ImportFormat, UnitOut
+from app.services.exporter import export_feed
+from app.utils.unit import folded_unit_dict
+from tests.utils.unit import create_random_amenity, seed_units
+
+pytestmark = pytest.mark.asyncio
+
+UNIT_COLUMNS = list(UnitOut.__fields__)
+
+
+async def export_units(db: Database, feed_format: ImportFormat) -> str:
+    chunks = [
+        chunk
+        async for chunk in export_feed(
+            db,
+            query=crud.unit.export_query(),
+            columns=UNIT_COLUMNS,
+            row=folded_unit_dict,
+            feed_format=feed_format,
+        )
+    ]
+    return b"".join(chunks).decode()
+
+
+async def test_export_units_as_ndjson(pg_db: Database) -> None:
+    amenities = [(await create_random_amenity(pg_db)).id for _ in range(2)]
+    await seed_units(pg_db, count=1500, amenities=amenities)
+
+    rows = [
+        orjson.loads(line)
+        for line in (await export_units(pg_db, ImportFormat.ndjson)).splitlines()
+    ]
+
+    assert len(rows) >= 1500
+    assert [row["id"] for row in rows] == sorted(row["id"] for row in rows)
+    assert [amenity["id"] for amenity in rows[-1]["amenities"]] == sorted(amenities)
+    assert isinstance(rows[-1]["price"], float)
+
+
+async def test_export_units_as_csv(pg_db: Database) -> None:
+    amenities = [(await create_random_amenity(pg_db)).id for _ in range(2)]
+    await seed_units(pg_db, count=10, amenities=amenities)
+
+    rows = list(
+        csv.DictReader(io.StringIO(await export_units(pg_db, ImportFormat.csv)))
+    )
+
+    assert list(rows[0]) == UNIT_COLUMNS
+    assert rows[-1]["amenities"] == ";".join(map(str, sorted(amenities)))
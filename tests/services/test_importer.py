@@ -0,0 +1,121 @@
+from typing import AsyncIterator
+
+import orjson
+import pytest
+from databases import Database
+
+from app import crud
+from app.schemas import ImportFormat
+from app.services.importer import import_feed
+from tests.utils.unit import create_random_amenity, create_random_building
+
+pytestmark = pytest.mark.asyncio
+
+
+async def byte_chunks(data: bytes, size: int = 7) -> AsyncIterator[bytes]:
+    for start in range(0, len(data), size):
+        yield data[start : start + size]
+
+
+async def test_import_units_from_csv(pg_db: Database) -> None:
+    building = await create_random_building(pg_db)
+    amenities = [(await create_random_amenity(pg_db)).id for _ in range(2)]
+    feed = (
+        "description,price,square,bedrooms,bathrooms,building_id,amenities\n"
+        f'"two lines,\nquoted",100.1,50,1,1,{building.id},{amenities[0]};{amenities[1]}\n'
+        f"plain,200,60,2,1,{building.id},\n"
+        f"invalid,cheap,60,2,1,{building.id},\n"
+        "orphan,300,70,3,2,-1,\n"
+    ).encode()
+
+    async with pg_db.connection() as connection:
+        result = await import_feed(
+            connection,
+            kind="units",
+            chunks=byte_chunks(feed),
+            feed_format=ImportFormat.csv,
+        )
+    units = await pg_db.fetch_all(
+        "SELECT * FROM unit WHERE building_id = :building_id ORDER BY price",
+        values=dict(building_id=building.id),
+    )
+
+    assert (result.rows, result.merged, result.invalid) == (3, 2, 1)
+    assert result.errors[0].startswith("line 5:")
+    assert [unit.description for unit in units] == ["two lines,\nquoted", "plain"]
+    assert str(units[0].price) == "100.1"
+    linked = await crud.unit.get_unit_amenities(pg_db, model_id=units[0].id)
+    assert [amenity.id for amenity in linked] == sorted(amenities)
+
+
+async def test_import_buildings_from_ndjson_upserts_by_id(pg_db: Database) -> None:
+    building = await create_random_building(pg_db)
+    rows = [
+        dict(
+            id=building.id,
+            name="renamed",
+            latitude=55.75,
+            longitude=37.61,
+            building_class="A",
+            postcode="101000",
+            number_of_units=10,
+            number_of_floors=5,
+            year_built="2020",
+        ),
+        dict(name="new", latitude=1, longitude=2, building_class="B"),
+    ]
+    feed = b"\n".join(orjson.dumps(row) for row in rows)
+
+    async with pg_db.connection() as connection:
+        result = await import_feed(
+            connection,
+            kind="buildings",
+            chunks=byte_chunks(feed),
+            feed_format=ImportFormat.ndjson,
+        )
+
+    assert (result.rows, result.merged, result.invalid) == (1, 1, 1)
+    assert (await crud.building.get(pg_db, model_id=building.id)).name == "renamed"
+    created = await create_random_building(pg_db)
+    assert created.id > building.id
+
+
+async def test_import_keeps_last_duplicate_and_skips_given_ids(
+    pg_db: Database,
+) -> None:
+    building = await create_random_building(pg_db)
+    # The id the sequence would draw next
+    next_id = building.id + 1
+    fields = dict(
+        latitude=1,
+        longitude=2,
+        building_class="B",
+        postcode="101000",
+        number_of_units=1,
+        number_of_floors=1,
+        year_built="2020",
+    )
+    rows = [
+        dict(id=building.id, name="first", **fields),
+        dict(name="drawn", **fields),
+        dict(id=next_id, name="given", **fields),
+        dict(id=building.id, name="last", **fields),
+    ]
+    feed = b"\n".join(orjson.dumps(row) for row in rows)
+
+    async with pg_db.connection() as connection:
+        result = await import_feed(
+            connection,
+            kind="buildings",
+            chunks=byte_chunks(feed),
+            feed_format=ImportFormat.ndjson,
+        )
+    names = await pg_db.fetch_all(
+        "SELECT id, name FROM building WHERE id > :id ORDER BY id",
+        values=dict(id=building.id),
+    )
+
+    assert (result.rows, result.merged, result.invalid) == (4, 3, 0)
+    assert (await crud.building.get(pg_db, model_id=building.id)).name == "last"
+    assert [row.name for row in names] == ["given", "drawn"]
+    assert names[0].id == next_id
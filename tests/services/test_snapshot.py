@@ -0,0 +1,100 @@
+import io
+
+import pytest
+from databases import Database
+from sqlalchemy.engine import make_url
+
+from app import crud
+from app.core.config import settings
+from app.schemas import SnapshotFormat, UnitUpdate
+from app.services.snapshot import snapshot_watermark, write_snapshot
+from tests.utils.unit import create_random_amenity, seed_units
+
+pyarrow = pytest.importorskip("pyarrow")
+parquet = pytest.importorskip("pyarrow.parquet")
+pytestmark = pytest.mark.asyncio
+
+
+async def read_snapshot(
+    db: Database, *, since=None, snapshot_format
+) -> "pyarrow.Table":
+    query = crud.unit.snapshot_query(since=since)
+    data = b"".join(
+        [
+            chunk
+            async for chunk in write_snapshot(
+                db, query=query, snapshot_format=snapshot_format
+            )
+        ]
+    )
+    if snapshot_format == SnapshotFormat.parquet:
+        return parquet.read_table(io.BytesIO(data))
+    return pyarrow.ipc.open_stream(data).read_all()
+
+
+@pytest.mark.parametrize("snapshot_format", list(SnapshotFormat))
+async def test_snapshot_units(pg_db: Database, snapshot_format: SnapshotFormat) -> None:
+    amenities = [(await create_random_amenity(pg_db)).id for _ in range(2)]
+    await seed_units(pg_db, count=10, amenities=amenities)
+
+    table = await read_snapshot(pg_db, snapshot_format=snapshot_format)
+    last = table.slice(table.num_rows - 1).to_pylist()[0]
+
+    assert table.num_rows >= 10
+    assert table.schema.field("price").type == pyarrow.float64()
+    assert last["amenity_ids"] == sorted(amenities)
+    assert last["building_name"]
+
+
+async def test_snapshot_units_since_watermark(pg_db: Database) -> None:
+    amenities = [(await create_random_amenity(pg_db)).id for _ in range(2)]
+    await seed_units(pg_db, count=3, amenities=amenities)
+    units = await crud.unit.get_multi(pg_db, limit=1000)
+    watermark = await snapshot_watermark(pg_db)
+
+    await crud.unit.update_by_id(
+        pg_db, model_id=units[-1].id, obj_in=UnitUpdate(price=1)
+    )
+    await crud.unit.update_by_id(
+        pg_db, model_id=units[-2].id, obj_in=UnitUpdate(amenities=amenities[:1])
+    )
+    table = await read_snapshot(
+        pg_db, since=watermark, snapshot_format=SnapshotFormat.arrow
+    )
+
+    assert sorted(table.column("id").to_pylist()) == [units[-2].id, units[-1].id]
+
+
+async def test_watermark_stays_behind_hidden_transactions(pg_db: Database) -> None:
+    await pg_db.execute("DROP ROLE IF EXISTS watermark_reader")
+    await pg_db.execute("CREATE ROLE watermark_reader LOGIN PASSWORD 'reader'")
+    # Sees neither the transactions of pg_db nor those of other databases
+    reader = Database(
+        make_url(settings.TEST_POSTGRES_URL)
+        .set(username="watermark_reader", password="reader")
+        .render_as_string(hide_password=False)
+    )
+    other_db = Database(settings.POSTGRES_URL)
+    await reader.connect()
+    await other_db.connect()
+    try:
+        previous = await pg_db.fetch_val("SELECT now() - interval '1 hour'")
+        async with pg_db.connection() as connection:
+            async with connection.transaction():
+                await connection.execute("SELECT txid_current()")
+                hidden = await snapshot_watermark(reader, previous=previous)
+                first = await snapshot_watermark(reader)
+        async with other_db.connection() as connection:
+            async with connection.transaction():
+                started = await connection.fetch_val("SELECT now()")
+                await connection.execute("SELECT txid_current()")
+                watermark = await snapshot_watermark(pg_db)
+        server_start = await pg_db.fetch_val("SELECT pg_postmaster_start_time()")
+    finally:
+        await reader.disconnect()
+        await other_db.disconnect()
+        await pg_db.execute("DROP ROLE watermark_reader")
+
+    assert hidden == previous
+    assert first == server_start
+    assert watermark > started
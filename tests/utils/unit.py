@@ -0,0 +1,55 @@
+from typing import Any, List
+
+from databases import Database
+
+from app import crud
+from app.schemas import AmenityIn, BuildingIn
+from tests.utils.utils import random_lower_string
+
+
+async def create_random_building(
+    db: Database, *, latitude: float = 55.75, longitude: float = 37.61
+) -> Any:
+    building_in = BuildingIn(
+        name=random_lower_string(),
+        description=random_lower_string(),
+        latitude=latitude,
+        longitude=longitude,
+        building_class="business",
+        postcode="101000",
+        number_of_units=100,
+        number_of_floors=10,
+        year_built="2020",
+    )
+    return await crud.building.create(db, obj_in=building_in)
+
+
+async def create_random_amenity(db: Database) -> Any:
+    return await crud.amenity.create(db, obj_in=AmenityIn(name=random_lower_string()))
+
+
+async def seed_units(db: Database, *, count: int, amenities: List[int]) -> None:
+    """
+    Insert `count` units with prices 10, 20, ... linked to all `amenities`
+    and refresh the planner statistics.
+    """
+    building = await create_random_building(db)
+    await db.execute(
+        """
+        INSERT INTO unit (description, price, square, bedrooms, bathrooms, building_id)
+        SELECT '', i * 10, 20 + i % 200, i % 6, i % 4, :building_id
+        FROM generate_series(1, :count) AS i
+        """,
+        values=dict(building_id=building.id, count=count),
+    )
+    await db.execute(
+        """
+        INSERT INTO unit_amenities (unit_id, amenity_id)
+        SELECT unit.id, amenity.id
+        FROM unit CROSS JOIN amenity
+        WHERE unit.building_id = :building_id AND amenity.id = ANY(:amenities)
+        """,
+        values=dict(building_id=building.id, amenities=amenities),
+    )
+    await db.execute("ANALYZE unit")
+    await db.execute("ANALYZE unit_amenities")
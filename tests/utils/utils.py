@@ -1,10 +1,14 @@
 import datetime
+import json
 import random
 import string
-from typing import Dict
+from typing import Any, Dict, List
 
+from databases import Database
 from fastapi.encoders import jsonable_encoder
 from httpx import AsyncClient
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql import Select
 
 from app.core.config import settings
 
@@ -53,3 +57,32 @@ async def get_superuser_token_headers(api_client: AsyncClient) -> Dict[str, str]
     access_token = tokens["access_token"]
     headers = {"Authorization": f"Bearer {access_token}"}
     return headers
+
+
+async def explain_query(db: Database, query: Select) -> Dict[str, Any]:
+    """
+    Plan chosen by Postgres for the query, as returned by EXPLAIN (FORMAT JSON).
+    """
+    compiled = query.compile(
+        dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+    )
+    plan = await db.fetch_val(f"EXPLAIN (FORMAT JSON) {compiled}")
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+def seq_scanned_relations(plan: Dict[str, Any]) -> List[str]:
+    relations = list()
+    if plan["Node Type"] == "Seq Scan":
+        relations.append(plan["Relation Name"])
+    for subplan in plan.get("Plans", []):
+        relations.extend(seq_scanned_relations(subplan))
+    return relations
+
+
+def plan_node_types(plan: Dict[str, Any]) -> List[str]:
+    node_types = [plan["Node Type"]]
+    for subplan in plan.get("Plans", []):
+        node_types.extend(plan_node_types(subplan))
+    return node_types